@@ -0,0 +1,98 @@
+"""
+Image analysis with the persistent description cache: a first pass over new
+photos, a resend of the same Telegram files, and a re-upload of the same images
+under new file ids. OpenAI and Telegram file storage are faked locally.
+
+Usage: python -m bench.analysis_cache [--photos 20]
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import time
+import types
+
+from .common import summarize
+from .fakes import FakeFileServer, FakeOpenAIServer
+
+
+def make_files(count: int) -> dict:
+    from PIL import Image
+
+    files = {}
+    for i in range(count):
+        output = io.BytesIO()
+        Image.effect_noise((1280, 960), 32 + i).convert("RGB").save(output, format="JPEG")
+        files[f"photo{i}.jpg"] = output.getvalue()
+    return files
+
+
+def make_context(file_url: str):
+    async def get_file(file_id):
+        return types.SimpleNamespace(file_path=f"{file_url}/{file_id}")
+
+    return types.SimpleNamespace(bot=types.SimpleNamespace(get_file=get_file))
+
+
+async def run(file_server, openai_server, photos: int):
+    from bot.handlers.analyze_image_handler import describe_photo
+    from bot.services.analysis_cache import analysis_cache
+    from bot.utils.database import db
+
+    context = make_context(f"{file_server.base_url}/file")
+
+    async def analyze(i: int, unique_prefix: str, latencies: list):
+        sizes = [
+            types.SimpleNamespace(
+                file_id=f"photo{i}.jpg",
+                file_unique_id=f"{unique_prefix}{i}",
+                width=1280,
+                height=960,
+            )
+        ]
+        started = time.perf_counter()
+        description = await describe_photo(context, sizes, "TOK")
+        latencies.append(time.perf_counter() - started)
+        assert description
+
+    for name, prefix in (("first upload", "a"), ("resend", "a"), ("re-upload", "b")):
+        openai_calls = openai_server.calls.get("chat.completions", 0)
+        downloads = sum(file_server.calls.values())
+        latencies = []
+        await asyncio.gather(*[analyze(i, prefix, latencies) for i in range(photos)])
+        latency = summarize(latencies)
+        print(
+            f"{name:>13}: p50 {latency['p50_ms']:7.1f} ms, "
+            f"{openai_server.calls.get('chat.completions', 0) - openai_calls:3d} vision calls, "
+            f"{sum(file_server.calls.values()) - downloads:3d} downloads"
+        )
+
+    stats = analysis_cache.stats()
+    print(
+        f"hit ratio {stats['hit_ratio']:.2f} "
+        f"(file {stats['file_hits']}, content {stats['content_hits']}, miss {stats['misses']}), "
+        f"saved ~{stats['saved_seconds']:.1f}s of analysis time"
+    )
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-analysis-"))
+    logging.disable(logging.CRITICAL)
+    with FakeFileServer(make_files(args.photos), latency=0.1) as file_server, FakeOpenAIServer(
+        latency=2.0
+    ) as openai_server:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        asyncio.run(run(file_server, openai_server, args.photos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Runs a 150-image /generate batch with faked OpenAI and Replicate calls that
+finish at random times, and counts how many edits the live progress message
+costs compared to the number of finished images reporting into it.
+
+Usage: python -m bench.batch_progress [--interval 3] [--spread 8]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+COMMAND = "/generate 50 styles=urban,cinematic,vintage"
+
+
+async def run(spread: float) -> tuple:
+    import replicate
+    from bot.utils.database import db
+    from bot.handlers.generate_handler import generate_handler
+    from bot.services.prompt_pool import prompt_pool
+    from .fakes import make_update
+
+    rng = random.Random(3)
+
+    counter = itertools.count()
+
+    async def fake_prompts(num_prompts, trigger_word, style="professional", **kwargs):
+        return [f"{trigger_word} {style} prompt {next(counter)}" for _ in range(num_prompts)]
+
+    async def fake_async_run(model_endpoint, input, **kwargs):
+        await asyncio.sleep(rng.uniform(0.1, spread))
+        if rng.random() < 0.05:
+            raise RuntimeError("fake prediction failure")
+        return [f"https://example.invalid/{input['seed']}.jpg"]
+
+    sys.modules["bot.services.openai_service"].generate_prompts = fake_prompts
+    replicate.async_run = fake_async_run
+
+    user_id = 1
+    await db.set_user_config(
+        user_id, {"trigger_word": "TOK", "model_endpoint": "owner/model:version"}
+    )
+    update = make_update(user_id, COMMAND)
+    started = time.perf_counter()
+    await generate_handler(update, types.SimpleNamespace(args=COMMAND.split()[1:]))
+    elapsed = time.perf_counter() - started
+
+    edits = [args[0] for method, args, _ in update.message.sent if method == "edit_text"]
+    await prompt_pool.close()
+    await db.close()
+    return edits, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interval", type=float, default=3.0)
+    parser.add_argument("--spread", type=float, default=8.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-progress-"))
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["PROGRESS_EDIT_INTERVAL"] = str(args.interval)
+    edits, elapsed = asyncio.run(run(args.spread))
+
+    budget = int(elapsed / args.interval) + 1
+    print(f"150 images in {elapsed:.1f}s: {len(edits)} progress edits (budget {budget})")
+    for text in edits[:2] + edits[-1:]:
+        print("  " + text.replace("\n", " | "))
+    assert 0 < len(edits) <= budget, "progress edits were not coalesced"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+One 50-prompt structured-output request versus parallel chunks streamed to
+the caller, against a fake OpenAI server whose latency grows with the number
+of prompts generated and which returns fewer prompts than asked for.
+
+Usage: python -m bench.chunked_prompts [--prompts 50] [--per-prompt 0.2] [--short 0.2]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from .fakes import FakeOpenAIServer
+
+
+async def run(num_prompts: int):
+    from bot.services.openai_service import generate_prompts, stream_prompts
+
+    started = time.perf_counter()
+    prompts = await generate_prompts(num_prompts, "TOK")
+    elapsed = time.perf_counter() - started
+    print(
+        f"  single call: {len(prompts)}/{num_prompts} prompts, "
+        f"first after {elapsed:.2f}s, all after {elapsed:.2f}s"
+    )
+
+    started = time.perf_counter()
+    first = None
+    prompts = []
+    async for chunk in stream_prompts(num_prompts, "TOK"):
+        first = first or time.perf_counter() - started
+        prompts.extend(chunk)
+    elapsed = time.perf_counter() - started
+    print(
+        f"      chunked: {len(prompts)}/{num_prompts} prompts ({len(set(prompts))} unique), "
+        f"first after {first:.2f}s, all after {elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--per-prompt", type=float, default=0.2)
+    parser.add_argument("--short", type=float, default=0.2)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-chunks-"))
+    logging.disable(logging.CRITICAL)
+    with FakeOpenAIServer(
+        latency=0.5, per_prompt_latency=args.per_prompt, short_ratio=args.short
+    ) as openai_server:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        asyncio.run(run(args.prompts))
+
+
+if __name__ == "__main__":
+    main()
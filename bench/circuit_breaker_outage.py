@@ -0,0 +1,109 @@
+"""
+Drives a sustained Replicate outage through the circuit breaker: once the
+breaker for the endpoint opens, image jobs and /generate commands must fail
+fast instead of waiting out timeouts and retries, and the circuit must close
+again after a successful half-open probe once the fake recovers.
+
+Usage: python -m bench.circuit_breaker_outage
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import types
+
+from .common import summarize
+from .fakes import FakeReplicateServer, make_update
+
+CONFIG = {"trigger_word": "TOK", "model_endpoint": "owner/model:version"}
+RESET_TIMEOUT = 1.0
+
+
+async def timed_job(user_id: int, latencies: list):
+    from bot.services.replicate_service import ReplicateService
+
+    started = time.perf_counter()
+    url, _ = await ReplicateService.generate_image(
+        "TOK prompt", user_id=user_id, config=CONFIG
+    )
+    latencies.append(time.perf_counter() - started)
+    return url
+
+
+async def run(replicate_server: FakeReplicateServer) -> bool:
+    from bot.services import retry
+    from bot.services.circuit_breaker import replicate_breaker
+    from bot.handlers.generate_handler import generate_handler
+    from bot.utils.database import db
+
+    retry.REPLICATE_RETRY_POLICY.base_delay = 0.05
+    retry.REPLICATE_RETRY_POLICY.max_delay = 0.2
+    breaker = replicate_breaker(CONFIG["model_endpoint"])
+    results = []
+
+    def check(name, ok, detail):
+        results.append(ok)
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+
+    # 1. Outage: every failed attempt counts, so the first job and its retries trip it
+    replicate_server.error_rate = 1.0
+    tripping = []
+    for user_id in range(breaker.failure_threshold):
+        await timed_job(user_id, tripping)
+    check("breaker opens", breaker.state == "open", str(breaker.snapshot()))
+
+    # 2. While open, jobs fail fast and never reach the upstream
+    requests_before = replicate_server.requests
+    rejected = []
+    await asyncio.gather(*[timed_job(u, rejected) for u in range(100)])
+    fast, slow = summarize(rejected), summarize(tripping)
+    check(
+        "jobs fail fast while open",
+        replicate_server.requests == requests_before and fast["p99_ms"] < slow["max_ms"],
+        f"p99 {fast['p99_ms']:.2f} ms vs {slow['max_ms']:.0f} ms for the job that tripped it, "
+        f"{replicate_server.requests - requests_before} upstream requests",
+    )
+
+    # 3. /generate answers with a notice instead of starting the batch
+    update = make_update(1, "/generate 5")
+    await db.set_user_config(1, dict(CONFIG))
+    started = time.perf_counter()
+    await generate_handler(update, types.SimpleNamespace(args=["5"]))
+    elapsed = (time.perf_counter() - started) * 1000
+    replies = [args[0] for method, args, _ in update.message.sent if args]
+    check(
+        "/generate rejected",
+        len(replies) == 1 and replies[0].startswith("⛔"),
+        f"{elapsed:.1f} ms, reply {replies!r}",
+    )
+
+    # 4. Recovery: after the reset timeout a probe succeeds and closes the circuit
+    replicate_server.error_rate = 0.0
+    await asyncio.sleep(RESET_TIMEOUT + 0.1)
+    url = await timed_job(1, [])
+    check(
+        "breaker closes after probe",
+        bool(url) and breaker.state == "closed",
+        str(breaker.snapshot()),
+    )
+
+    await db.close()
+    return all(results)
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="bench-breaker-"))
+    logging.disable(logging.CRITICAL)
+    with FakeReplicateServer(latency=0.05) as replicate_server:
+        os.environ["OPENAI_API_KEY"] = "fake"
+        os.environ["REPLICATE_BASE_URL"] = replicate_server.base_url
+        os.environ["REPLICATE_API_TOKEN"] = "fake"
+        os.environ["BREAKER_RESET_TIMEOUT"] = str(RESET_TIMEOUT)
+        ok = asyncio.run(run(replicate_server))
+    assert ok, "circuit breaker checks failed"
+
+
+if __name__ == "__main__":
+    main()
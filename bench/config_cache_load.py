@@ -0,0 +1,69 @@
+"""
+Latency of user config lookups from 1k concurrent users, with the in-memory
+config cache versus going to SQLite on every call (CONFIG_CACHE_SIZE=0).
+
+Usage: python -m bench.config_cache_load [--users 1000] [--lookups 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from .common import summarize
+
+
+async def user_session(db, user_id: int, lookups: int, cold: list, warm: list):
+    for i in range(lookups):
+        started = time.perf_counter()
+        config = await db.get_user_config(user_id, {})
+        # The first lookup of each user is a cache miss by construction
+        (warm if i else cold).append(time.perf_counter() - started)
+        # Callers mutate their copy, the cache must not see it
+        config["seed"] = -1
+        await asyncio.sleep(0)
+
+
+async def run(users: int, lookups: int):
+    from bot.utils.database import db
+
+    for user_id in range(users):
+        await db.set_user_config(
+            user_id, {"trigger_word": "TOK", "model_endpoint": "owner/model:version"}
+        )
+
+    for label, maxsize in (("sqlite_every_call", 0), ("lru_ttl_cache", 10_000)):
+        db.config_cache.maxsize = maxsize
+        db.config_cache.clear()
+        db.config_cache.hits = db.config_cache.misses = 0
+        reads_before = db.config_reads
+        cold, warm = [], []
+        await asyncio.gather(
+            *[user_session(db, u, lookups, cold, warm) for u in range(users)]
+        )
+        cold_stats, warm_stats = summarize(cold), summarize(warm)
+        print(
+            f"{label:<18} first lookup p99 {cold_stats['p99_ms']} ms | repeat lookups"
+            f" p50 {warm_stats['p50_ms']} ms p99 {warm_stats['p99_ms']} ms"
+            f" | db reads {db.config_reads - reads_before} | cache {db.config_cache.stats()}"
+        )
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-cache-"))
+    # The OpenAI client is built at import time and needs a key
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.users, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
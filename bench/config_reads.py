@@ -0,0 +1,74 @@
+"""
+Checks that one /generate command reads the user config from SQLite exactly
+once, no matter how many images it produces. OpenAI and Replicate are faked.
+
+Usage: python -m bench.config_reads
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import types
+
+COMMAND = "/generate 50 styles=urban,cinematic,vintage"
+
+
+async def run() -> int:
+    import replicate
+    from bot.utils.database import db
+    from bot.handlers.generate_handler import generate_handler
+    from bot.services.prompt_pool import prompt_pool
+
+    counter = itertools.count()
+
+    async def fake_prompts(num_prompts, trigger_word, style="professional", **kwargs):
+        return [f"{trigger_word} {style} prompt {next(counter)}" for _ in range(num_prompts)]
+
+    async def fake_async_run(model_endpoint, input, **kwargs):
+        return [f"https://example.invalid/{input['seed']}.jpg"]
+
+    async def fake_save_prediction(user_id, prompt, output_url, **kwargs):
+        return "fake-prediction"
+
+    sys.modules["bot.services.openai_service"].generate_prompts = fake_prompts
+    replicate.async_run = fake_async_run
+    db.save_prediction = fake_save_prediction
+
+    user_id = 1
+    await db.set_user_config(
+        user_id,
+        {"trigger_word": "TOK", "model_endpoint": "owner/model:version"},
+    )
+
+    from .fakes import make_update
+
+    # Start cold so the command goes through SQLite instead of the config cache
+    db.config_cache.clear()
+    reads_before = db.config_reads
+    update = make_update(user_id, COMMAND)
+    context = types.SimpleNamespace(args=COMMAND.split()[1:])
+    await generate_handler(update, context)
+    photos = sum(
+        len(kwargs["media"]) if method == "reply_media_group" else 1
+        for method, _, kwargs in update.message.sent
+        if method in ("reply_photo", "reply_media_group")
+    )
+    reads = db.config_reads - reads_before
+    print(f"{COMMAND!r}: {photos} images, {reads} config read(s)")
+    await prompt_pool.close()
+    await db.close()
+    return reads
+
+
+def main():
+    # Keep the throwaway database out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="bench-config-"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    reads = asyncio.run(run())
+    assert reads == 1, f"expected exactly one config read per command, got {reads}"
+
+
+if __name__ == "__main__":
+    main()
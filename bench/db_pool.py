@@ -0,0 +1,93 @@
+"""
+Ops/sec for user config reads and prediction inserts: one aiosqlite.connect
+per call (previous behaviour) versus the pooled Database connections and the
+write-behind prediction buffer.
+
+Usage: python -m bench.db_pool [--ops 10000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+import aiosqlite
+
+from .common import Stopwatch
+
+async def per_call_read(db_path, user_id):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            "SELECT config FROM user_configs WHERE user_id = ?", (user_id,)
+        )
+        result = await cursor.fetchone()
+        return json.loads(result[0])
+
+
+async def per_call_insert(db_path, user_id):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            "INSERT INTO predictions (prediction_id, user_id, prompt, output_url) VALUES (?, ?, ?, ?)",
+            (str(uuid.uuid4()), user_id, "prompt", "https://example.invalid/x.jpg"),
+        )
+        await conn.commit()
+
+
+async def run(ops: int) -> list:
+    from bot.utils.database import db
+
+    await db.set_user_config(1, {"trigger_word": "TOK", "model_endpoint": "a/b:c"})
+
+    async def per_call_reads():
+        for _ in range(ops):
+            await per_call_read(db.db_path, 1)
+
+    async def per_call_inserts():
+        for _ in range(ops):
+            await per_call_insert(db.db_path, 1)
+
+    async def pooled_reads():
+        for _ in range(ops):
+            await db.get_user_config(1, {})
+
+    async def pooled_inserts():
+        for _ in range(ops):
+            await db.save_prediction(1, "prompt", "https://example.invalid/x.jpg")
+        await db.prediction_writer.flush()
+
+    results = []
+    for name, scenario in [
+        ("per_call_config_reads", per_call_reads),
+        ("pooled_config_reads", pooled_reads),
+        ("per_call_prediction_inserts", per_call_inserts),
+        ("pooled_prediction_inserts", pooled_inserts),
+    ]:
+        with Stopwatch() as sw:
+            await scenario()
+        results.append(
+            {"scenario": name, "ops": ops, "ops_per_sec": round(ops / sw.elapsed)}
+        )
+    await db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=10000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-db-"))
+    # The OpenAI client is built at import time and needs a key
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    logging.disable(logging.INFO)
+    for row in asyncio.run(run(args.ops)):
+        print(f"{row['scenario']:<30} {row['ops_per_sec']:>8} ops/s")
+
+
+if __name__ == "__main__":
+    main()
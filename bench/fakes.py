@@ -0,0 +1,503 @@
+"""
+Local stand-ins for the external APIs used by the bot, for offline benchmarks.
+Each server runs its own event loop in a background thread so that blocking
+client code under test cannot stall the fake server.
+"""
+
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+import time
+import types
+
+from aiohttp import web
+
+
+class FakeMessage:
+    """
+    In-process stand-in for telegram.Message that records every outbound call
+    instead of talking to the Bot API.
+    """
+
+    def __init__(self, text: str = "", chat_id: int = 1, sent: list = None):
+        self.text = text
+        self.chat_id = chat_id
+        self.sent = sent if sent is not None else []
+        self.message_id = len(self.sent) + 1
+
+    async def _record(self, method: str, *args, **kwargs):
+        self.sent.append((method, args, kwargs))
+        return FakeMessage(chat_id=self.chat_id, sent=self.sent)
+
+    async def reply_text(self, *args, **kwargs):
+        return await self._record("reply_text", *args, **kwargs)
+
+    async def reply_photo(self, *args, **kwargs):
+        return await self._record("reply_photo", *args, **kwargs)
+
+    async def reply_media_group(self, *args, **kwargs):
+        return await self._record("reply_media_group", *args, **kwargs)
+
+    async def edit_text(self, *args, **kwargs):
+        return await self._record("edit_text", *args, **kwargs)
+
+    async def delete(self):
+        return await self._record("delete")
+
+
+async def make_bot_message(base_url: str, chat_id: int):
+    """A real telegram.Bot and Message bound to it, talking to a FakeBotAPIServer"""
+    import datetime
+
+    from telegram import Bot, Chat, Message
+
+    bot = Bot("123:fake", base_url=f"{base_url}/bot")
+    await bot.initialize()
+    message = Message(
+        message_id=1,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=Chat(id=chat_id, type="private"),
+    )
+    message.set_bot(bot)
+    return bot, message
+
+
+def make_update(user_id: int, text: str) -> types.SimpleNamespace:
+    """Builds the subset of telegram.Update the handlers read"""
+    message = FakeMessage(text=text, chat_id=user_id)
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=user_id, username=f"user{user_id}"),
+        effective_chat=types.SimpleNamespace(id=user_id, type="private"),
+        message=message,
+        effective_message=message,
+    )
+
+
+class FakeServer:
+    """
+    Runs an aiohttp application on 127.0.0.1 in a background thread.
+    Faults can be injected either as an explicit sequence of HTTP statuses
+    returned by the next requests (`inject`) or as a random `error_rate`.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = {}
+        self.requests = 0
+        self.faults = collections.deque()
+        self.base_url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    def count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def inject(self, *statuses: int):
+        """Answer the next len(statuses) requests with these error statuses"""
+        self.faults.extend(statuses)
+
+    @web.middleware
+    async def fault_middleware(self, request: web.Request, handler):
+        self.requests += 1
+        status = None
+        if self.faults:
+            status = self.faults.popleft()
+        elif self.error_rate and random.random() < self.error_rate:
+            status = 503
+        if status is not None:
+            self.count(f"fault_{status}")
+            return web.json_response(
+                {"error": {"message": f"injected {status}"}, "detail": f"injected {status}"},
+                status=status,
+                headers={"Retry-After": "0"} if status == 429 else None,
+            )
+        return await handler(request)
+
+    def make_app(self) -> web.Application:
+        return web.Application(
+            client_max_size=64 * 1024 * 1024, middlewares=[self.fault_middleware]
+        )
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.base_url
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.build_app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if not self._loop:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeOpenAIServer(FakeServer):
+    """
+    Minimal /v1/chat/completions endpoint. Structured-output requests get a
+    {"prompts": [...]} body sized from the "generating N prompts" instruction.
+    Requests with "stream": true get the same content as server-sent
+    chat.completion.chunk events, `token_chars` characters at a time.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        prompt_length: int = 500,
+        error_rate: float = 0.0,
+        per_prompt_latency: float = 0.0,
+        short_ratio: float = 0.0,
+        token_chars: int = 4,
+    ):
+        super().__init__(latency, error_rate)
+        self.token_chars = token_chars
+        self.prompt_length = prompt_length
+        # Decoding time per generated prompt, so big requests are slower
+        self.per_prompt_latency = per_prompt_latency
+        # Fraction of the requested prompts left out, like a model stopping early
+        self.short_ratio = short_ratio
+
+    def build_app(self) -> web.Application:
+        app = self.make_app()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    def make_prompts(self, count: int, trigger_word: str = "TOK") -> list:
+        # Numbered across calls, like a model that never repeats itself
+        self.prompts_made = getattr(self, "prompts_made", 0) + count
+        first = self.prompts_made - count
+        filler = "x" * max(0, self.prompt_length - len(trigger_word) - 16)
+        return [f"{trigger_word} prompt {i:06d} {filler}" for i in range(first, first + count)]
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.count("chat.completions")
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+
+        if body.get("response_format", {}).get("type") == "json_schema":
+            user_text = " ".join(
+                m["content"] for m in body["messages"] if isinstance(m["content"], str)
+            )
+            match = re.search(r"generating (\d+) prompts", user_text)
+            count = int(match.group(1)) if match else 1
+            count -= int(count * self.short_ratio)
+            content = json.dumps({"prompts": self.make_prompts(count)})
+            if body.get("stream"):
+                return await self.stream_content(
+                    request, body, content, self.per_prompt_latency * count
+                )
+            await asyncio.sleep(self.per_prompt_latency * count)
+        else:
+            content = "A detailed description of the image. " * 10
+
+        return web.json_response(
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": content,
+                            "refusal": None,
+                        },
+                        "finish_reason": "stop",
+                        "logprobs": None,
+                    }
+                ],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+        )
+
+    async def stream_content(
+        self, request: web.Request, body: dict, content: str, duration: float
+    ) -> web.StreamResponse:
+        """Sends `content` as SSE deltas spread evenly over `duration` seconds"""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def event(delta: dict, finish_reason=None) -> bytes:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        tokens = [
+            content[i : i + self.token_chars]
+            for i in range(0, len(content), self.token_chars)
+        ]
+        started = time.perf_counter()
+        await response.write(event({"role": "assistant", "content": ""}))
+        for i, token in enumerate(tokens):
+            # Pace against the clock so per-token sleep overhead doesn't add up
+            delay = started + duration * (i + 1) / len(tokens) - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await response.write(event({"content": token}))
+        await response.write(event({}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeReplicateServer(FakeServer):
+    """
+    Minimal Replicate predictions API: predictions complete synchronously (as
+    with the "Prefer: wait" header) after `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 1.0, error_rate: float = 0.0):
+        super().__init__(latency, error_rate)
+
+    def build_app(self) -> web.Application:
+        app = self.make_app()
+        app.router.add_post("/v1/predictions", self.create_prediction)
+        app.router.add_post(
+            "/v1/models/{owner}/{name}/predictions", self.create_prediction
+        )
+        app.router.add_get(
+            "/v1/models/{owner}/{name}/versions/{version}", self.get_version
+        )
+        return app
+
+    async def create_prediction(self, request: web.Request) -> web.Response:
+        self.count("predictions.create")
+        # Taken before the sleep, concurrent predictions must not share an ID
+        prediction_id = f"fake{self.calls['predictions.create']}"
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        return web.json_response(
+            {
+                "id": prediction_id,
+                "model": "owner/model",
+                "version": body.get("version", "fake"),
+                "status": "succeeded",
+                "input": body.get("input", {}),
+                "output": [f"https://replicate.delivery/fake/{prediction_id}.jpg"],
+                "logs": "",
+                "error": None,
+                "metrics": {"predict_time": self.latency},
+                "created_at": "2024-01-01T00:00:00Z",
+                "started_at": "2024-01-01T00:00:00Z",
+                "completed_at": "2024-01-01T00:00:01Z",
+                "urls": {},
+            },
+            status=201,
+        )
+
+    async def get_version(self, request: web.Request) -> web.Response:
+        self.count("versions.get")
+        return web.json_response(
+            {
+                "id": request.match_info["version"],
+                "created_at": "2024-01-01T00:00:00Z",
+                "cog_version": "0.9.0",
+                "openapi_schema": {},
+            }
+        )
+
+
+class FakeBotAPIServer(FakeServer):
+    """
+    Minimal Telegram Bot API. Every chat has a token bucket of `chat_burst`
+    calls refilled at `chat_rate` per second, approximating Telegram's flood
+    control; calls beyond it get a 429 with retry_after, like the real API.
+    getFile and /file/bot<token>/<path> serve `photo` for every file, with
+    the file_id appended so each download has distinct content. The times of
+    the editMessageText calls each chat got are kept in `edits`. Markdown
+    text or captions with an unclosed code span are rejected with a 400, as
+    Telegram does with entities it can't parse.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        chat_rate: float = 1.0,
+        chat_burst: int = 10,
+        error_rate: float = 0.0,
+        photo: bytes = b"",
+    ):
+        super().__init__(latency, error_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.photo = photo
+        self.buckets = {}
+        self.photos_delivered = 0
+        self.flood_errors = 0
+        self.message_id = 0
+        self.edits = {}
+
+    def build_app(self) -> web.Application:
+        app = self.make_app()
+        app.router.add_post("/bot{token}/{method}", self.api_call)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download_file)
+        return app
+
+    async def download_file(self, request: web.Request) -> web.Response:
+        self.count("file.download")
+        await asyncio.sleep(self.latency)
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        # Bytes after the JPEG end marker are ignored by decoders
+        return web.Response(body=self.photo + file_id.encode(), content_type="image/jpeg")
+
+    def take_token(self, chat_id) -> float:
+        """Spend one call from the chat's bucket, returns seconds to wait if empty"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        if tokens < 1:
+            self.buckets[chat_id] = (tokens, now)
+            return (1 - tokens) / self.chat_rate
+        self.buckets[chat_id] = (tokens - 1, now)
+        return 0.0
+
+    def make_message(self, chat_id, **extra) -> dict:
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **extra,
+        }
+
+    async def api_call(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.count(method)
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return web.json_response(
+                {
+                    "ok": True,
+                    "result": {
+                        "id": 1,
+                        "is_bot": True,
+                        "first_name": "Fake",
+                        "username": "fake_bot",
+                    },
+                }
+            )
+
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            return web.json_response(
+                {
+                    "ok": True,
+                    "result": {
+                        "file_id": file_id,
+                        "file_unique_id": f"u{file_id}",
+                        "file_size": len(self.photo),
+                        "file_path": f"photos/{file_id}",
+                    },
+                }
+            )
+
+        chat_id = params.get("chat_id", 0)
+        wait = self.take_token(chat_id)
+        if wait:
+            self.flood_errors += 1
+            retry_after = max(1, int(wait + 0.999))
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+                status=429,
+            )
+
+        media = params.get("media", "[]")
+        media = json.loads(media) if isinstance(media, str) else media
+        for entity in [params] + (media if method == "sendMediaGroup" else []):
+            text = entity.get("text") or entity.get("caption") or ""
+            if entity.get("parse_mode") == "Markdown" and text.count("`") % 2:
+                self.count("parse_errors")
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 400,
+                        "description": "Bad Request: can't parse entities",
+                    },
+                    status=400,
+                )
+
+        photo = [{"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}]
+        if method == "sendMediaGroup":
+            self.photos_delivered += len(media)
+            result = [self.make_message(chat_id, photo=photo) for _ in media]
+        elif method == "sendPhoto":
+            self.photos_delivered += 1
+            result = self.make_message(chat_id, photo=photo)
+        elif method == "editMessageText":
+            self.edits.setdefault(chat_id, []).append(time.monotonic())
+            result = self.make_message(chat_id, text=params.get("text", ""))
+        elif method in ("deleteMessage", "setMyCommands"):
+            result = True
+        else:
+            result = self.make_message(chat_id, text=params.get("text", ""))
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeFileServer(FakeServer):
+    """Serves in-memory files under /file/{name}, like Telegram's file storage"""
+
+    def __init__(self, files: dict, latency: float = 0.0):
+        super().__init__(latency)
+        self.files = files
+        self.bytes_served = 0
+
+    def build_app(self) -> web.Application:
+        app = self.make_app()
+        app.router.add_get("/file/{name}", self.get_file)
+        return app
+
+    async def get_file(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        self.count(name)
+        await asyncio.sleep(self.latency)
+        if name not in self.files:
+            return web.Response(status=404)
+        self.bytes_served += len(self.files[name])
+        return web.Response(body=self.files[name], content_type="image/jpeg")
@@ -0,0 +1,109 @@
+"""
+Paginated history lookups as the predictions table grows to 1M rows. With the
+(user_id, created_at) index and keyset pagination the per-page cost should stay
+roughly flat (O(log n)) instead of growing with the table.
+
+Usage: python -m bench.history_lookup [--rows 1000000] [--users 1000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from .common import Stopwatch, summarize
+
+CHECKPOINTS = (10_000, 100_000, 1_000_000)
+
+
+def bulk_load(db_path, start: int, stop: int, users: int):
+    """Insert synthetic predictions with increasing timestamps"""
+    from bot.utils.database import INSERT_PREDICTION_SQL
+
+    base = time.time() - stop
+    rows = (
+        (
+            f"pred-{i}",
+            i % users,
+            "TOK synthetic prompt",
+            "https://example.invalid/x.jpg",
+            None,
+            "professional",
+            i,
+            1000,
+            "succeeded",
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(base + i)) + f".{i % 10**6:06d}",
+        )
+        for i in range(start, stop)
+    )
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(INSERT_PREDICTION_SQL, rows)
+
+
+async def measure_pages(db, users: int, samples: int = 200, depth: int = 5) -> dict:
+    """Time the first page and `depth` follow-up pages for random users"""
+    first, deep = [], []
+    for _ in range(samples):
+        user_id = random.randrange(users)
+        with Stopwatch() as sw:
+            history, cursor = await db.get_prediction_history(user_id, limit=20)
+        first.append(sw.elapsed)
+        for _ in range(depth):
+            if not cursor:
+                break
+            with Stopwatch() as sw:
+                history, cursor = await db.get_prediction_history(
+                    user_id, limit=20, cursor=cursor
+                )
+            deep.append(sw.elapsed)
+    return {"first_page": summarize(first), "next_pages": summarize(deep)}
+
+
+def query_plan(db_path) -> str:
+    from bot.utils.database import SELECT_HISTORY_SQL
+
+    with sqlite3.connect(db_path) as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN " + SELECT_HISTORY_SQL, (1, "9", "9", 1, 20)
+        ).fetchall()
+    return "; ".join(row[-1] for row in plan)
+
+
+async def run(total_rows: int, users: int):
+    from bot.utils.database import db
+
+    print(f"plan: {query_plan(db.db_path)}")
+    loaded = 0
+    for checkpoint in CHECKPOINTS:
+        if checkpoint > total_rows:
+            break
+        bulk_load(db.db_path, loaded, checkpoint, users)
+        loaded = checkpoint
+        result = await measure_pages(db, users)
+        print(
+            f"{checkpoint:>9} rows  first page p50 {result['first_page']['p50_ms']} ms"
+            f" p99 {result['first_page']['p99_ms']} ms | next pages p50"
+            f" {result['next_pages']['p50_ms']} ms p99 {result['next_pages']['p99_ms']} ms"
+        )
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-history-"))
+    # The OpenAI client is built at import time and needs a key
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.rows, args.users))
+
+
+if __name__ == "__main__":
+    main()
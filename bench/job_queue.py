@@ -0,0 +1,215 @@
+"""
+Queued generation with the SQLite backend and real worker processes
+(python -m bot.worker), against fake Replicate and Bot API servers.
+
+Runs the same batches through one worker, through several, and through
+several again killing one of them with SIGKILL mid-run: its leased jobs must be picked up by the
+others once the lease expires, and every batch must still finish, removing
+its status message and its job_batches row. The
+workers take turns editing each batch's status message, so its edits must be
+at least PROGRESS_EDIT_INTERVAL apart however many workers report on it.
+
+Usage: python -m bench.job_queue [--workers 3] [--batches 3] [--images 20]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .fakes import FakeBotAPIServer, FakeReplicateServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LEASE_SECONDS = 3
+# Status message edit interval, which must hold across all workers
+PROGRESS_INTERVAL = 1.0
+
+
+def start_workers(count: int) -> list:
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(REPO_ROOT),
+        LOG_LEVEL="INFO",
+        JOB_LEASE_SECONDS=str(LEASE_SECONDS),
+        JOB_RETRY_DELAY="0.5",
+        WORKER_POLL_INTERVAL="0.2",
+        WORKER_CONCURRENCY="8",
+        PROGRESS_EDIT_INTERVAL=str(PROGRESS_INTERVAL),
+    )
+    workers = []
+    for i in range(count):
+        with open(f"worker-{i}.log", "w") as log:
+            workers.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "bot.worker"],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=log,
+                )
+            )
+    return workers
+
+
+async def wait_started(count: int, timeout: float = 60):
+    """Wait until every worker logged its startup, so timings exclude imports"""
+    async with asyncio.timeout(timeout):
+        for i in range(count):
+            while " started (" not in Path(f"worker-{i}.log").read_text():
+                await asyncio.sleep(0.1)
+
+
+def stop_workers(workers: list):
+    for worker in workers:
+        if worker.poll() is None:
+            worker.send_signal(signal.SIGTERM)
+    for worker in workers:
+        worker.wait(timeout=30)
+
+
+async def enqueue(queue, batches: int, images: int, offset: int) -> list:
+    from bot.services.job_queue import GENERATE_IMAGE, new_batch_id
+
+    batch_ids = []
+    for user_id in range(offset, offset + batches):
+        batch_id = new_batch_id()
+        await queue.create_batch(batch_id, images)
+        payload = {
+            "user_id": user_id,
+            "chat_id": user_id,
+            "chat_type": "private",
+            "message_id": 1,
+            "status_message_id": 2,
+            "config": {"trigger_word": "TOK", "model_endpoint": "owner/model:version"},
+            "style": "urban",
+        }
+        await queue.enqueue_many(
+            GENERATE_IMAGE,
+            [dict(payload, prompt=f"TOK prompt {i}") for i in range(images)],
+            batch_id,
+        )
+        batch_ids.append(batch_id)
+    return batch_ids
+
+
+async def wait_finished(queue, bot_api, batches: int, failed_before: int, timeout: float = 120):
+    """
+    Wait until the queue is drained and every batch was closed, i.e. its
+    status message deleted; returns the number of jobs that failed meanwhile.
+    """
+    async with asyncio.timeout(timeout):
+        while True:
+            stats = await queue.stats()
+            closed = bot_api.calls.get("deleteMessage", 0)
+            if closed >= batches and stats["queued"] + stats["running"] == 0:
+                return stats["failed"] - failed_before
+            await asyncio.sleep(0.1)
+
+
+async def batches_left(queue, batch_ids: list) -> int:
+    """Batch rows still in the database, finished batches must be removed"""
+    async with queue.db.pool.acquire() as conn:
+        async with conn.execute(
+            "SELECT COUNT(*) FROM job_batches WHERE batch_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(batch_ids),),
+        ) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def scenario(
+    queue, bot_api, workers: int, batches: int, images: int, kill: bool, offset: int
+):
+    bot_api.photos_delivered = 0
+    bot_api.edits.clear()
+    bot_api.calls.clear()
+    failed_before = (await queue.stats())["failed"]
+    processes = start_workers(workers)
+    try:
+        await wait_started(workers)
+        started = time.perf_counter()
+        batch_ids = await enqueue(queue, batches, images, offset)
+        if kill:
+            await asyncio.sleep(1.5)
+            processes[0].send_signal(signal.SIGKILL)
+        failed = await wait_finished(queue, bot_api, batches, failed_before)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_workers(processes)
+    total = batches * images
+    ok = total - failed
+    left = await batches_left(queue, batch_ids)
+    stats = await queue.stats()
+    edits = sum(len(times) for times in bot_api.edits.values())
+    gap = min(
+        (b - a for times in bot_api.edits.values() for a, b in zip(times, times[1:])),
+        default=None,
+    )
+    label = f"{workers} worker(s){', one killed' if kill else ''}"
+    print(
+        f"  {label}: {ok}/{total} ok, {failed} failed, "
+        f"{bot_api.photos_delivered} photos delivered in {elapsed:.2f}s, queue {stats}, "
+        f"{edits} status edits"
+        + (f" (closest {gap:.2f}s apart)" if gap is not None else "")
+        + f", {left} batch rows left"
+    )
+    # Some slack for the edit's own request latency
+    paced = gap is None or gap >= PROGRESS_INTERVAL * 0.8
+    return ok == total and bot_api.photos_delivered >= total and paced and not left
+
+
+async def run(bot_api, workers: int, batches: int, images: int) -> bool:
+    from bot.services.job_queue import SQLiteJobQueue
+    from bot.utils.database import db
+
+    queue = SQLiteJobQueue()
+    try:
+        results = [
+            await scenario(queue, bot_api, 1, batches, images, False, 1000),
+            await scenario(queue, bot_api, workers, batches, images, False, 2000),
+            await scenario(queue, bot_api, workers, batches, images, True, 3000),
+        ]
+    finally:
+        await db.close()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--batches", type=int, default=3)
+    parser.add_argument("--images", type=int, default=20)
+    args = parser.parse_args()
+
+    # Workers share the database in this directory
+    os.chdir(tempfile.mkdtemp(prefix="bench-jobs-"))
+    logging.disable(logging.CRITICAL)
+    with FakeReplicateServer(latency=1.0) as replicate_server, FakeBotAPIServer(
+        latency=0.01, chat_rate=1000, chat_burst=1000
+    ) as bot_api:
+        os.environ.update(
+            REPLICATE_BASE_URL=replicate_server.base_url,
+            REPLICATE_API_TOKEN="fake",
+            TELEGRAM_BASE_URL=bot_api.base_url,
+            BOT_TOKEN="123:fake",
+            OPENAI_API_KEY="fake",
+            JOB_QUEUE_BACKEND="sqlite",
+            TELEGRAM_GLOBAL_RATE="1000",
+            TELEGRAM_CHAT_RATE="100",
+            TELEGRAM_CHAT_BURST="100",
+            MEDIA_GROUP_FLUSH_DELAY="0.5",
+        )
+        ok = asyncio.run(run(bot_api, args.workers, args.batches, args.images))
+    assert ok, (
+        "every queued image should be generated and delivered and every batch "
+        "closed, with status edits no closer than PROGRESS_EDIT_INTERVAL"
+    )
+
+
+if __name__ == "__main__":
+    main()
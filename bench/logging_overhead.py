@@ -0,0 +1,192 @@
+"""
+Event-loop time spent in logging while a 50-image batch runs through
+ReplicateService.generate_image, with the logging setup from before this
+change versus the queue-based one.
+
+"before" replays the per-image lines generate_image used to log at INFO
+(the full prompt twice plus json.dumps(input_params, indent=2)) through
+synchronous file and console handlers (LOG_ASYNC=0). The "after" modes
+log what the code logs now, through the QueueHandler, in text and JSON.
+Replicate is faked in-process; the history insert goes to SQLite.
+
+Reported per mode: wall time spent inside Logger.handle on the loop
+thread, loop-thread CPU time over a run with logging disabled, and the
+worst event-loop lag seen during the batch.
+
+Usage: python -m bench.logging_overhead [--images 50] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .common import LoopLagProbe
+
+PROMPT = (
+    "TOK, a confident man in a tailored charcoal suit standing on a rooftop terrace at "
+    "golden hour, city skyline softly blurred behind him, warm rim light outlining his "
+    "shoulders, gazing thoughtfully toward the distant horizon, hands resting on a glass "
+    "railing, shallow depth of field, 85mm lens, subtle film grain, natural skin texture, "
+    "editorial photography, high detail, photorealistic, cinematic color grading with "
+    "teal shadows and amber highlights, crisp fabric texture, elegant and modern mood"
+)
+
+MODES = {
+    "no logging": {"LOG_LEVEL": "CRITICAL", "LOG_ASYNC": "0"},
+    "before: sync handlers, payloads at INFO": {"LOG_ASYNC": "0", "LOG_FORMAT": "text"},
+    "after: queue handler, text": {"LOG_ASYNC": "1", "LOG_FORMAT": "text"},
+    "after: queue handler, json": {"LOG_ASYNC": "1", "LOG_FORMAT": "json"},
+}
+
+
+class HandleTimer:
+    """Accumulates wall time spent in Logger.handle on the calling (loop) thread"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.records = 0
+        self.thread = threading.main_thread()
+        self.original = logging.Logger.handle
+        timer = self
+
+        def handle(logger, record):
+            if threading.current_thread() is not timer.thread:
+                return timer.original(logger, record)
+            started = time.perf_counter()
+            try:
+                return timer.original(logger, record)
+            finally:
+                timer.seconds += time.perf_counter() - started
+                timer.records += 1
+
+        logging.Logger.handle = handle
+
+    def reset(self):
+        self.seconds = 0.0
+        self.records = 0
+
+
+def legacy_generate_image(generate_image):
+    """generate_image preceded by the eager INFO lines it used to log"""
+
+    async def wrapper(prompt, **kwargs):
+        logging.info(f"Full prompt length: {len(prompt)} characters")
+        logging.info(f"Full prompt content: {prompt}")
+        input_params = dict(kwargs["config"], seed=123456, prompt=prompt)
+        logging.info(
+            f"Sending to Replicate - Prompt length: {len(input_params['prompt'])} characters"
+        )
+        logging.info(
+            f"Sending to Replicate - Full parameters: {json.dumps(input_params, indent=2)}"
+        )
+        return await generate_image(prompt, **kwargs)
+
+    return wrapper
+
+
+async def run_batch(generate, images: int, config: dict):
+    await asyncio.gather(
+        *(
+            generate(
+                f"{PROMPT} #{i}",
+                user_id=1,
+                operation_type="batch",
+                config=config,
+                style="professional",
+            )
+            for i in range(images)
+        )
+    )
+
+
+async def measure(mode: str, images: int, rounds: int, timer: HandleTimer) -> dict:
+    from bot.services.replicate_service import ReplicateService
+    from bot.utils.logging_config import setup_logging, stop_logging
+
+    os.environ.update({"LOG_LEVEL": "INFO"}, **MODES[mode])
+    setup_logging()
+    generate = ReplicateService.generate_image
+    if mode.startswith("before"):
+        generate = legacy_generate_image(generate)
+    config = dict(
+        ReplicateService.default_params,
+        trigger_word="TOK",
+        model_endpoint="owner/model:version",
+    )
+
+    probe = LoopLagProbe(interval=0.005)
+    probe.start()
+    timer.reset()
+    cpu_started = time.thread_time()
+    for _ in range(rounds):
+        await run_batch(generate, images, config)
+    cpu = time.thread_time() - cpu_started
+    await probe.stop()
+    stop_logging()
+    return {
+        "handle": timer.seconds / rounds,
+        "records": timer.records / rounds,
+        "cpu": cpu / rounds,
+        "max_lag_ms": probe.summary()["max_ms"],
+    }
+
+
+async def run(images: int, rounds: int):
+    import replicate
+    from bot.services.prompt_pool import prompt_pool
+    from bot.utils.database import db
+
+    counter = itertools.count()
+
+    async def fake_async_run(model_endpoint, input, **kwargs):
+        await asyncio.sleep(0.05)
+        # Unique URL per image, the history is keyed by it
+        return [f"https://example.invalid/{next(counter)}.jpg"]
+
+    replicate.async_run = fake_async_run
+    timer = HandleTimer()
+    # Warm up imports, the connection pool and the prediction writer
+    await measure("no logging", images, 1, timer)
+
+    results = {mode: await measure(mode, images, rounds, timer) for mode in MODES}
+    baseline = results["no logging"]["cpu"]
+    print(f"{images}-image batch, average of {rounds} rounds (loop thread):", file=sys.__stdout__)
+    for mode, result in results.items():
+        print(
+            f"  {mode:<42} {result['records']:5.0f} records, "
+            f"{result['handle'] * 1000:7.2f}ms in Logger.handle, "
+            f"+{(result['cpu'] - baseline) * 1000:7.2f}ms CPU vs no logging, "
+            f"max lag {result['max_lag_ms']:6.2f}ms",
+            file=sys.__stdout__,
+        )
+
+    await prompt_pool.close()
+    await db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-logging-"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    # The console handler writes here instead of the terminal
+    sys.stderr = open("console.log", "w", encoding="utf-8")
+    results = asyncio.run(run(args.images, args.rounds))
+    before = results["before: sync handlers, payloads at INFO"]["handle"]
+    after = results["after: queue handler, text"]["handle"]
+    assert after < before, "the queue handler should keep log I/O off the event loop"
+
+
+if __name__ == "__main__":
+    main()
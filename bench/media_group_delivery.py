@@ -0,0 +1,93 @@
+"""
+Compares delivering 50 finished images one photo plus one prompt message at a
+time against the album batcher, through a real telegram.Bot pointed at a local
+fake Bot API server that enforces a per-chat flood limit. Sends go through the
+outbound rate limiter, so per-image delivery is paced rather than dropped; the
+per-chat rate is scaled up (--chat-rate, Telegram's is about 1/s) to keep the
+run short. Some prompts contain backticks, which must not break the Markdown
+captions: every image has to be delivered.
+
+Usage: python -m bench.media_group_delivery [--images 50] [--spread 4] [--chat-rate 5]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from .fakes import FakeBotAPIServer, make_bot_message
+
+CHAT_ID = 42
+
+
+async def deliver(
+    strategy: str, server: FakeBotAPIServer, images: int, spread: float, chat_rate: float
+):
+    from bot.utils import rate_limiter
+    from bot.utils.message_utils import MediaGroupBatcher, format_generation_message
+
+    rate_limiter.outbound_limiter = rate_limiter.OutboundLimiter(chat_rate=chat_rate)
+
+    server.calls.clear()
+    server.buckets.clear()
+    server.photos_delivered = server.flood_errors = 0
+
+    bot, message = await make_bot_message(server.base_url, CHAT_ID)
+    server.calls.clear()
+    batcher = MediaGroupBatcher(message)
+
+    # Images finish at random points of the batch, like concurrent Replicate jobs
+    rng = random.Random(7)
+    arrivals = sorted(rng.uniform(0, spread) for _ in range(images))
+    started = time.perf_counter()
+
+    async def image_ready(i: int, at: float):
+        await asyncio.sleep(at)
+        url = f"https://replicate.delivery/fake/{i}.jpg"
+        prompt = f"TOK prompt {i} " + "detail " * 60
+        if i % 7 == 0:
+            prompt += "with a `backtick and snake_case"
+        try:
+            if strategy == "per-image":
+                await format_generation_message(prompt, message, url)
+            else:
+                await batcher.add(url, prompt)
+        except Exception as e:
+            logging.debug(f"delivery failed: {e}")
+
+    await asyncio.gather(*[image_ready(i, at) for i, at in enumerate(arrivals)])
+    await batcher.close()
+    wall = time.perf_counter() - started
+    await bot.shutdown()
+
+    api_calls = sum(server.calls.values())
+    print(
+        f"{strategy:>12}: {api_calls:3d} API calls, {server.flood_errors:3d} flood 429s, "
+        f"{server.photos_delivered:3d}/{images} photos delivered, {wall:.2f}s wall"
+    )
+    return api_calls, server.photos_delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=4.0)
+    parser.add_argument("--chat-rate", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-media-"))
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    with FakeBotAPIServer(latency=0.05, chat_rate=args.chat_rate) as server:
+        for strategy in ("per-image", "media-group"):
+            _, delivered = asyncio.run(
+                deliver(strategy, server, args.images, args.spread, args.chat_rate)
+            )
+            assert delivered == args.images, f"{strategy}: images were lost"
+
+
+if __name__ == "__main__":
+    main()
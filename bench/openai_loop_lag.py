@@ -0,0 +1,97 @@
+"""
+Event-loop lag while 20 concurrent /generate prompt requests and photo
+analyses are in flight against a local fake OpenAI server.
+
+Usage: python -m bench.openai_loop_lag [--latency 0.5] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+from .common import LoopLagProbe, Stopwatch
+from .fakes import FakeOpenAIServer
+
+VISION_MESSAGES = [
+    {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": "Describe this image"},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}},
+        ],
+    }
+]
+
+
+async def run_async_client(concurrency: int):
+    from bot.services.openai_service import chat_completion, generate_prompts
+
+    jobs = []
+    for i in range(concurrency):
+        if i % 2:
+            jobs.append(chat_completion(VISION_MESSAGES, temperature=1, max_tokens=8192))
+        else:
+            jobs.append(generate_prompts(5, "TOK", style="professional"))
+    return await asyncio.gather(*jobs)
+
+
+async def run_sync_client(concurrency: int):
+    """Previous behaviour: blocking OpenAI client called from coroutines"""
+    from openai import OpenAI
+    from bot.services.openai_service import PromptResponse
+
+    sync_client = OpenAI()
+
+    async def prompts():
+        return sync_client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": "Begin by generating 5 prompts"}],
+            response_format=PromptResponse,
+        )
+
+    async def vision():
+        return sync_client.chat.completions.create(
+            model="gpt-4o", messages=VISION_MESSAGES
+        )
+
+    return await asyncio.gather(
+        *[vision() if i % 2 else prompts() for i in range(concurrency)]
+    )
+
+
+async def measure(mode: str, concurrency: int) -> dict:
+    import bot.services.openai_service  # noqa: F401 - keep import cost out of the probe
+
+    probe = LoopLagProbe()
+    probe.start()
+    with Stopwatch() as sw:
+        if mode == "async":
+            await run_async_client(concurrency)
+        else:
+            await run_sync_client(concurrency)
+    # Let the probe wake up once more so a stall at the very end is recorded
+    await asyncio.sleep(probe.interval * 2)
+    await probe.stop()
+    return {"mode": mode, "wall_s": round(sw.elapsed, 3), "loop_lag": probe.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        # The shared client reads these when openai_service is first imported
+        os.environ["OPENAI_BASE_URL"] = f"{server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        results = [
+            asyncio.run(measure("sync", args.concurrency)),
+            asyncio.run(measure("async", args.concurrency)),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
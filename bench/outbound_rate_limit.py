@@ -0,0 +1,141 @@
+"""
+Exercises the outbound rate limiter against a local fake Bot API server that
+answers flood-limit violations with 429 retry_after, like Telegram. Per-chat
+rates are scaled up (--chat-rate, Telegram's is about 1/s) to keep runs short.
+
+Checks that a burst of photos to one chat is delivered in full, that a 429 on
+one chat pauses only that chat, and that an interactive reply overtakes bulk
+photos already queued for the same chat.
+
+Usage: python -m bench.outbound_rate_limit [--photos 40] [--chat-rate 5]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from .common import summarize
+from .fakes import FakeBotAPIServer, make_bot_message
+
+BULK_CHAT = 1
+INTERACTIVE_CHAT = 2
+
+
+def reset(server: FakeBotAPIServer, chat_rate: float):
+    server.calls.clear()
+    server.buckets.clear()
+    server.photos_delivered = server.flood_errors = 0
+    server.chat_rate = chat_rate
+
+
+async def send_photos(message, photos: int, limited: bool):
+    from bot.utils.rate_limiter import reply_photo
+
+    async def one(i):
+        url = f"https://replicate.delivery/fake/{i}.jpg"
+        try:
+            if limited:
+                await reply_photo(message, photo=url)
+            else:
+                await message.reply_photo(photo=url)
+        except Exception as e:
+            logging.debug(f"send failed: {e}")
+
+    await asyncio.gather(*[one(i) for i in range(photos)])
+
+
+async def run(server: FakeBotAPIServer, photos: int, chat_rate: float) -> bool:
+    from bot.utils import rate_limiter
+    from bot.utils.rate_limiter import INTERACTIVE, OutboundLimiter, reply_text
+
+    results = []
+
+    def check(name, ok, detail):
+        results.append(ok)
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+
+    bot, bulk = await make_bot_message(server.base_url, BULK_CHAT)
+    _, interactive = await make_bot_message(server.base_url, INTERACTIVE_CHAT)
+    interactive.set_bot(bot)
+
+    # 1. Burst of photos to one chat, without and with the limiter
+    for limited in (False, True):
+        reset(server, chat_rate)
+        rate_limiter.outbound_limiter = OutboundLimiter(chat_rate=chat_rate)
+        started = time.perf_counter()
+        await send_photos(bulk, photos, limited)
+        label = "limited" if limited else "direct"
+        detail = (
+            f"{server.photos_delivered}/{photos} delivered, {server.flood_errors} 429s, "
+            f"{time.perf_counter() - started:.2f}s"
+        )
+        if limited:
+            check("burst delivered in full", server.photos_delivered == photos, detail)
+        else:
+            print(f"[--] {label} burst: {detail}")
+
+    # 2. The server is stricter than the limiter: 429s pause only that chat
+    reset(server, chat_rate / 2)
+    limiter = rate_limiter.outbound_limiter = OutboundLimiter(chat_rate=chat_rate)
+    latencies = []
+
+    async def interactive_reply(i):
+        await asyncio.sleep(i * 0.5)
+        started = time.perf_counter()
+        await reply_text(interactive, f"/help {i}")
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(
+        send_photos(bulk, photos // 2, True),
+        *[interactive_reply(i) for i in range(5)],
+    )
+    other = summarize(latencies)
+    check(
+        "RetryAfter pauses only its chat",
+        server.photos_delivered == photos // 2
+        and limiter.flood_waits > 0
+        and other["max_ms"] < 1000 / chat_rate * 3,
+        f"{server.photos_delivered}/{photos // 2} delivered after {limiter.flood_waits} "
+        f"flood waits, other chat max latency {other['max_ms']:.0f} ms",
+    )
+
+    # 3. An interactive reply overtakes bulk photos queued for the same chat
+    reset(server, chat_rate)
+    rate_limiter.outbound_limiter = OutboundLimiter(chat_rate=chat_rate)
+    bulk_task = asyncio.create_task(send_photos(bulk, photos // 2, True))
+    await asyncio.sleep(0.5)
+    started = time.perf_counter()
+    await reply_text(bulk, "/config", priority=INTERACTIVE)
+    reply_latency = time.perf_counter() - started
+    await bulk_task
+    bulk_latency = time.perf_counter() - started
+    check(
+        "interactive reply jumps the bulk queue",
+        reply_latency < bulk_latency / 4,
+        f"reply after {reply_latency * 1000:.0f} ms, "
+        f"queued photos finished after {bulk_latency * 1000:.0f} ms",
+    )
+
+    await bot.shutdown()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--chat-rate", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-outbound-"))
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    with FakeBotAPIServer(latency=0.02, chat_rate=args.chat_rate) as server:
+        ok = asyncio.run(run(server, args.photos, args.chat_rate))
+    assert ok, "outbound rate limiter checks failed"
+
+
+if __name__ == "__main__":
+    main()
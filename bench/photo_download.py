@@ -0,0 +1,170 @@
+"""
+Peak RSS and latency of the photo path of image analysis for 100 concurrent
+uploads: download from a fake Telegram file server, encode, and send to a fake
+OpenAI vision endpoint.
+
+  legacy   - new aiohttp session per photo, largest PhotoSize, read whole body
+  current  - shared session, streaming capped download, smallest PhotoSize of
+             at least ANALYSIS_MAX_SIDE, downscaled in the image thread pool
+
+Each strategy runs in its own process so peak RSS is comparable.
+
+Usage: python -m bench.photo_download [--uploads 100]
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from .common import summarize
+from .fakes import FakeFileServer, FakeOpenAIServer
+
+# Resolutions Telegram keeps for an uploaded photo, largest last
+SIZES = [(90, 68), (320, 240), (800, 600), (1280, 960), (2560, 1920)]
+
+
+def make_photo_files() -> dict:
+    from PIL import Image, ImageFilter
+
+    base = Image.effect_noise((640, 480), 64).convert("RGB")
+    base = base.filter(ImageFilter.GaussianBlur(1))
+    files = {}
+    for width, height in SIZES:
+        output = io.BytesIO()
+        base.resize((width, height)).save(output, format="JPEG", quality=90)
+        files[f"{width}.jpg"] = output.getvalue()
+    return files
+
+
+def photo_sizes():
+    return [
+        types.SimpleNamespace(file_id=f"{w}.jpg", width=w, height=h) for w, h in SIZES
+    ]
+
+
+async def legacy_upload(file_url: str) -> bytes:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{file_url}/{photo_sizes()[-1].file_id}") as response:
+            image_data = await response.read()
+    return image_data
+
+
+async def current_upload(file_url: str) -> bytes:
+    from bot.utils.http import http_client
+    from bot.utils.images import pick_photo_size, prepare_for_vision
+
+    photo = pick_photo_size(photo_sizes())
+    image_data = await http_client.download(f"{file_url}/{photo.file_id}")
+    return await prepare_for_vision(image_data)
+
+
+async def run_strategy(strategy: str, file_url: str, uploads: int) -> dict:
+    from bot.services.openai_service import chat_completion
+    from bot.utils.http import http_client
+
+    download = legacy_upload if strategy == "legacy" else current_upload
+    latencies, payloads = [], []
+
+    async def one_upload():
+        started = time.perf_counter()
+        image_data = await download(file_url)
+        base64_image = base64.b64encode(image_data).decode("utf-8")
+        payloads.append(len(base64_image))
+        await chat_completion(
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Describe this image"},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                        },
+                    ],
+                }
+            ],
+            max_tokens=100,
+        )
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one_upload() for _ in range(uploads)])
+    wall = time.perf_counter() - started
+    await http_client.close()
+    return {
+        "strategy": strategy,
+        "wall_s": round(wall, 2),
+        "latency": summarize(latencies),
+        "payload_kb": round(sum(payloads) / len(payloads) / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def child(args):
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(run_strategy(args.strategy, args.file_url, args.uploads))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--strategy", choices=["legacy", "current"])
+    parser.add_argument("--file-url")
+    args = parser.parse_args()
+    if args.strategy:
+        return child(args)
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-photo-"))
+    files = make_photo_files()
+    print("photo sizes: " + ", ".join(f"{n} {len(b) // 1024} KB" for n, b in files.items()))
+    with FakeFileServer(files, latency=0.05) as file_server, FakeOpenAIServer(
+        latency=0.5
+    ) as openai_server:
+        env = dict(
+            os.environ,
+            OPENAI_BASE_URL=f"{openai_server.base_url}/v1",
+            OPENAI_API_KEY="fake",
+            PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        for strategy in ("legacy", "current"):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "bench.photo_download",
+                    "--strategy",
+                    strategy,
+                    "--uploads",
+                    str(args.uploads),
+                    "--file-url",
+                    f"{file_server.base_url}/file",
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            latency = result["latency"]
+            print(
+                f"{strategy:>8}: p50 {latency['p50_ms']:.0f} ms, p99 {latency['p99_ms']:.0f} ms, "
+                f"wall {result['wall_s']}s, vision payload {result['payload_kb']} KB, "
+                f"peak RSS {result['peak_rss_mb']} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Time until a batch has its prompts, drawing from the persistent prompt pool
+versus generating them with (fake) GPT on the spot. Runs consecutive batches
+for one user, checks that no prompt is ever served to them twice, and that the
+pool survives a restart of the database connections.
+
+Usage: python -m bench.prompt_pool [--batches 4] [--size 20] [--gpt-latency 5]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from .fakes import FakeOpenAIServer
+
+USER_ID = 1
+KEY = ("professional", "male", "TOK")
+
+
+async def run(batches: int, size: int) -> bool:
+    from bot.services.openai_service import generate_prompts
+    from bot.services.prompt_pool import prompt_pool
+    from bot.utils.database import db
+
+    style, gender, trigger_word = KEY
+
+    started = time.perf_counter()
+    await generate_prompts(size, trigger_word, style=style, gender=gender)
+    print(f"direct generate_prompts({size}): {time.perf_counter() - started:.2f}s")
+
+    served = []
+    for batch in range(batches):
+        pooled_before = prompt_pool.served_from_pool
+        started = time.perf_counter()
+        prompts = await prompt_pool.draw(USER_ID, style, gender, trigger_word, size)
+        elapsed = time.perf_counter() - started
+        served += prompts
+        print(
+            f"batch {batch + 1}: {len(prompts)} prompts in {elapsed:.3f}s "
+            f"({prompt_pool.served_from_pool - pooled_before} from the pool)"
+        )
+        # Let the background refill finish before the next batch arrives
+        await asyncio.gather(*prompt_pool._refills.values())
+
+    duplicates = len(served) - len(set(served))
+    print(f"{len(served)} prompts served, {duplicates} served twice")
+
+    # Simulated restart: connections closed and reopened, pool contents kept
+    await db.close()
+    pooled = await db.count_pooled_prompts(style, gender, trigger_word)
+    print(f"after restart: {pooled} prompts still pooled")
+    await prompt_pool.close()
+    await db.close()
+    return duplicates == 0 and pooled > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batches", type=int, default=4)
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--gpt-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-pool-"))
+    logging.disable(logging.CRITICAL)
+    with FakeOpenAIServer(latency=args.gpt_latency) as openai_server:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        ok = asyncio.run(run(args.batches, args.size))
+    assert ok, "prompt pool checks failed"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Simulates several users sharing the Replicate scheduler with a fake async_run
+of configurable latency: one user submits a huge batch, light users arrive a
+moment later. Reports per-user completion times, queue waits and the peak
+number of in-flight predictions, and checks that the light users finish well
+before the heavy backlog drains and that no user ever has more than
+--max-per-user predictions in flight.
+
+Usage: python -m bench.replicate_scheduler_sim [--latency 0.2] [--heavy 500]
+       [--light-users 5] [--light 5] [--max-concurrency 32] [--max-per-user 16]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import tempfile
+import time
+
+from .common import summarize
+
+CONFIG = {"trigger_word": "TOK", "model_endpoint": "owner/model:version"}
+# A light user must be done within this fraction of the heavy user's time
+LIGHT_USER_MAX_SHARE = 0.25
+
+# User whose generation reaches the fake async_run
+current_user = contextvars.ContextVar("current_user")
+
+
+async def run(args):
+    import replicate
+    from bot.services.replicate_service import ReplicateService, replicate_scheduler
+    from bot.utils.database import db
+
+    replicate_scheduler.max_concurrent = args.max_concurrency
+    replicate_scheduler.max_per_user = args.max_per_user
+    in_flight = peak = 0
+    user_in_flight = {}
+    user_peak = {}
+
+    async def fake_async_run(model_endpoint, input, **kwargs):
+        nonlocal in_flight, peak
+        user_id = current_user.get()
+        in_flight += 1
+        peak = max(peak, in_flight)
+        user_in_flight[user_id] = user_in_flight.get(user_id, 0) + 1
+        user_peak[user_id] = max(user_peak.get(user_id, 0), user_in_flight[user_id])
+        try:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * args.latency)
+            return [f"https://example.invalid/{input['seed']}.jpg"]
+        finally:
+            in_flight -= 1
+            user_in_flight[user_id] -= 1
+
+    replicate.async_run = fake_async_run
+    started = time.monotonic()
+
+    async def user_batch(user_id: int, jobs: int, delay: float):
+        await asyncio.sleep(delay)
+        # Inherited by the generation tasks gather() creates
+        current_user.set(user_id)
+        submitted = time.monotonic()
+        await asyncio.gather(
+            *[
+                ReplicateService.generate_image("TOK prompt", user_id=user_id, config=CONFIG)
+                for _ in range(jobs)
+            ]
+        )
+        return user_id, jobs, time.monotonic() - submitted, time.monotonic() - started
+
+    results = await asyncio.gather(
+        user_batch(0, args.heavy, 0.0),
+        *[
+            user_batch(u, args.light, 0.05 * u)
+            for u in range(1, args.light_users + 1)
+        ],
+    )
+
+    print(f"total wall time: {time.monotonic() - started:.2f}s, peak in flight: {peak}")
+    for user_id, jobs, elapsed, _ in results:
+        kind = "heavy" if user_id == 0 else "light"
+        print(
+            f"user {user_id} ({kind}, {jobs} jobs): done in {elapsed:.2f}s, "
+            f"peak in flight {user_peak.get(user_id, 0)}"
+        )
+    stats = replicate_scheduler.stats()
+    print(
+        f"scheduler: granted {stats['granted']}, avg wait {stats['avg_wait']:.2f}s,"
+        f" max wait {stats['max_wait']:.2f}s, queue depth now {stats['queue_depth']}"
+    )
+    light = [elapsed for user_id, _, elapsed, _ in results if user_id]
+    print(f"light users completion: {summarize(light)}")
+    await db.close()
+
+    heavy_done = results[0][3]
+    light_done = max((done for user_id, _, _, done in results if user_id), default=0.0)
+    assert light_done <= heavy_done * LIGHT_USER_MAX_SHARE, (
+        f"light users finished at {light_done:.2f}s, heavy backlog at {heavy_done:.2f}s"
+    )
+    assert max(user_peak.values()) <= args.max_per_user, (
+        f"a user had {max(user_peak.values())} predictions in flight, "
+        f"cap is {args.max_per_user}"
+    )
+    assert peak <= args.max_concurrency, f"{peak} predictions in flight overall"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--heavy", type=int, default=500)
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--light", type=int, default=5)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-per-user", type=int, default=16)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-scheduler-"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Exercises the retry layer against local fake OpenAI and Replicate servers that
+inject 429 and 503 responses: transient bursts must be absorbed, client errors
+must not be retried, and a sustained outage must not be amplified beyond the
+retry budget.
+
+Usage: python -m bench.retry_fault_injection
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+
+from .fakes import FakeOpenAIServer, FakeReplicateServer
+
+CONFIG = {"trigger_word": "TOK", "model_endpoint": "owner/model:version"}
+
+
+def reset_budget(budget):
+    budget.tokens = budget.max_tokens
+    budget.retries = budget.exhausted = 0
+
+
+async def run(openai_server: FakeOpenAIServer, replicate_server: FakeReplicateServer):
+    from bot.services import retry
+    from bot.services.openai_service import generate_prompts
+    from bot.services.replicate_service import ReplicateService
+    from bot.utils.database import db
+
+    # Keep the run short, the backoff shape is what matters here
+    for policy in (retry.OPENAI_RETRY_POLICY, retry.REPLICATE_RETRY_POLICY):
+        policy.base_delay = 0.05
+        policy.max_delay = 0.2
+
+    results = []
+
+    def check(name, ok, detail):
+        results.append(ok)
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+
+    # 1. Transient burst on OpenAI: 429 then 503, third attempt succeeds
+    openai_server.requests = 0
+    openai_server.inject(429, 503)
+    prompts = await generate_prompts(3, "TOK")
+    check(
+        "openai transient 429/503",
+        len(prompts) == 3 and openai_server.requests == 3,
+        f"{len(prompts)} prompts after {openai_server.requests} requests",
+    )
+
+    # 2. Client error on OpenAI is not retried
+    openai_server.requests = 0
+    openai_server.inject(400)
+    prompts = await generate_prompts(3, "TOK")
+    check(
+        "openai 400 not retried",
+        prompts == [] and openai_server.requests == 1,
+        f"{openai_server.requests} request(s)",
+    )
+
+    # 3. Transient burst on Replicate
+    replicate_server.requests = 0
+    replicate_server.inject(503, 429)
+    image_url, _ = await ReplicateService.generate_image("TOK prompt", user_id=1, config=CONFIG)
+    check(
+        "replicate transient 503/429",
+        bool(image_url),
+        f"{image_url} after {replicate_server.requests} requests",
+    )
+
+    # 4. Sustained Replicate outage: the budget bounds the extra load
+    reset_budget(retry.replicate_retry_budget)
+    replicate_server.requests = 0
+    replicate_server.error_rate = 1.0
+    jobs = 100
+    outputs = await asyncio.gather(
+        *[
+            ReplicateService.generate_image("TOK prompt", user_id=u, config=CONFIG)
+            for u in range(jobs)
+        ]
+    )
+    replicate_server.error_rate = 0.0
+    budget = retry.replicate_retry_budget
+    bound = jobs + budget.max_tokens + budget.ratio * jobs
+    naive = jobs * retry.REPLICATE_RETRY_POLICY.max_attempts
+    check(
+        "replicate outage bounded by budget",
+        all(url is None for url, _ in outputs) and replicate_server.requests <= bound,
+        f"{replicate_server.requests} requests for {jobs} jobs "
+        f"(budget bound {bound:.0f}, without budget up to {naive})",
+    )
+
+    await db.close()
+    return all(results)
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="bench-retry-"))
+    logging.disable(logging.CRITICAL)
+    with FakeOpenAIServer(latency=0.01) as openai_server, FakeReplicateServer(
+        latency=0.01
+    ) as replicate_server:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        os.environ["REPLICATE_BASE_URL"] = replicate_server.base_url
+        os.environ["REPLICATE_API_TOKEN"] = "fake"
+        ok = asyncio.run(run(openai_server, replicate_server))
+    assert ok, "retry checks failed"
+
+
+if __name__ == "__main__":
+    main()
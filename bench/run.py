@@ -0,0 +1,318 @@
+"""
+Offline end-to-end benchmark of the bot: the real Application from
+bot/bot.py handles synthetic /config, /generate and photo updates, while
+Telegram, OpenAI and Replicate are local fake servers with configurable
+latency, error rate and payload size. Nothing reaches a paid API.
+
+Each scenario runs in a fresh child process (own database, caches and
+memory peak) that feeds updates through Application.process_update. For
+every scenario it reports throughput, p50/p95/p99 latency per update kind,
+the child's peak RSS and the calls each fake API received, and writes
+everything to a JSON file that a later run can be compared against.
+
+Usage:
+    python -m bench.run [--scenario generate --scenario photo] [--users 20]
+        [--replicate-latency 1.0] [--openai-error-rate 0.05] ...
+        [--output bench-results.json] [--compare previous.json]
+"""
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .common import summarize
+from .fakes import FakeBotAPIServer, FakeOpenAIServer, FakeReplicateServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODEL_ENDPOINT = "owner/model:version"
+
+# Updates each user sends in the measured phase, by scenario
+SCENARIOS = {
+    "config": ["/config"],
+    "generate": ["/generate {images}"],
+    "photo": ["photo"],
+    "mixed": ["/config", "/generate {images}", "photo"],
+}
+
+
+def make_photo(side: int) -> bytes:
+    """A JPEG of side x 3/4 side pixels, noise so it doesn't compress to nothing"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return os.urandom(side * side // 8)
+    output = io.BytesIO()
+    Image.effect_noise((side, side * 3 // 4), 32).convert("RGB").save(
+        output, format="JPEG", quality=85
+    )
+    return output.getvalue()
+
+
+# --- child process: drives the Application --------------------------------
+
+
+def make_update(update_id: int, user_id: int, kind: str, photo_side: int) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+    }
+    if kind == "photo":
+        message["photo"] = [
+            {
+                "file_id": f"photo-{update_id}-{size}",
+                "file_unique_id": f"unique-{update_id}-{size}",
+                "width": size,
+                "height": size * 3 // 4,
+            }
+            for size in (photo_side // 4, photo_side)
+        ]
+    else:
+        command = kind.split(" ", 1)[0]
+        message["text"] = kind
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+async def drive(scenario: dict) -> dict:
+    from telegram import Update
+
+    from bot.bot import build_application
+
+    application = build_application()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    update_ids = iter(range(1, 10**9))
+
+    async def process(user_id: int, kind: str):
+        data = make_update(next(update_ids), user_id, kind, scenario["photo_side"])
+        await application.process_update(Update.de_json(data, application.bot))
+
+    users = range(1000, 1000 + scenario["users"])
+    try:
+        # Unmeasured setup: every user configures a LoRA of their own
+        for user_id in users:
+            await process(user_id, f"/config trigger_word TOK{user_id}")
+            await process(user_id, f"/config model_endpoint {MODEL_ENDPOINT}")
+
+        kinds = [
+            kind.format(images=scenario["images"]) for kind in SCENARIOS[scenario["name"]]
+        ]
+        work = [(user_id, kind) for user_id in users for kind in kinds]
+        random.Random(0).shuffle(work)
+        latencies = {kind: [] for kind in kinds}
+        semaphore = asyncio.Semaphore(scenario["concurrency"])
+
+        async def timed(user_id: int, kind: str):
+            async with semaphore:
+                started = time.perf_counter()
+                await process(user_id, kind)
+                latencies[kind].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            for user_id, kind in work:
+                tg.create_task(timed(user_id, kind))
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    return {
+        "updates": len(work),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(work) / elapsed, 2),
+        "latency": {kind.split(" ")[0]: summarize(values) for kind, values in latencies.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def child_main(scenario: dict):
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(drive(scenario))
+    print(json.dumps(result))
+
+
+# --- parent process: fake servers, scenarios, report ----------------------
+
+
+def run_scenario(scenario: dict, servers: dict, env: dict) -> dict:
+    for server in servers.values():
+        server.calls.clear()
+    servers["telegram"].photos_delivered = 0
+    servers["telegram"].buckets.clear()
+
+    with tempfile.TemporaryDirectory(prefix=f"bench-run-{scenario['name']}-") as workdir:
+        completed = subprocess.run(
+            [sys.executable, "-m", "bench.run", "--child", json.dumps(scenario)],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"scenario {scenario['name']} failed:\n{completed.stderr[-3000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["api_calls"] = {name: dict(server.calls) for name, server in servers.items()}
+    result["photos_delivered"] = servers["telegram"].photos_delivered
+    return result
+
+
+def print_result(name: str, result: dict, previous: dict = None):
+    def change(value, key, lower_is_better):
+        if not previous or key(previous) in (None, 0) or value is None:
+            return ""
+        delta = (value - key(previous)) / key(previous)
+        worse = delta > 0 if lower_is_better else delta < 0
+        return f" ({delta:+.0%}{' worse' if worse and abs(delta) >= 0.1 else ''})"
+
+    print(
+        f"{name}: {result['updates']} updates in {result['elapsed_s']}s, "
+        f"{result['updates_per_s']}/s"
+        f"{change(result['updates_per_s'], lambda r: r['updates_per_s'], False)}, "
+        f"peak RSS {result['peak_rss_mb']} MB"
+        f"{change(result['peak_rss_mb'], lambda r: r['peak_rss_mb'], True)}, "
+        f"{result['photos_delivered']} photos delivered"
+    )
+    for kind, latency in result["latency"].items():
+        old = (lambda r, kind=kind: r["latency"].get(kind, {}).get("p95_ms")) if previous else None
+        print(
+            f"    {kind:<10} p50 {latency['p50_ms']}ms p95 {latency['p95_ms']}ms "
+            f"p99 {latency['p99_ms']}ms"
+            f"{change(latency['p95_ms'], old, True) if old else ''}"
+        )
+    for api, calls in result["api_calls"].items():
+        if calls:
+            print(f"    {api:<10} " + ", ".join(f"{k}={v}" for k, v in sorted(calls.items())))
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--images", type=int, default=10, help="Images per /generate")
+    parser.add_argument("--concurrency", type=int, default=50, help="Updates in flight")
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--openai-per-prompt", type=float, default=0.02)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--prompt-length", type=int, default=500)
+    parser.add_argument("--replicate-latency", type=float, default=1.0)
+    parser.add_argument("--replicate-error-rate", type=float, default=0.0)
+    parser.add_argument("--photo-side", type=int, default=1280, help="Photo width in pixels")
+    parser.add_argument("--output", type=Path, default=Path("bench-results.json"))
+    parser.add_argument("--compare", type=Path, help="Earlier results to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(json.loads(args.child))
+        return
+
+    previous = json.loads(args.compare.read_text())["scenarios"] if args.compare else {}
+    settings = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("scenario", "output", "compare", "child")
+    }
+    servers = {
+        "telegram": FakeBotAPIServer(
+            latency=args.telegram_latency,
+            error_rate=args.telegram_error_rate,
+            photo=make_photo(args.photo_side),
+        ),
+        "openai": FakeOpenAIServer(
+            latency=args.openai_latency,
+            per_prompt_latency=args.openai_per_prompt,
+            error_rate=args.openai_error_rate,
+            prompt_length=args.prompt_length,
+        ),
+        "replicate": FakeReplicateServer(
+            latency=args.replicate_latency, error_rate=args.replicate_error_rate
+        ),
+    }
+    for server in servers.values():
+        server.start()
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(REPO_ROOT),
+        BOT_TOKEN="123:fake",
+        TELEGRAM_BASE_URL=servers["telegram"].base_url,
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=f"{servers['openai'].base_url}/v1",
+        REPLICATE_API_TOKEN="fake",
+        REPLICATE_BASE_URL=servers["replicate"].base_url,
+    )
+
+    results = {}
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            scenario = dict(
+                name=name,
+                users=args.users,
+                images=args.images,
+                concurrency=args.concurrency,
+                photo_side=args.photo_side,
+            )
+            results[name] = run_scenario(scenario, servers, env)
+            print_result(name, results[name], previous.get(name))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    args.output.write_text(
+        json.dumps(
+            {
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "revision": git_revision(),
+                "settings": settings,
+                "scenarios": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
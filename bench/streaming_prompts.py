@@ -0,0 +1,92 @@
+"""
+Time to first prompt and first image for a /generate batch, with the prompt
+list parsed from a streamed response (OPENAI_STREAM_PROMPTS=1) versus waiting
+for each chunk's complete JSON. OpenAI is a fake server that streams tokens at
+a steady rate; Replicate is faked in-process with a fixed latency.
+
+Usage: python -m bench.streaming_prompts [--images 20] [--per-prompt 0.2] [--replicate 2.0]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+
+from .fakes import FakeOpenAIServer, make_update
+
+
+async def run(streaming: bool, images: int, replicate_latency: float) -> dict:
+    import replicate
+    from bot.utils.database import db
+    from bot.handlers.generate_handler import generate_handler
+    from bot.services.prompt_pool import prompt_pool
+
+    # Module constant, read on every stream_prompts() call
+    sys.modules["bot.services.openai_service"].STREAM_PROMPTS = streaming
+    marks = {}
+
+    async def fake_async_run(model_endpoint, input, **kwargs):
+        marks.setdefault("first_prompt", time.perf_counter() - started)
+        await asyncio.sleep(replicate_latency)
+        marks.setdefault("first_image", time.perf_counter() - started)
+        return [f"https://example.invalid/{input['seed']}.jpg"]
+
+    async def fake_save_prediction(user_id, prompt, output_url, **kwargs):
+        return "fake-prediction"
+
+    replicate.async_run = fake_async_run
+    db.save_prediction = fake_save_prediction
+
+    # The pool is shared per trigger word, so use a new one to start it empty
+    user_id = 1 + streaming
+    await db.set_user_config(
+        user_id,
+        {"trigger_word": f"TOK{user_id}", "model_endpoint": "owner/model:version"},
+    )
+    command = f"/generate {images} styles=urban"
+    update = make_update(user_id, command)
+    context = types.SimpleNamespace(args=command.split()[1:])
+
+    started = time.perf_counter()
+    await generate_handler(update, context)
+    marks["total"] = time.perf_counter() - started
+
+    await prompt_pool.close()
+    await db.close()
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--per-prompt", type=float, default=0.2)
+    parser.add_argument("--replicate", type=float, default=2.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-streaming-"))
+    logging.disable(logging.CRITICAL)
+    with FakeOpenAIServer(latency=0.5, per_prompt_latency=args.per_prompt) as openai_server:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        results = {}
+        for streaming in (False, True):
+            marks = asyncio.run(run(streaming, args.images, args.replicate))
+            results[streaming] = marks
+            label = "streamed" if streaming else "buffered"
+            print(
+                f"  {label}: first prompt after {marks['first_prompt']:.2f}s, "
+                f"first image after {marks['first_image']:.2f}s, "
+                f"batch done after {marks['total']:.2f}s"
+            )
+
+    assert results[True]["first_image"] < results[False]["first_image"], (
+        "streaming should get the first image out sooner"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Critical path of each traced command, from the spans exported with
+TRACE_EXPORT_DIR (bot and workers may share the directory).
+
+The critical path is the chain of spans the command actually waited on:
+starting from the root, the child that finished last, then whatever
+finished last before that child started, and so on. Its time is split by
+span name, so a slow batch shows whether it went to the config read, GPT,
+the Replicate queue, inference, SQLite or Telegram.
+
+Usage: python -m bench.trace_summary traces/ [--root generate_handler] [--last 10]
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+
+
+class SpanRecord:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, data: dict):
+        self.trace_id = data["traceId"]
+        self.span_id = data["spanId"]
+        self.parent_id = data.get("parentSpanId")
+        self.name = data["name"]
+        self.start = int(data["startTimeUnixNano"]) / 1e9
+        self.end = int(data["endTimeUnixNano"]) / 1e9
+        self.attributes = {
+            attribute["key"]: next(iter(attribute["value"].values()))
+            for attribute in data.get("attributes", [])
+        }
+        self.error = data.get("status", {}).get("code") == 2
+
+
+def load_spans(directory: Path) -> list:
+    spans = []
+    for path in sorted(directory.glob("*.jsonl")):
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get("resourceSpans", []):
+                for scope in resource.get("scopeSpans", []):
+                    spans.extend(SpanRecord(span) for span in scope.get("spans", []))
+    return spans
+
+
+def extend_ends(span: SpanRecord, children: dict) -> float:
+    """
+    Stretch each span's end over its descendants: work a command handed off
+    (queued jobs, album flushes) is still part of its batch.
+    """
+    for child in children[span.span_id]:
+        span.end = max(span.end, extend_ends(child, children))
+    return span.end
+
+
+def critical_path(span: SpanRecord, children: dict, until: float, path: list):
+    """Append (name, seconds) segments of `span`'s critical path, latest first"""
+    cursor = min(span.end, until)
+    for child in sorted(children[span.span_id], key=lambda c: c.end, reverse=True):
+        if child.start >= cursor or child.end <= span.start:
+            continue
+        child_end = min(child.end, cursor)
+        if child_end < cursor:
+            # Time spent in the span itself, waiting on nothing traced
+            path.append((span.name, cursor - child_end))
+        critical_path(child, children, child_end, path)
+        cursor = max(child.start, span.start)
+    if cursor > span.start:
+        path.append((span.name, cursor - span.start))
+
+
+def summarize(spans: list, root_name: str, last: int):
+    children = defaultdict(list)
+    by_id = {span.span_id: span for span in spans}
+    roots = []
+    for span in spans:
+        if span.parent_id in by_id:
+            children[span.parent_id].append(span)
+        elif span.name == root_name:
+            roots.append(span)
+    roots.sort(key=lambda span: span.start)
+
+    totals = defaultdict(float)
+    total_time = 0.0
+    for root in roots[-last:]:
+        extend_ends(root, children)
+        path = []
+        critical_path(root, children, root.end, path)
+        by_name = defaultdict(float)
+        for name, seconds in path:
+            by_name[name] += seconds
+        duration = root.end - root.start
+        total_time += duration
+
+        details = " ".join(f"{key}={value}" for key, value in root.attributes.items())
+        errors = sum(1 for span in spans if span.trace_id == root.trace_id and span.error)
+        print(f"trace {root.trace_id} {root.name} {duration:.2f}s {details} errors={errors}")
+        for name, seconds in sorted(by_name.items(), key=lambda item: -item[1]):
+            totals[name] += seconds
+            print(f"    {name:<36} {seconds:8.3f}s {seconds / duration:6.1%}")
+
+    if not roots:
+        print(f"No '{root_name}' spans found")
+    elif len(roots[-last:]) > 1:
+        print(f"critical path over {len(roots[-last:])} traces ({total_time:.2f}s):")
+        for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"    {name:<36} {seconds:8.3f}s {seconds / total_time:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", type=Path, help="TRACE_EXPORT_DIR of the bot/workers")
+    parser.add_argument("--root", default="generate_handler", help="Root span name")
+    parser.add_argument("--last", type=int, default=10, help="Most recent traces to show")
+    args = parser.parse_args()
+    summarize(load_spans(args.directory), args.root, args.last)
+
+
+if __name__ == "__main__":
+    main()
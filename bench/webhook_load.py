@@ -0,0 +1,180 @@
+"""
+Load test for webhook mode: posts synthetic /about updates to the real
+application behind a local WebhookServer, with replies going to a fake Bot
+API server. Reports updates/sec, the p99 of the webhook acknowledgement and
+the p99 of full handling (POST sent until the reply reaches the Bot API).
+The fake Bot API runs in this process too, so absolute numbers are a floor.
+
+Also checks that a wrong secret token and a malformed update are refused
+(403 and 400, not a 500 Telegram would keep retrying), that /readyz reports the
+server as draining during shutdown, and that updates in flight when shutdown
+starts are still answered.
+
+Usage: python -m bench.webhook_load [--updates 1000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import aiohttp
+
+from .common import summarize
+from .fakes import FakeBotAPIServer
+
+SECRET = "bench-secret"
+
+
+class RecordingBotAPIServer(FakeBotAPIServer):
+    """Remembers when each chat got its first reply"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.replied = {}
+
+    async def api_call(self, request):
+        response = await super().api_call(request)
+        if request.match_info["method"] == "sendMessage":
+            if request.content_type == "application/json":
+                params = await request.json()
+            else:
+                params = dict(await request.post())
+            self.replied.setdefault(int(params["chat_id"]), time.perf_counter())
+        return response
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": "/about",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def post_updates(session, url: str, first: int, count: int, concurrency: int):
+    """Post `count` updates from distinct chats, returns {chat_id: (sent_at, ack_seconds)}"""
+    sent = {}
+    ids = iter(range(first, first + count))
+
+    async def worker():
+        for update_id in ids:
+            started = time.perf_counter()
+            async with session.post(
+                url,
+                json=make_update(update_id, update_id),
+                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+            ) as response:
+                assert response.status == 200, f"webhook answered {response.status}"
+            sent[update_id] = (started, time.perf_counter() - started)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return sent
+
+
+async def wait_for_replies(api: RecordingBotAPIServer, chats, timeout: float = 60):
+    async with asyncio.timeout(timeout):
+        while not all(chat in api.replied for chat in chats):
+            await asyncio.sleep(0.05)
+
+
+async def run(api: RecordingBotAPIServer, updates: int, concurrency: int) -> bool:
+    from bot.bot import build_application
+    from bot.webhook import WebhookServer
+
+    results = []
+
+    def check(name, ok, detail):
+        results.append(ok)
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+
+    server = WebhookServer(
+        build_application(), listen="127.0.0.1", port=0, secret_token=SECRET
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.addresses:
+        await asyncio.sleep(0.01)
+    host, port = server.addresses[0][:2]
+    base = f"http://{host}:{port}"
+    url = f"{base}{server.path}"
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency)
+    ) as session:
+        async with session.get(f"{base}/readyz") as response:
+            check("ready once started", response.status == 200, f"/readyz {response.status}")
+        async with session.post(
+            url,
+            json=make_update(0, 0),
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+        ) as response:
+            check("wrong secret refused", response.status == 403, f"HTTP {response.status}")
+        async with session.post(
+            url,
+            json={"update_id": 0, "message": {"chat": 0}},
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        ) as response:
+            check("malformed update refused", response.status == 400, f"HTTP {response.status}")
+
+        started = time.perf_counter()
+        sent = await post_updates(session, url, 1, updates, concurrency)
+        await wait_for_replies(api, sent)
+        elapsed = time.perf_counter() - started
+        acks = summarize([ack for _, ack in sent.values()])
+        handled = summarize([api.replied[chat] - at for chat, (at, _) in sent.items()])
+        print(
+            f"  {updates} updates in {elapsed:.2f}s ({updates / elapsed:.0f} updates/s), "
+            f"ack p50 {acks['p50_ms']}ms p99 {acks['p99_ms']}ms, "
+            f"handled p50 {handled['p50_ms']}ms p99 {handled['p99_ms']}ms"
+        )
+
+        # Shut down with updates still being handled
+        in_flight = await post_updates(session, url, updates + 1, concurrency, concurrency)
+        server.stop()
+        await asyncio.sleep(0.01)
+        async with session.get(f"{base}/readyz") as response:
+            body = await response.json()
+            check(
+                "not ready while draining",
+                response.status == 503,
+                f"/readyz {response.status} {body['status']}",
+            )
+
+    await serving
+    answered = sum(chat in api.replied for chat in in_flight)
+    check(
+        "in-flight updates drained",
+        answered == len(in_flight),
+        f"{answered}/{len(in_flight)} answered before exit",
+    )
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench-webhook-"))
+    logging.disable(logging.CRITICAL)
+    # Measure the webhook path, not Telegram's global send limit
+    os.environ["TELEGRAM_GLOBAL_RATE"] = "1000000"
+    with RecordingBotAPIServer(latency=0.05, chat_rate=1000, chat_burst=1000) as api:
+        os.environ["TELEGRAM_BASE_URL"] = api.base_url
+        os.environ["BOT_TOKEN"] = "123:fake"
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+        ok = asyncio.run(run(api, args.updates, args.concurrency))
+    assert ok, "webhook checks failed"
+
+
+if __name__ == "__main__":
+    main()
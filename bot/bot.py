@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
@@ -11,19 +12,51 @@ from .handlers import (
     analyze_image_handler,
 )
 from .utils.logging_config import setup_logging
+from .utils.database import db
+from .utils.http import http_client
+from .utils.loop_monitor import loop_monitor
+from .utils.metrics import MetricsServer
+from .utils.tracing import tracer
+from .services.prompt_pool import prompt_pool
+from .webhook import WebhookServer
 
+# "polling" (default) or "webhook", see bot/webhook.py for its settings
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Bot API server base URL, e.g. a self-hosted telegram-bot-api instance
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "")
 
-def run_bot():
+metrics_server = MetricsServer()
+
+
+async def on_startup(application):
     """
-    Initialize and run the Telegram bot.
+    Application lifecycle hook: expose /metrics and start the event loop
+    monitor (LOOP_MONITOR) once the bot is initialized.
     """
-    # Setup logging
-    setup_logging()
+    await metrics_server.start()
+    await loop_monitor.start()
 
-    logging.info("Starting bot initialization...")
+
+async def on_shutdown(application):
+    """
+    Application lifecycle hook: release long-lived resources once the bot stops.
+    """
+    logging.info("Shutting down, closing database connections...")
+    await loop_monitor.stop()
+    await metrics_server.stop()
+    await prompt_pool.close()
+    await db.close()
+    await http_client.close()
+    tracer.shutdown()
+
+
+def build_application():
+    """
+    Build the Telegram application with all handlers registered.
+    """
     # Create the Application and pass it your bot's token
     logging.info("Building application with token and timeouts...")
-    application = (
+    builder = (
         ApplicationBuilder()
         .token(
             os.getenv("BOT_TOKEN")
@@ -32,8 +65,14 @@ def run_bot():
         .write_timeout(30)  # Set write timeout for the bot
         .connect_timeout(30)  # Set connection timeout for the bot
         .concurrent_updates(True)  # Enable concurrent updates
-        .build()
+        .post_init(on_startup)  # Start the metrics endpoint
+        .post_shutdown(on_shutdown)  # Close pooled resources on shutdown
     )
+    if TELEGRAM_BASE_URL:
+        # Self-hosted Bot API server, which also serves the files
+        base_url = TELEGRAM_BASE_URL.rstrip("/")
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
     logging.info("Application built successfully")
 
     # Register all handlers
@@ -51,8 +90,25 @@ def run_bot():
     logging.info("Registering error handler...")
     application.add_error_handler(error_handler)  # Handle errors globally
     logging.info("Error handler registered")
+    return application
+
+
+def run_bot():
+    """
+    Initialize and run the Telegram bot, by long polling or as a webhook
+    server depending on BOT_MODE.
+    """
+    # Setup logging
+    setup_logging()
+
+    logging.info("Starting bot initialization...")
+    application = build_application()
 
-    # Start the bot
-    logging.info("All handlers registered. Starting bot polling...")
-    application.run_polling()  # Start polling for updates
-    logging.info("Bot polling started")
+    if BOT_MODE == "webhook":
+        logging.info("All handlers registered. Starting webhook server...")
+        asyncio.run(WebhookServer(application).serve())
+        logging.info("Webhook server stopped")
+    else:
+        logging.info("All handlers registered. Starting bot polling...")
+        application.run_polling()  # Start polling for updates
+        logging.info("Bot polling stopped")
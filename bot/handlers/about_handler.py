@@ -2,10 +2,13 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import logging
 from ..utils.decorators import require_configured
+from ..utils.rate_limiter import reply_text
 
 
 @require_configured
-async def about_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def about_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict = None
+):
     """
     Handle the /about command to display information about the bot and its creator.
     Provides basic information and donation details.
@@ -24,13 +27,14 @@ async def about_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Dona: paypal.me/mariusmihailion"
         )
         logging.info(f"Sending about information to user {user_id}")
-        await update.message.reply_text(about_text)
+        await reply_text(update.message, about_text)
         logging.info(f"About information successfully sent to user {user_id}")
     except Exception as e:
         logging.error(
             f"Error sending about information to user {user_id} in chat {chat_id}: {str(e)}",
             exc_info=True,
         )
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ Error al mostrar la información. Por favor, intenta nuevamente."
         )
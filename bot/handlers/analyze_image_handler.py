@@ -3,16 +3,34 @@ from telegram.ext import ContextTypes
 import logging
 from ..services.openai_service import chat_completion
 from ..services.replicate_service import ReplicateService
+from ..services.circuit_breaker import (
+    first_open,
+    openai_breaker,
+    replicate_breaker,
+    unavailable_message,
+)
 from ..utils.database import db
-import aiohttp
+from ..utils.rate_limiter import delete_message, edit_text, reply_text
+from ..utils.http import http_client
+from ..utils.images import pick_photo_size, prepare_for_vision
+from ..utils.metrics import instrument_handler
+from ..utils.tracing import traced
+from ..services.analysis_cache import analysis_cache, content_hash, prompt_version
 import base64
+import time
 
 ANALYSIS_PROMPT = """You are the world's premier image description specialist, adept at providing the most comprehensive, detailed, and accurate descriptions of images. Your expertise lies in capturing every visual element with photorealistic precision, ensuring that the descriptions are vivid and exhaustive. When provided with an image, you will generate a highly detailed and comprehensive textual description that encapsulates all aspects of the image. Your descriptions will mirror the level of detail and photorealistic quality expected in professional image analysis and documentation.
 Your responses must always contain the trigger word {trigger_word}. When describing people, subtly highlight their athletic build and ensure their face is visible but not looking directly at the camera - instead, describe their gaze direction specifically (such as gazing thoughtfully at a distant horizon, eyes focused on an object in their hands, or looking slightly to the side with a pensive expression).
 You will generate responses structured to start with a general overview of the image, then break into detailed analysis of the main subject, environment, lighting, colors, textures, and any notable elements, finally concluding with the mood or atmosphere. All responses will focus on observable elements, and avoid subjective interpretations, maintaining a focus on realism and accuracy. Your goal is to help users vividly imagine the visual content, and your language will be clear, descriptive, and authoritative. Your responses will be logically ordered, easy to follow, and consistently detailed, highlighting aspects like reflections, textures, and intricate patterns that contribute to a photorealistic portrayal. You will always act as an expert in this domain, ensuring each image is described with professional-level depth and detail. You may describe possible camera angles, lighting, and depth of field when relevant.
 Provide your description without any formatting, metadata, or extra text."""
 
+ANALYSIS_MODEL = "gpt-4o"
+# Changes whenever the prompt or model does, so stale cached descriptions miss
+ANALYSIS_PROMPT_VERSION = prompt_version(ANALYSIS_PROMPT, ANALYSIS_MODEL)
 
+
+@instrument_handler("analyze_image")
+@traced("analyze_image_handler")
 async def analyze_image_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle incoming images to analyze and generate similar ones.
@@ -26,11 +44,11 @@ async def analyze_image_handler(update: Update, context: ContextTypes.DEFAULT_TY
         # Validate image presence
         if not update.message.photo:
             logging.warning(f"User {user_id} sent message without image")
-            await update.message.reply_text("❌ Please send an image to analyze.")
+            await reply_text(update.message, "❌ Please send an image to analyze.")
             return
 
         # Send initial status message
-        status_message = await update.message.reply_text("⏳ Analizando imagen...")
+        status_message = await reply_text(update.message, "⏳ Analizando imagen...")
 
         # Get user configuration
         config = await db.get_user_config(
@@ -38,62 +56,37 @@ async def analyze_image_handler(update: Update, context: ContextTypes.DEFAULT_TY
         )
         trigger_word = config.get("trigger_word")
 
-        # Get highest resolution image from message
-        photo = update.message.photo[-1]
-        file = await context.bot.get_file(photo.file_id)
-        image_url = file.file_path
-
-        # Download the image
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to download image: {response.status}")
-                image_data = await response.read()
-
-        # Convert to base64
-        base64_image = base64.b64encode(image_data).decode("utf-8")
-
-        # Request image description from OpenAI
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": ANALYSIS_PROMPT.format(trigger_word=trigger_word),
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ]
-
-        logging.info(f"Sending prompt to OpenAI for user {user_id}")
-        description = chat_completion(
-            messages=messages,
-            temperature=1,
-            max_tokens=8192,
-        )
+        # Fail fast when either upstream is known to be down
+        needed = [openai_breaker()]
+        if config.get("model_endpoint"):
+            needed.append(replicate_breaker(config["model_endpoint"]))
+        breaker = first_open(*needed)
+        if breaker:
+            logging.warning(
+                f"Rejecting image analysis for user {user_id}: circuit '{breaker.name}' is open"
+            )
+            await edit_text(status_message, unavailable_message(breaker))
+            return
 
-        if not description or len(description) < 100 or "I'm sorry" in description:
+        description = await describe_photo(context, update.message.photo, trigger_word)
+
+        if not description:
             logging.error(f"Failed to generate description for user {user_id}")
-            await status_message.edit_text(
+            await edit_text(
+                status_message,
                 "❌ No se pudo analizar la imagen debido a las políticas de contenido."
             )
             return
 
         # Send the description
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             f"📝 *Generated Description:*\n`{description}`", parse_mode="Markdown"
         )
         logging.info(f"Description sent to user {user_id}")
 
         # Update status for image generation
-        await status_message.edit_text("⏳ Generando imagen...")
+        await edit_text(status_message, "⏳ Generando imagen...")
         logging.info(f"Starting image generation based on analysis for user {user_id}")
 
         # Generate new image
@@ -101,21 +94,98 @@ async def analyze_image_handler(update: Update, context: ContextTypes.DEFAULT_TY
             description,
             user_id=user_id,
             message=update.message,
-            operation_type="analysis"
+            operation_type="analysis",
+            config=config,
         )
 
         if not image_url or not input_params:
-            await status_message.edit_text("❌ Error generando la imagen.")
+            await edit_text(status_message, "❌ Error generando la imagen.")
             return
 
         # Clean up status message
-        await status_message.delete()
+        await delete_message(status_message)
 
     except Exception as e:
         logging.error(
             f"Error in analyze_image_handler for user {user_id}: {str(e)}",
             exc_info=True,
         )
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ An error occurred while processing the image."
         )
+
+
+async def describe_photo(context, photo_sizes, trigger_word):
+    """
+    Describe a Telegram photo with the vision model, going through the
+    analysis cache so a photo seen before skips the download and the call.
+    Returns:
+        str: The description, or None if the model refused or failed
+    """
+    # Smallest resolution that is still enough for the vision model
+    photo = pick_photo_size(photo_sizes)
+    version = ANALYSIS_PROMPT_VERSION
+    description = await analysis_cache.get_by_file(
+        photo.file_unique_id, trigger_word, version
+    )
+    if description:
+        return description
+
+    started = time.monotonic()
+    file = await context.bot.get_file(photo.file_id)
+
+    # Download the image over the shared session, capped in size
+    image_data = await http_client.download(file.file_path)
+    digest = content_hash(image_data)
+    description = await analysis_cache.get_by_content(
+        digest, photo.file_unique_id, trigger_word, version
+    )
+    if description:
+        return description
+
+    image_data = await prepare_for_vision(image_data)
+
+    # Convert to base64
+    base64_image = base64.b64encode(image_data).decode("utf-8")
+    del image_data
+
+    # Request image description from OpenAI
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": ANALYSIS_PROMPT.format(trigger_word=trigger_word),
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                    },
+                },
+            ],
+        }
+    ]
+
+    logging.info("Sending image analysis prompt to OpenAI")
+    description = await chat_completion(
+        messages=messages,
+        model=ANALYSIS_MODEL,
+        temperature=1,
+        max_tokens=8192,
+    )
+
+    if not description or len(description) < 100 or "I'm sorry" in description:
+        return None
+
+    await analysis_cache.store(
+        digest,
+        photo.file_unique_id,
+        trigger_word,
+        version,
+        description,
+        time.monotonic() - started,
+    )
+    return description
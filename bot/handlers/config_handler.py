@@ -4,6 +4,10 @@ from ..services.replicate_service import ReplicateService
 import json
 import logging
 from ..utils.database import db
+from ..services.prompt_pool import prompt_pool
+from ..utils.metrics import instrument_handler
+from ..utils.tracing import traced
+from ..utils.rate_limiter import reply_text
 from ..services.prompt_styles.manager import style_manager
 
 # Define the allowed parameters and their order
@@ -46,6 +50,8 @@ ALLOWED_PARAMS = {
 }
 
 
+@instrument_handler("config")
+@traced("config_handler")
 async def config_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle the /config command.
@@ -83,12 +89,13 @@ async def config_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 value = config.get(param, "no configurado")
                 config_text += f"`{param}`: `{value}`\n"
 
-        await update.message.reply_text(config_text, parse_mode="Markdown")
+        await reply_text(update.message, config_text, parse_mode="Markdown")
         return
 
     # If arguments provided, try to update config
     if len(context.args) != 2:
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ Formato incorrecto. Usa `/config` para ver la configuración actual o `/help` para ver instrucciones.",
             parse_mode="Markdown",
         )
@@ -98,7 +105,8 @@ async def config_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check if parameter exists
     if param not in ALLOWED_PARAMS:
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ Parámetro no válido. Usa `/help` para ver los parámetros disponibles.",
             parse_mode="Markdown",
         )
@@ -138,27 +146,29 @@ async def config_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         f"La longitud debe estar entre {ALLOWED_PARAMS[param]['min_length']} y {ALLOWED_PARAMS[param]['max_length']} caracteres"
                     )
 
-        # Get current config and update it
-        config = await db.get_user_config(
-            user_id, ReplicateService.default_params.copy()
-        )
+        # Update the config snapshot read at the start of the command
         config[param] = value
         await db.set_user_config(user_id, config)
+        if param in ("trigger_word", "gender"):
+            prompt_pool.warm(config)
 
         # Show success message with updated value
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             f"✅ Configuración actualizada: `{param}` = `{value}`",
             parse_mode="Markdown",
         )
 
     except ValueError as e:
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             f"❌ Error: {str(e)}. Usa `/help` para más información.",
             parse_mode="Markdown",
         )
     except Exception as e:
         logging.error(f"Error updating config: {str(e)}", exc_info=True)
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ Error inesperado al actualizar la configuración.",
             parse_mode="Markdown",
         )
@@ -1,6 +1,7 @@
 import logging
 from telegram import Update
 from telegram.ext import CallbackContext
+from ..utils.rate_limiter import reply_text
 
 async def error_handler(update: object, context: CallbackContext) -> None:
     """
@@ -44,7 +45,7 @@ async def error_handler(update: object, context: CallbackContext) -> None:
         error_message = "Ocurrió un error al procesar tu solicitud. Por favor, intenta nuevamente más tarde."
         try:
             # Send user-friendly error message
-            await update.effective_message.reply_text(error_message)
+            await reply_text(update.effective_message, error_message)
             logging.info(f"Error message sent to user in chat_id: {update.effective_chat.id}")
         except Exception as e:
             logging.error(f"Failed to send error message to user: {e}", exc_info=True)
@@ -1,23 +1,46 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from ..services.replicate_service import ReplicateService
-from ..services.openai_service import generate_prompts
+from ..services.prompt_pool import prompt_pool
+from ..services.job_queue import (
+    GENERATE_IMAGE,
+    job_queue,
+    new_batch_id,
+    show_batch_progress,
+)
+from ..services.circuit_breaker import (
+    first_open,
+    openai_breaker,
+    replicate_breaker,
+    unavailable_message,
+)
 import logging
 from ..utils.decorators import require_configured
-from ..utils.database import db
+from ..utils.metrics import instrument_handler
+from ..utils.tracing import current_traceparent, set_span_attributes, traced
+from ..utils.rate_limiter import delete_message, reply_text
+from ..utils.message_utils import BatchProgress, MediaGroupBatcher
 import asyncio
 import re
+import time
 from ..services.prompt_styles.manager import style_manager
 
 
+@instrument_handler("generate")
+@traced("generate_handler")
 @require_configured
-async def generate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def generate_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict
+):
     """
     Handles concurrent image generation from text prompt.
     Supports multiple modes:
     1. Single prompt mode: /generate [prompt] - Generates num_outputs images of the same prompt
     2. Batch mode with styles: /generate [number] styles=style1,style2 - Generates images with specified styles
     3. Batch mode default: /generate [number] - Generates images with user's default style
+
+    The config snapshot comes from require_configured and is shared by every
+    image of the command, so the user config is read only once.
     """
     user_id = update.effective_user.id
     username = update.effective_user.username or "Unknown"
@@ -32,26 +55,37 @@ async def generate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if not text:
         logging.warning(f"Empty input received - User: {user_id}")
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "Por favor, proporciona un prompt o un número para generar imágenes."
         )
         return
 
     try:
-        # Get user config
-        config = await db.get_user_config(
-            user_id, ReplicateService.default_params.copy()
-        )
         trigger_word = config.get("trigger_word")
         default_style = config.get("style", "professional")
 
         # Parse command
         mode, params = parse_generate_command(text, trigger_word, default_style)
+        set_span_attributes(user_id=user_id, mode=mode, images=params.get("num_outputs", 0))
+
+        # Fail fast instead of queueing a whole batch against a dead upstream
+        if mode != "invalid":
+            needed = [replicate_breaker(config["model_endpoint"])]
+            if mode != "batch_direct_prompt":
+                needed.append(openai_breaker())
+            breaker = first_open(*needed)
+            if breaker:
+                logging.warning(
+                    f"Rejecting /generate for user {user_id}: circuit '{breaker.name}' is open"
+                )
+                await reply_text(update.message, unavailable_message(breaker))
+                return
 
         # Handle based on mode
         if mode == "batch_direct_prompt":
             await handle_batch_direct_prompt(
-                update, params["prompt"], params["num_outputs"]
+                update, params["prompt"], params["num_outputs"], config
             )
         elif mode == "batch_styles":
             await handle_batch_styles(
@@ -60,14 +94,20 @@ async def generate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 params["styles"],
                 trigger_word,
                 config.get("gender", "male"),
+                config,
             )
         elif mode == "batch_default_style":
             gender = config.get("gender", "male")
             await handle_batch_default_style(
-                update, params["num_outputs"], trigger_word, default_style, gender
+                update,
+                params["num_outputs"],
+                trigger_word,
+                default_style,
+                gender,
+                config,
             )
         elif mode == "invalid":
-            await update.message.reply_text(f"{params['reason']}")
+            await reply_text(update.message, f"{params['reason']}")
             return
 
     except Exception as e:
@@ -78,7 +118,8 @@ async def generate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "max_limit": "❌ Máximo 50 imágenes por comando",
             "style_syntax": "❌ Formato incorrecto para styles. Usa styles=estilo1,estilo2",
         }
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             error_messages.get(str(e), "❌ Error desconocido")
         )
 
@@ -129,30 +170,67 @@ def parse_generate_command(
     return "batch_default_style", {"num_outputs": num_outputs, "styles": ["random"]}
 
 
-async def handle_batch_direct_prompt(update: Update, prompt: str, num_outputs: int):
-    status = await update.message.reply_text(f"⏳ Generando {num_outputs} imágenes...")
+async def handle_batch_direct_prompt(
+    update: Update, prompt: str, num_outputs: int, config: dict
+):
+    status = await reply_text(update.message, f"⏳ Generando {num_outputs} imágenes...")
+    if job_queue is not None:
+        # Workers generate and deliver the images and finish the batch
+        batch_id = new_batch_id()
+        await job_queue.create_batch(batch_id, num_outputs)
+        try:
+            await job_queue.enqueue_many(
+                GENERATE_IMAGE,
+                [generation_job(update, status, prompt, config) for _ in range(num_outputs)],
+                batch_id,
+            )
+        except Exception:
+            await fail_unqueued(status, batch_id, num_outputs)
+            raise
+        logging.info(
+            f"[User {update.effective_user.id}] {num_outputs} trabajos encolados (batch {batch_id})"
+        )
+        return
+
+    progress = BatchProgress(status, num_outputs)
+    timer = BatchTimer(update.effective_user.id, num_outputs, progress)
+    timer.mark_prompts()
+    delivery = MediaGroupBatcher(update.message)
 
     try:
         async with asyncio.TaskGroup() as tg:
             [
                 tg.create_task(
-                    ReplicateService.generate_image(
-                        prompt,
-                        user_id=update.effective_user.id,
-                        message=update.message,
-                        operation_type="batch",
+                    timer.track(
+                        ReplicateService.generate_image(
+                            prompt,
+                            user_id=update.effective_user.id,
+                            message=update.message,
+                            operation_type="batch",
+                            config=config,
+                            delivery=delivery,
+                        )
                     )
                 )
                 for _ in range(num_outputs)
             ]
     except ExceptionGroup as e:
         logging.error(f"Error en batch directo: {str(e)}")
+    finally:
+        await delivery.close()
+        await progress.close()
 
-    await status.delete()
+    timer.log_summary()
+    await delete_message(status)
 
 
 async def handle_batch_styles(
-    update: Update, num_outputs: int, styles: list, trigger_word: str, gender: str
+    update: Update,
+    num_outputs: int,
+    styles: list,
+    trigger_word: str,
+    gender: str,
+    config: dict,
 ):
     user_id = update.effective_user.id
     logging.info(f"[User {user_id}] Iniciando generación con estilos: {styles}")
@@ -169,7 +247,7 @@ async def handle_batch_styles(
         logging.warning(
             f"[User {user_id}] No se encontraron estilos válidos en: {styles}"
         )
-        await update.message.reply_text("❌ Ningún estilo válido encontrado")
+        await reply_text(update.message, "❌ Ningún estilo válido encontrado")
         return
 
     # Calcular imágenes por estilo
@@ -181,64 +259,261 @@ async def handle_batch_styles(
         f"{len(valid_styles)} estilos x {images_per_style} imágenes = {total_images} total"
     )
 
-    status = await update.message.reply_text(
+    status = await reply_text(
+        update.message,
         f"⏳ Generando {total_images} imágenes ({len(valid_styles)} estilos)..."
     )
 
+    if job_queue is not None:
+        await enqueue_style_batches(
+            update, status, valid_styles, images_per_style, trigger_word, gender, config
+        )
+        return
+
+    progress = BatchProgress(status, total_images)
+    timer = BatchTimer(user_id, total_images, progress)
+    delivery = MediaGroupBatcher(update.message)
+
     try:
+        # Pipeline: every style requests its prompts concurrently and starts its
+        # Replicate jobs as soon as its own prompts arrive
         async with asyncio.TaskGroup() as tg:
             for style in valid_styles:
-                logging.debug(f"[User {user_id}] Procesando estilo: {style}")
-
-                # Generar prompts para cada estilo
-                logging.info(
-                    f"[User {user_id}] Generando {images_per_style} prompts para estilo: {style}"
-                )
-                prompts = await generate_prompts(
-                    images_per_style, trigger_word, style=style, gender=gender
-                )
-
-                logging.debug(
-                    f"[User {user_id}] Prompts generados para {style}: {len(prompts)}"
-                )
-                if prompts:
-                    logging.debug(
-                        f"[User {user_id}] Ejemplo de prompt ({style}): {prompts[0][:100]}..."
+                tg.create_task(
+                    generate_style_batch(
+                        tg,
+                        update,
+                        style,
+                        images_per_style,
+                        trigger_word,
+                        gender,
+                        config,
+                        timer,
+                        delivery,
                     )
-
-                # Crear tareas para cada prompt
-                logging.info(
-                    f"[User {user_id}] Creando {len(prompts)} tareas de generación para {style}"
                 )
-                [
-                    tg.create_task(
-                        ReplicateService.generate_image(
-                            p,
-                            user_id=user_id,
-                            message=update.message,
-                            operation_type="batch",
-                        )
-                    )
-                    for p in prompts
-                ]
 
             logging.info(
-                f"[User {user_id}] Total de tareas creadas: {len(valid_styles) * images_per_style}"
+                f"[User {user_id}] Pipeline iniciado para {len(valid_styles)} estilos"
             )
 
     except ExceptionGroup as e:
         logging.error(
             f"[User {user_id}] Error en generación por estilos: {str(e)}", exc_info=True
         )
-        await update.message.reply_text("⚠️ Algunas imágenes fallaron en la generación")
+        await reply_text(update.message, "⚠️ Algunas imágenes fallaron en la generación")
+    finally:
+        await delivery.close()
+        await progress.close()
 
-    await status.delete()
+    timer.log_summary()
+    await delete_message(status)
     logging.info(
         f"[User {user_id}] Generación completada - {total_images} imágenes procesadas"
     )
 
 
+async def generate_style_batch(
+    tg: asyncio.TaskGroup,
+    update: Update,
+    style: str,
+    images_per_style: int,
+    trigger_word: str,
+    gender: str,
+    config: dict,
+    timer: "BatchTimer",
+    delivery: MediaGroupBatcher,
+):
+    """
+    Streams the prompts for a single style from the prompt pool and schedules
+    one image task per prompt in the shared TaskGroup as each chunk arrives,
+    without waiting for the rest of the chunks or the other styles.
+    Finished images are handed to the batch's shared album batcher.
+    """
+    user_id = update.effective_user.id
+    logging.info(
+        f"[User {user_id}] Generando {images_per_style} prompts para estilo: {style}"
+    )
+    submitted = 0
+    # Start each chunk's images as soon as its prompts arrive
+    async for prompts in prompt_pool.stream(
+        user_id, style, gender, trigger_word, images_per_style
+    ):
+        timer.mark_prompts()
+        logging.info(
+            f"[User {user_id}] Creando {len(prompts)} tareas de generación para {style}"
+        )
+        logging.debug(
+            f"[User {user_id}] Ejemplo de prompt ({style}): {prompts[0][:100]}..."
+        )
+        for p in prompts:
+            tg.create_task(
+                timer.track(
+                    ReplicateService.generate_image(
+                        p,
+                        user_id=user_id,
+                        message=update.message,
+                        operation_type="batch",
+                        config=config,
+                        style=style,
+                        delivery=delivery,
+                    )
+                )
+            )
+        submitted += len(prompts)
+
+    logging.debug(f"[User {user_id}] Prompts generados para {style}: {submitted}")
+    if submitted < images_per_style:
+        # Images without a prompt will never run, count them as failed now
+        timer.skip(images_per_style - submitted)
+
+
+async def fail_unqueued(status, batch_id: str, count: int):
+    """
+    Count images that never reached the queue as failed, so the batch can
+    still finish and whoever counts its last image removes the status message.
+    """
+    if count <= 0:
+        return
+    try:
+        counts = await job_queue.record_batch(batch_id, 0, count)
+        await show_batch_progress(job_queue, status, batch_id, counts)
+    except Exception as e:
+        logging.error(f"Error closing batch {batch_id}: {e}", exc_info=True)
+
+
+def generation_job(
+    update: Update, status, prompt: str, config: dict, style: str = None
+) -> dict:
+    """Job payload for one image, with what a worker needs to reply to the chat"""
+    return {
+        "prompt": prompt,
+        "user_id": update.effective_user.id,
+        "chat_id": update.effective_chat.id,
+        "chat_type": update.effective_chat.type,
+        "message_id": update.message.message_id,
+        "status_message_id": status.message_id,
+        "config": config,
+        "style": style,
+        # Workers continue the command's trace
+        "traceparent": current_traceparent(),
+    }
+
+
+async def enqueue_style_batches(
+    update: Update,
+    status,
+    styles: list,
+    images_per_style: int,
+    trigger_word: str,
+    gender: str,
+    config: dict,
+):
+    """
+    Queued counterpart of the inline pipeline: streams every style's prompts
+    and enqueues one job per prompt as each chunk arrives. Workers deliver the
+    images and whoever finishes the last one removes the status message.
+    """
+    user_id = update.effective_user.id
+    batch_id = new_batch_id()
+    total = images_per_style * len(styles)
+    await job_queue.create_batch(batch_id, total)
+    # Jobs actually enqueued, whether a style ran out of prompts or failed
+    enqueued = 0
+
+    async def enqueue_style(style: str):
+        nonlocal enqueued
+        async for prompts in prompt_pool.stream(
+            user_id, style, gender, trigger_word, images_per_style
+        ):
+            await job_queue.enqueue_many(
+                GENERATE_IMAGE,
+                [generation_job(update, status, p, config, style) for p in prompts],
+                batch_id,
+            )
+            enqueued += len(prompts)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for style in styles:
+                tg.create_task(enqueue_style(style))
+        logging.info(f"[User {user_id}] Trabajos encolados para {styles} (batch {batch_id})")
+    except ExceptionGroup as e:
+        logging.error(
+            f"[User {user_id}] Error encolando la generación: {str(e)}", exc_info=True
+        )
+        await reply_text(update.message, "⚠️ Algunas imágenes fallaron en la generación")
+    finally:
+        # Images without a prompt or a job will never be counted by a worker
+        await fail_unqueued(status, batch_id, total - enqueued)
+
+
+class BatchTimer:
+    """
+    Records per-stage timing for a generation batch: time until the first
+    prompts are available, time-to-first-image and time-to-last-image.
+    Outcomes are also forwarded to the batch's live progress message.
+    """
+
+    def __init__(self, user_id: int, total_images: int, progress=None):
+        self.user_id = user_id
+        self.progress = progress
+        self.total_images = total_images
+        self.started_at = time.monotonic()
+        self.first_prompts_at = None
+        self.first_image_at = None
+        self.last_image_at = None
+        self.completed = 0
+        self.failed = 0
+
+    def mark_prompts(self):
+        if self.first_prompts_at is None:
+            self.first_prompts_at = time.monotonic()
+
+    async def track(self, generation):
+        """Await an image generation and record when it finished"""
+        image_url, input_params = await generation
+        if image_url:
+            now = time.monotonic()
+            if self.first_image_at is None:
+                self.first_image_at = now
+            self.last_image_at = now
+            self.completed += 1
+        else:
+            self.failed += 1
+        if self.progress:
+            self.progress.report(bool(image_url))
+        return image_url, input_params
+
+    def skip(self, count: int):
+        """Record images that were planned but never started"""
+        self.failed += count
+        if self.progress:
+            self.progress.report(False, count)
+
+    def elapsed(self, timestamp) -> str:
+        if timestamp is None:
+            return "n/a"
+        return f"{timestamp - self.started_at:.2f}s"
+
+    def log_summary(self):
+        logging.info(
+            f"[User {self.user_id}] Batch timing - "
+            f"first_prompts: {self.elapsed(self.first_prompts_at)}, "
+            f"first_image: {self.elapsed(self.first_image_at)}, "
+            f"last_image: {self.elapsed(self.last_image_at)}, "
+            f"ok: {self.completed}, failed: {self.failed}, total: {self.total_images}"
+        )
+
+
 async def handle_batch_default_style(
-    update: Update, num_outputs: int, trigger_word: str, default_style: str, gender: str
+    update: Update,
+    num_outputs: int,
+    trigger_word: str,
+    default_style: str,
+    gender: str,
+    config: dict,
 ):
-    await handle_batch_styles(update, num_outputs, ["random"], trigger_word, gender)
+    await handle_batch_styles(
+        update, num_outputs, ["random"], trigger_word, gender, config
+    )
@@ -2,13 +2,16 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import logging
 from ..utils.decorators import require_configured
+from ..utils.rate_limiter import reply_text
 from ..services.prompt_styles.manager import style_manager
 from ..services.replicate_service import ReplicateService
 from ..handlers.config_handler import ALLOWED_PARAMS
 
 
 @require_configured
-async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def help_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict = None
+):
     """
     Handle the /help command.
     Shows comprehensive usage information, commands, configurations, and features.
@@ -163,14 +166,16 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Send each section as a separate message with better error handling
     for i, message in enumerate(messages, 1):
         try:
-            await update.message.reply_text(
+            await reply_text(
+                update.message,
                 message, parse_mode="Markdown", disable_web_page_preview=True
             )
         except Exception as e:
             logging.error(f"Error sending help message section {i}: {str(e)}")
             # Only send error message if it's the first failed message
             if i == 1:
-                await update.message.reply_text(
+                await reply_text(
+                    update.message,
                     "❌ Error al mostrar la ayuda. Por favor, intenta de nuevo más tarde o contacta al administrador."
                 )
             # Continue sending remaining messages even if one fails
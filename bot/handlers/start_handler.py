@@ -3,6 +3,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 import logging
+from ..utils.rate_limiter import reply_text
 
 
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -47,7 +48,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         logging.info(f"Sending welcome message to user {user_id}")
-        await update.message.reply_text(welcome_text, parse_mode="Markdown")
+        await reply_text(update.message, welcome_text, parse_mode="Markdown")
         logging.info(f"Welcome message sent successfully to user {user_id}")
 
     except Exception as e:
@@ -55,6 +56,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Error sending welcome message to user {user_id} in chat {chat_id}: {str(e)}",
             exc_info=True,
         )
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ Error al mostrar el mensaje de bienvenida. Por favor, intenta nuevamente con /start."
         )
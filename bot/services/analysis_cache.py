@@ -0,0 +1,117 @@
+import hashlib
+import logging
+
+from ..utils.database import db
+from ..utils.metrics import CallbackMetric
+
+
+def prompt_version(prompt: str, model: str) -> str:
+    """Short fingerprint of the analysis prompt and model, part of every key"""
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of image analysis descriptions, stored in SQLite.
+    A photo is looked up first by Telegram's file_unique_id, which skips the
+    download too, then by a hash of the downloaded bytes, which catches the
+    same image re-uploaded under a new file. Keeps hit and saved-latency
+    counters for metrics.
+    """
+
+    def __init__(self):
+        self.file_hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._stored = 0
+        self._miss_seconds = 0.0
+
+    @staticmethod
+    def file_key(file_unique_id: str, trigger_word: str, version: str) -> str:
+        return f"file:{file_unique_id}:{trigger_word}:{version}"
+
+    @staticmethod
+    def content_key(digest: str, trigger_word: str, version: str) -> str:
+        return f"sha256:{digest}:{trigger_word}:{version}"
+
+    def _average_miss_seconds(self) -> float:
+        return self._miss_seconds / self._stored if self._stored else 0.0
+
+    async def get_by_file(self, file_unique_id, trigger_word, version):
+        description = await db.get_cached_analysis(
+            self.file_key(file_unique_id, trigger_word, version)
+        )
+        if description is not None:
+            self.file_hits += 1
+            self.saved_seconds += self._average_miss_seconds()
+            logging.info(f"Analysis cache hit for file {file_unique_id}")
+        return description
+
+    async def get_by_content(self, digest, file_unique_id, trigger_word, version):
+        description = await db.get_cached_analysis(
+            self.content_key(digest, trigger_word, version)
+        )
+        if description is not None:
+            self.content_hits += 1
+            self.saved_seconds += self._average_miss_seconds()
+            logging.info(f"Analysis cache hit for content {digest[:12]}")
+            # Remember the new file id so the next resend skips the download
+            await db.save_cached_analysis(
+                [self.file_key(file_unique_id, trigger_word, version)], description
+            )
+        else:
+            # Counted here, not in store(): the vision call may still fail or
+            # be refused, and the lookup missed all the same
+            self.misses += 1
+        return description
+
+    async def store(
+        self, digest, file_unique_id, trigger_word, version, description, seconds
+    ):
+        """Save a fresh description; `seconds` is what producing it cost"""
+        self._stored += 1
+        self._miss_seconds += seconds
+        await db.save_cached_analysis(
+            [
+                self.file_key(file_unique_id, trigger_word, version),
+                self.content_key(digest, trigger_word, version),
+            ],
+            description,
+        )
+
+    def stats(self) -> dict:
+        hits = self.file_hits + self.content_hits
+        lookups = hits + self.misses
+        return {
+            "file_hits": self.file_hits,
+            "content_hits": self.content_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+analysis_cache = AnalysisCache()
+
+CallbackMetric(
+    "analysis_cache_lookups_total",
+    "Image analysis lookups by result",
+    lambda: {
+        ("file_hit",): analysis_cache.file_hits,
+        ("content_hit",): analysis_cache.content_hits,
+        ("miss",): analysis_cache.misses,
+    },
+    ["result"],
+    type="counter",
+)
+CallbackMetric(
+    "analysis_cache_saved_seconds_total",
+    "Estimated image analysis time saved by cache hits",
+    lambda: analysis_cache.saved_seconds,
+    type="counter",
+)
@@ -0,0 +1,214 @@
+import logging
+import os
+import time
+
+from ..utils.metrics import CallbackMetric
+from .retry import is_retryable, status_code_of
+
+# Consecutive failures that open a breaker
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+# Seconds an open breaker waits before letting a probe call through
+RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# Probe calls allowed at once while half-open
+HALF_OPEN_MAX_CALLS = 1
+
+# Statuses meaning the endpoint itself is unusable (missing model, bad credentials)
+ENDPOINT_FAILURE_STATUSES = {401, 403, 404}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    """
+    Only upstream health problems trip a breaker; a prediction rejected by the
+    model or a malformed request says nothing about the endpoint being down.
+    """
+    return is_retryable(exc) or status_code_of(exc) in ENDPOINT_FAILURE_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker. After `failure_threshold`
+    consecutive failures calls fail fast with CircuitOpenError for
+    `reset_timeout` seconds; then a limited number of probe calls decide
+    whether to close the circuit again or re-open it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        half_open_max_calls: int = HALF_OPEN_MAX_CALLS,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.retry_in() <= 0:
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected without reaching the upstream"""
+        state = self.state
+        return state == self.OPEN or (
+            state == self.HALF_OPEN and self._probes >= self.half_open_max_calls
+        )
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        logging.warning(f"Circuit '{self.name}': {self._state} -> {state}")
+        self._state = state
+        self._probes = 0
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def before_call(self) -> bool:
+        """Raise if the call must be rejected; True if it took a probe slot"""
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError(self.name, self.retry_in())
+        if state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probes += 1
+            return True
+        return False
+
+    def release_probe(self, times_opened: int):
+        """
+        Give back a probe slot whose call ended without an outcome (cancelled),
+        unless the breaker has moved on to another half-open period since.
+        """
+        if self._state == self.HALF_OPEN and self.times_opened == times_opened:
+            self._probes = max(0, self._probes - 1)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if (
+            self._state == self.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            self._transition(self.OPEN)
+
+    async def call(self, operation):
+        """Await `operation()` through the breaker"""
+        times_opened = self.times_opened
+        probe = self.before_call()
+        try:
+            result = await operation()
+        except Exception as e:
+            if counts_as_failure(e):
+                self.record_failure()
+            elif self._state == self.HALF_OPEN:
+                # The probe reached the upstream, so it is healthy again
+                self.record_success()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the upstream, but a probe must not keep
+            # its slot or the breaker stays half-open and rejects everything
+            if probe:
+                self.release_probe(times_opened)
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "retry_in": self.retry_in(),
+        }
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates one breaker per upstream key"""
+
+    def __init__(self):
+        self._breakers = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name)
+        return breaker
+
+    def snapshot(self) -> dict:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+
+breakers = CircuitBreakerRegistry()
+
+BREAKER_STATE_VALUES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
+CallbackMetric(
+    "circuit_breaker_state",
+    "0 closed, 1 half open, 2 open",
+    lambda: {
+        (name,): BREAKER_STATE_VALUES[snapshot["state"]]
+        for name, snapshot in breakers.snapshot().items()
+    },
+    ["breaker"],
+)
+
+
+def openai_breaker() -> CircuitBreaker:
+    return breakers.get("openai")
+
+
+def replicate_breaker(model_endpoint: str) -> CircuitBreaker:
+    return breakers.get(f"replicate:{model_endpoint}")
+
+
+def first_open(*candidates: CircuitBreaker):
+    """Return the first breaker that would reject a call right now, if any"""
+    for breaker in candidates:
+        if breaker.is_open():
+            return breaker
+    return None
+
+
+def unavailable_message(breaker: CircuitBreaker) -> str:
+    """User-facing notice for a call rejected by an open breaker"""
+    service = "OpenAI" if breaker.name == "openai" else "generación de imágenes"
+    seconds = int(breaker.retry_in()) + 1
+    return (
+        f"⛔ El servicio de {service} no está disponible ahora mismo. "
+        f"Inténtalo de nuevo en ~{seconds} s."
+    )
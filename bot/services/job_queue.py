@@ -0,0 +1,695 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from ..utils.database import db, utc_timestamp
+from ..utils.message_utils import PROGRESS_EDIT_INTERVAL, progress_text
+from ..utils.rate_limiter import BULK, delete_message, edit_text
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional, only needed for JOB_QUEUE_BACKEND=redis
+    redis = None
+
+# "" runs generations inline in the bot process; "sqlite" or "redis" hands
+# them to worker processes (python worker.py) through a shared queue
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Seconds a claimed job stays invisible to other workers; workers renew the
+# lease while the job runs, so it only expires when the worker dies
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+# Claims per job, a job whose worker keeps dying is given up after this many
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Delay before a job handed back by a failing worker is visible again
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# Seconds Redis keeps the counters of a batch that never finishes
+JOB_BATCH_TTL = int(os.getenv("JOB_BATCH_TTL", str(7 * 24 * 3600)))
+
+GENERATE_IMAGE = "generate_image"
+
+
+class Job:
+    """A claimed job, as handed to a worker"""
+
+    __slots__ = ("id", "kind", "payload", "batch_id", "attempts", "max_attempts")
+
+    def __init__(self, id, kind, payload, batch_id, attempts, max_attempts):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.batch_id = batch_id
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+    @property
+    def exhausted(self) -> bool:
+        """Claimed more times than allowed, i.e. earlier leases expired"""
+        return self.attempts > self.max_attempts
+
+
+class JobQueue(ABC):
+    """
+    At-least-once job queue shared by the bot and its workers. claim() leases
+    jobs to a worker; a job is only removed by complete(), so one whose worker
+    dies becomes visible again once its lease expires. Batches count finished
+    jobs, in the same transaction that removes them, so whoever finishes the
+    last one can close the batch.
+    """
+
+    @abstractmethod
+    async def enqueue_many(self, kind: str, payloads: list, batch_id: str = None):
+        """Queue one job of `kind` per payload, as part of `batch_id` if given"""
+
+    @abstractmethod
+    async def claim(self, owner: str, limit: int, lease: float = JOB_LEASE_SECONDS) -> list:
+        """Lease up to `limit` visible jobs to `owner`"""
+
+    @abstractmethod
+    async def extend(self, owner: str, job_ids: list, lease: float = JOB_LEASE_SECONDS):
+        """Renew the leases `owner` still holds on `job_ids`"""
+
+    @abstractmethod
+    async def complete(self, job: Job, owner: str, ok: bool = True):
+        """
+        Remove a finished job and count it in its batch as succeeded or failed.
+        Returns the batch's (succeeded, failed, total), or None if the job has
+        no batch or the lease was lost meanwhile (someone else will count it).
+        """
+
+    @abstractmethod
+    async def fail(self, job: Job, owner: str, error: str, retry: bool = True):
+        """
+        Hand a job back. It becomes visible again after JOB_RETRY_DELAY when
+        `retry` is set and it has attempts left; otherwise it is kept as failed
+        and counted in its batch, whose (succeeded, failed, total) is returned.
+        Returns None when the job was requeued or the lease was lost.
+        """
+
+    @abstractmethod
+    async def create_batch(self, batch_id: str, total: int):
+        """Start counting the `total` jobs of a batch"""
+
+    @abstractmethod
+    async def record_batch(self, batch_id: str, succeeded: int, failed: int) -> tuple:
+        """Add finished jobs to a batch, returns its (succeeded, failed, total)"""
+
+    @abstractmethod
+    async def finish_batch(self, batch_id: str):
+        """Drop the counters of a batch whose jobs have all been counted"""
+
+    @abstractmethod
+    async def claim_progress_edit(self, batch_id: str, interval: float):
+        """
+        Take the turn to edit an unfinished batch's status message, unless it
+        was edited (or the batch started) less than `interval` seconds ago.
+        Returns the batch's (succeeded, failed, total, started_at) if granted,
+        None otherwise; at most one process is granted a turn per interval.
+        """
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        """Number of queued, running and failed jobs"""
+
+    async def close(self):
+        pass
+
+
+# Fair claim order: every user's oldest job first, then everyone's second
+# oldest and so on, so a large batch doesn't hold back other users' jobs
+CLAIM_JOBS_SQL = """
+    UPDATE jobs SET
+        status = 'running',
+        lease_owner = ?,
+        lease_expires_at = ?,
+        attempts = attempts + 1,
+        updated_at = ?
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS turn
+            FROM jobs
+            WHERE (status = 'queued' AND available_at <= ?)
+               OR (status = 'running' AND lease_expires_at <= ?)
+        )
+        ORDER BY turn, id
+        LIMIT ?
+    )
+    RETURNING id, kind, payload, batch_id, attempts, max_attempts
+"""
+
+INSERT_JOB_SQL = """
+    INSERT INTO jobs
+    (kind, payload, batch_id, user_id, status, attempts, max_attempts,
+     available_at, created_at, updated_at)
+    VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+"""
+
+EXTEND_JOBS_SQL = """
+    UPDATE jobs SET lease_expires_at = ?
+    WHERE lease_owner = ? AND status = 'running'
+      AND id IN (SELECT value FROM json_each(?))
+"""
+
+COMPLETE_JOB_SQL = "DELETE FROM jobs WHERE id = ? AND lease_owner = ?"
+
+FAIL_JOB_SQL = """
+    UPDATE jobs SET
+        status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+        available_at = ?,
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        last_error = ?,
+        updated_at = ?
+    WHERE id = ? AND lease_owner = ?
+    RETURNING status
+"""
+
+INSERT_BATCH_SQL = """
+    INSERT OR REPLACE INTO job_batches
+    (batch_id, total, succeeded, failed, created_at, started_at)
+    VALUES (?, ?, 0, 0, ?, ?)
+"""
+
+RECORD_BATCH_SQL = """
+    UPDATE job_batches SET succeeded = succeeded + ?, failed = failed + ?
+    WHERE batch_id = ?
+    RETURNING succeeded, failed, total
+"""
+
+CLAIM_PROGRESS_EDIT_SQL = """
+    UPDATE job_batches SET progress_edited_at = ?
+    WHERE batch_id = ? AND succeeded + failed < total
+      AND COALESCE(progress_edited_at, started_at, 0) <= ?
+    RETURNING succeeded, failed, total, started_at
+"""
+
+DELETE_BATCH_SQL = "DELETE FROM job_batches WHERE batch_id = ?"
+
+COUNT_JOBS_SQL = "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Queue in the bot's SQLite database (migration create_job_queue). Works
+    for several worker processes on one host; claims are single UPDATE
+    statements, which SQLite serializes across processes.
+    """
+
+    def __init__(self, database=db):
+        self.db = database
+
+    async def enqueue_many(self, kind: str, payloads: list, batch_id: str = None):
+        now = utc_timestamp()
+        available_at = time.time()
+        async with self.db.pool.acquire() as conn:
+            await conn.executemany(
+                INSERT_JOB_SQL,
+                [
+                    (
+                        kind,
+                        json.dumps(payload),
+                        batch_id,
+                        payload.get("user_id"),
+                        JOB_MAX_ATTEMPTS,
+                        available_at,
+                        now,
+                        now,
+                    )
+                    for payload in payloads
+                ],
+            )
+            await conn.commit()
+
+    async def claim(self, owner: str, limit: int, lease: float = JOB_LEASE_SECONDS) -> list:
+        now = time.time()
+        async with self.db.pool.acquire() as conn:
+            async with conn.execute(
+                CLAIM_JOBS_SQL, (owner, now + lease, utc_timestamp(), now, now, limit)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            await conn.commit()
+        return [
+            Job(id, kind, json.loads(payload), batch_id, attempts, max_attempts)
+            for id, kind, payload, batch_id, attempts, max_attempts in rows
+        ]
+
+    async def extend(self, owner: str, job_ids: list, lease: float = JOB_LEASE_SECONDS):
+        async with self.db.pool.acquire() as conn:
+            await conn.execute(
+                EXTEND_JOBS_SQL, (time.time() + lease, owner, json.dumps(list(job_ids)))
+            )
+            await conn.commit()
+
+    async def _record(self, conn, batch_id: str, succeeded: int, failed: int):
+        async with conn.execute(
+            RECORD_BATCH_SQL, (succeeded, failed, batch_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return tuple(row) if row else None
+
+    async def complete(self, job: Job, owner: str, ok: bool = True):
+        async with self.db.pool.acquire() as conn:
+            cursor = await conn.execute(COMPLETE_JOB_SQL, (job.id, owner))
+            if cursor.rowcount == 0:
+                return None
+            counts = None
+            if job.batch_id:
+                counts = await self._record(conn, job.batch_id, int(ok), int(not ok))
+            await conn.commit()
+        return counts
+
+    async def fail(self, job: Job, owner: str, error: str, retry: bool = True):
+        async with self.db.pool.acquire() as conn:
+            async with conn.execute(
+                FAIL_JOB_SQL,
+                (
+                    retry,
+                    time.time() + JOB_RETRY_DELAY,
+                    error,
+                    utc_timestamp(),
+                    job.id,
+                    owner,
+                ),
+            ) as cursor:
+                row = await cursor.fetchone()
+            counts = None
+            if row and row[0] == "failed" and job.batch_id:
+                counts = await self._record(conn, job.batch_id, 0, 1)
+            await conn.commit()
+        return counts
+
+    async def create_batch(self, batch_id: str, total: int):
+        async with self.db.pool.acquire() as conn:
+            await conn.execute(
+                INSERT_BATCH_SQL, (batch_id, total, utc_timestamp(), time.time())
+            )
+            await conn.commit()
+
+    async def record_batch(self, batch_id: str, succeeded: int, failed: int) -> tuple:
+        async with self.db.pool.acquire() as conn:
+            counts = await self._record(conn, batch_id, succeeded, failed)
+            await conn.commit()
+        return counts or (succeeded, failed, succeeded + failed)
+
+    async def finish_batch(self, batch_id: str):
+        async with self.db.pool.acquire() as conn:
+            await conn.execute(DELETE_BATCH_SQL, (batch_id,))
+            await conn.commit()
+
+    async def claim_progress_edit(self, batch_id: str, interval: float):
+        now = time.time()
+        async with self.db.pool.acquire() as conn:
+            async with conn.execute(
+                CLAIM_PROGRESS_EDIT_SQL, (now, batch_id, now - interval)
+            ) as cursor:
+                row = await cursor.fetchone()
+            await conn.commit()
+        return tuple(row) if row else None
+
+    async def stats(self) -> dict:
+        async with self.db.pool.acquire() as conn:
+            async with conn.execute(COUNT_JOBS_SQL) as cursor:
+                counts = dict(await cursor.fetchall())
+        return {status: counts.get(status, 0) for status in ("queued", "running", "failed")}
+
+
+# Moves expired leases back to their user's ready set, then leases up to
+# ARGV[3] ready jobs in the same fair order as CLAIM_JOBS_SQL: every user's
+# oldest visible job first, then everyone's second oldest and so on.
+# KEYS: users set, leased zset, owners hash. ARGV: now, lease expiry, limit,
+# owner, job hash key prefix, ready zset key prefix (followed by the user id)
+REDIS_CLAIM_SCRIPT = """
+local limit = tonumber(ARGV[3])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    local user = redis.call('HGET', ARGV[5] .. id, 'user_id') or ''
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('ZADD', ARGV[6] .. user, ARGV[1], id)
+    redis.call('SADD', KEYS[1], user)
+end
+local candidates = {}
+for _, user in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    local ids = redis.call('ZRANGEBYSCORE', ARGV[6] .. user, '-inf', ARGV[1], 'LIMIT', 0, limit)
+    for turn, id in ipairs(ids) do
+        table.insert(candidates, {turn, tonumber(id), id, user})
+    end
+end
+table.sort(candidates, function(a, b)
+    if a[1] ~= b[1] then
+        return a[1] < b[1]
+    end
+    return a[2] < b[2]
+end)
+local claimed = {}
+for i = 1, math.min(limit, #candidates) do
+    local id, user = candidates[i][3], candidates[i][4]
+    local key = ARGV[5] .. id
+    redis.call('ZREM', ARGV[6] .. user, id)
+    if redis.call('ZCARD', ARGV[6] .. user) == 0 then
+        redis.call('SREM', KEYS[1], user)
+    end
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+    redis.call('HSET', KEYS[3], id, ARGV[4])
+    redis.call('HINCRBY', key, 'attempts', 1)
+    redis.call('HSET', key, 'status', 'running')
+    table.insert(claimed, {id, unpack(redis.call(
+        'HMGET', key, 'kind', 'payload', 'batch_id', 'attempts', 'max_attempts'))})
+end
+return claimed
+"""
+
+# Counts the job in its batch hash, KEYS[6] (empty when it has no batch)
+REDIS_COUNT_FUNCTION = """
+local function count(field)
+    if KEYS[6] == '' then
+        return 0
+    end
+    redis.call('HINCRBY', KEYS[6], field, 1)
+    return redis.call('HMGET', KEYS[6], 'succeeded', 'failed', 'total')
+end
+"""
+
+# Runs ARGV[3] (complete, fail, requeue or extend) on job ARGV[1] if ARGV[2]
+# still owns its lease. KEYS: the job user's ready zset, leased zset, owners
+# hash, job hash, failed list, batch hash, users set. ARGV[4]: new score,
+# ARGV[5]: error, ARGV[6]: "1" if a completed job succeeded, ARGV[7]: the
+# job's user id. Returns the batch counts when the job was counted
+REDIS_RELEASE_SCRIPT = REDIS_COUNT_FUNCTION + """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+if ARGV[3] == 'extend' then
+    redis.call('ZADD', KEYS[2], 'XX', ARGV[4], ARGV[1])
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if ARGV[3] == 'complete' then
+    redis.call('DEL', KEYS[4])
+    return count(ARGV[6] == '1' and 'succeeded' or 'failed')
+end
+local attempts = tonumber(redis.call('HGET', KEYS[4], 'attempts'))
+local max_attempts = tonumber(redis.call('HGET', KEYS[4], 'max_attempts'))
+redis.call('HSET', KEYS[4], 'last_error', ARGV[5])
+if ARGV[3] == 'requeue' and attempts < max_attempts then
+    redis.call('HSET', KEYS[4], 'status', 'queued')
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+    redis.call('SADD', KEYS[7], ARGV[7])
+    return 0
+end
+redis.call('HSET', KEYS[4], 'status', 'failed')
+redis.call('RPUSH', KEYS[5], ARGV[1])
+return count('failed')
+"""
+
+
+# Grants the turn to edit the progress of batch KEYS[1] if the last edit (or
+# the start) is at least ARGV[2] seconds older than ARGV[1], see
+# JobQueue.claim_progress_edit
+REDIS_CLAIM_PROGRESS_SCRIPT = """
+local batch = redis.call(
+    'HMGET', KEYS[1], 'succeeded', 'failed', 'total', 'started_at', 'progress_edited_at')
+if not batch[3] or tonumber(batch[1]) + tonumber(batch[2]) >= tonumber(batch[3]) then
+    return nil
+end
+if tonumber(ARGV[1]) - tonumber(batch[5] or batch[4] or 0) < tonumber(ARGV[2]) then
+    return nil
+end
+redis.call('HSET', KEYS[1], 'progress_edited_at', ARGV[1])
+return {batch[1], batch[2], batch[3], batch[4] or ''}
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Queue in Redis, for workers spread over several hosts. Visible jobs sit in
+    one sorted set per user, scored by when they become available, with the
+    users that have any in a set; leased jobs sit in another sorted set scored
+    by lease expiry. Scripts move them atomically and claim fairly across
+    users, like the SQLite queue.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "pixelprophet:jobs"):
+        if redis is None:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis requires the redis package")
+        self.client = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.users = f"{prefix}:users"
+        self.leased = f"{prefix}:leased"
+        self.owners = f"{prefix}:owners"
+        self.failed = f"{prefix}:failed"
+        self._claim = self.client.register_script(REDIS_CLAIM_SCRIPT)
+        self._release = self.client.register_script(REDIS_RELEASE_SCRIPT)
+        self._claim_progress = self.client.register_script(REDIS_CLAIM_PROGRESS_SCRIPT)
+
+    def ready_key(self, user_id) -> str:
+        return f"{self.prefix}:ready:{user_id}"
+
+    def job_key(self, job_id) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def batch_key(self, batch_id: str) -> str:
+        return f"{self.prefix}:batch:{batch_id}"
+
+    async def enqueue_many(self, kind: str, payloads: list, batch_id: str = None):
+        if not payloads:
+            return
+        last = await self.client.incrby(f"{self.prefix}:seq", len(payloads))
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            for i, payload in enumerate(payloads):
+                job_id = last - len(payloads) + 1 + i
+                user_id = payload.get("user_id", "")
+                pipe.hset(
+                    self.job_key(job_id),
+                    mapping={
+                        "kind": kind,
+                        "payload": json.dumps(payload),
+                        "batch_id": batch_id or "",
+                        "user_id": user_id,
+                        "attempts": 0,
+                        "max_attempts": JOB_MAX_ATTEMPTS,
+                        "status": "queued",
+                    },
+                )
+                # Members with equal scores sort as strings ("10" before "2"),
+                # a microsecond apart keeps the jobs in order
+                pipe.zadd(self.ready_key(user_id), {job_id: now + i * 1e-6})
+                pipe.sadd(self.users, user_id)
+            await pipe.execute()
+
+    async def claim(self, owner: str, limit: int, lease: float = JOB_LEASE_SECONDS) -> list:
+        now = time.time()
+        rows = await self._claim(
+            keys=[self.users, self.leased, self.owners],
+            args=[
+                now,
+                now + lease,
+                limit,
+                owner,
+                f"{self.prefix}:job:",
+                f"{self.prefix}:ready:",
+            ],
+        )
+        return [
+            Job(
+                int(job_id),
+                kind,
+                json.loads(payload),
+                batch_id or None,
+                int(attempts),
+                int(max_attempts),
+            )
+            for job_id, kind, payload, batch_id, attempts, max_attempts in rows
+        ]
+
+    async def _release_job(
+        self,
+        job_id,
+        owner: str,
+        action: str,
+        batch_id=None,
+        score=0,
+        error="",
+        ok=True,
+        user_id="",
+    ):
+        result = await self._release(
+            keys=[
+                self.ready_key(user_id),
+                self.leased,
+                self.owners,
+                self.job_key(job_id),
+                self.failed,
+                self.batch_key(batch_id) if batch_id else "",
+                self.users,
+            ],
+            args=[job_id, owner, action, score, error, "1" if ok else "0", user_id],
+        )
+        if not result:
+            return None
+        succeeded, failed, total = (int(value or 0) for value in result)
+        return succeeded, failed, total
+
+    async def extend(self, owner: str, job_ids: list, lease: float = JOB_LEASE_SECONDS):
+        expires = time.time() + lease
+        for job_id in job_ids:
+            await self._release_job(job_id, owner, "extend", score=expires)
+
+    async def complete(self, job: Job, owner: str, ok: bool = True):
+        return await self._release_job(job.id, owner, "complete", job.batch_id, ok=ok)
+
+    async def fail(self, job: Job, owner: str, error: str, retry: bool = True):
+        return await self._release_job(
+            job.id,
+            owner,
+            "requeue" if retry else "fail",
+            job.batch_id,
+            score=time.time() + JOB_RETRY_DELAY,
+            error=error,
+            user_id=job.payload.get("user_id", ""),
+        )
+
+    async def create_batch(self, batch_id: str, total: int):
+        key = self.batch_key(batch_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                key,
+                mapping={"total": total, "succeeded": 0, "failed": 0, "started_at": time.time()},
+            )
+            # finish_batch() removes it; this only bounds batches left unfinished
+            pipe.expire(key, JOB_BATCH_TTL)
+            await pipe.execute()
+
+    async def record_batch(self, batch_id: str, succeeded: int, failed: int) -> tuple:
+        key = self.batch_key(batch_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "succeeded", succeeded)
+            pipe.hincrby(key, "failed", failed)
+            pipe.hget(key, "total")
+            succeeded, failed, total = await pipe.execute()
+        return succeeded, failed, int(total or succeeded + failed)
+
+    async def finish_batch(self, batch_id: str):
+        await self.client.delete(self.batch_key(batch_id))
+
+    async def claim_progress_edit(self, batch_id: str, interval: float):
+        row = await self._claim_progress(
+            keys=[self.batch_key(batch_id)], args=[time.time(), interval]
+        )
+        if not row:
+            return None
+        succeeded, failed, total, started_at = row
+        return int(succeeded), int(failed), int(total), float(started_at) if started_at else None
+
+    async def stats(self) -> dict:
+        users = await self.client.smembers(self.users)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in users:
+                pipe.zcard(self.ready_key(user_id))
+            pipe.zcard(self.leased)
+            pipe.llen(self.failed)
+            *queued, running, failed = await pipe.execute()
+        return {"queued": sum(queued), "running": running, "failed": failed}
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_job_queue(backend: str = JOB_QUEUE_BACKEND):
+    """The configured queue, or None when generations run inline"""
+    if not backend:
+        return None
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    if backend == "redis":
+        return RedisJobQueue()
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex
+
+
+# Delayed progress edits this process has scheduled, by batch id
+_trailing_edits = {}
+
+
+async def _edit_progress(
+    queue: JobQueue, status_message, batch_id: str, interval: float
+) -> bool:
+    """Edit the status message if the queue grants this process the turn"""
+    row = await queue.claim_progress_edit(batch_id, interval)
+    if row is None:
+        return False
+    succeeded, failed, total, started_at = row
+    # The start time is shared, so every process shows the same ETA
+    elapsed = time.time() - started_at if started_at else 0.0
+    try:
+        await edit_text(
+            status_message, progress_text(succeeded, failed, total, elapsed), priority=BULK
+        )
+    except Exception as e:
+        logging.warning(f"Failed to update batch progress: {e}")
+    return True
+
+
+async def _edit_progress_later(
+    queue: JobQueue, status_message, batch_id: str, interval: float
+):
+    try:
+        await asyncio.sleep(interval)
+        await _edit_progress(queue, status_message, batch_id, interval)
+    except Exception as e:
+        logging.warning(f"Failed to update batch progress: {e}")
+    finally:
+        _trailing_edits.pop(batch_id, None)
+
+
+async def show_batch_progress(
+    queue: JobQueue,
+    status_message,
+    batch_id: str,
+    counts: tuple,
+    interval: float = PROGRESS_EDIT_INTERVAL,
+) -> bool:
+    """
+    Report the (succeeded, failed, total) counts returned by the queue on a
+    queued batch's status message; whoever counted the last image deletes it
+    and the batch's counters.
+
+    The bot and every worker report on the same message, so the edit cadence
+    is kept in the queue: one process at a time gets the turn to edit, at most
+    once every `interval` seconds. A process that doesn't get it tries once
+    more `interval` seconds later; by then either its count is shown or it
+    edits the message itself, so the last counts are never left unshown.
+
+    Returns:
+        bool: True if the batch is finished
+    """
+    succeeded, failed, total = counts
+    if succeeded + failed < total:
+        edited = await _edit_progress(queue, status_message, batch_id, interval)
+        if not edited and batch_id not in _trailing_edits:
+            _trailing_edits[batch_id] = asyncio.create_task(
+                _edit_progress_later(queue, status_message, batch_id, interval)
+            )
+        return False
+    trailing = _trailing_edits.pop(batch_id, None)
+    if trailing is not None:
+        trailing.cancel()
+    logging.info(
+        f"Queued batch {batch_id} finished - ok: {succeeded}, failed: {failed}, total: {total}"
+    )
+    # A trailing edit still in flight finds no batch and gives up
+    await queue.finish_batch(batch_id)
+    await delete_message(status_message)
+    return True
+
+
+# Shared queue for this process, None when generations run inline
+job_queue = create_job_queue()
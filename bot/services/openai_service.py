@@ -1,29 +1,124 @@
+import asyncio
+import json
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
 import logging
 from ..utils.database import db
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict
 from pydantic import BaseModel
 import random
 from pathlib import Path
 from .prompt_styles.manager import style_manager
+from .retry import OPENAI_RETRY_POLICY, call_with_retry, openai_retry_budget
+from .circuit_breaker import openai_breaker
+from ..utils.tracing import span, traced
 
-# Initialize OpenAI client with API key from environment variables
-# This ensures secure handling of credentials
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Default per-request timeout (seconds) for OpenAI calls, overridable per call
+DEFAULT_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Initialize a single shared async OpenAI client with API key from environment variables
+# This ensures secure handling of credentials and lets every handler reuse the same
+# HTTP connection pool without blocking the event loop. Retries are handled by
+# call_with_retry (shared budget, jitter, deadline), not by the client itself
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"), timeout=DEFAULT_TIMEOUT, max_retries=0
+)
+
+
+def _warm_sdk_resources():
+    """Resolve the lazily imported SDK resources used by the handlers"""
+    client.chat.completions
+    client.beta.chat.completions
+
+
+# The SDK imports its resource modules on first attribute access, which blocked
+# the event loop for about a second on the first /generate; resolve them now
+_warm_sdk_resources()
 
 # Maximum number of prompts that can be generated at once
 MAX_PROMPTS = 50  # Conservative limit based on token limits
 
+# Stream structured output and hand out each prompt as soon as it is complete
+STREAM_PROMPTS = os.getenv("OPENAI_STREAM_PROMPTS", "0") == "1"
+
+# Prompts requested per call when a batch is split into parallel chunks
+PROMPT_CHUNK_SIZE = min(int(os.getenv("PROMPT_CHUNK_SIZE", "10")), MAX_PROMPTS)
+# Chunk requests in flight at once for one batch
+PROMPT_CHUNK_CONCURRENCY = int(os.getenv("PROMPT_CHUNK_CONCURRENCY", "5"))
+# Extra rounds of requests to make up for chunks that came back short
+PROMPT_TOP_UP_ROUNDS = int(os.getenv("PROMPT_TOP_UP_ROUNDS", "2"))
+
 
 class PromptResponse(BaseModel):
     prompts: List[str]
 
 
-def chat_completion(messages, model="gpt-4o", temperature=0.7, max_tokens=None):
+# PromptResponse as a strict JSON schema, for streamed requests which can't
+# use the parse() helper
+PROMPT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "PromptResponse",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"prompts": {"type": "array", "items": {"type": "string"}}},
+            "required": ["prompts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+class PromptArrayParser:
+    """
+    Incremental parser for a streamed {"prompts": ["...", ...]} document.
+    feed() takes text fragments as they arrive and returns the array strings
+    completed by that fragment, so prompts are usable before the JSON ends.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._capture = None
+
+    def feed(self, text: str) -> List[str]:
+        completed = []
+        for char in text:
+            if self._in_string:
+                if self._capture is not None:
+                    self._capture.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._capture is not None:
+                        # Let json decode escapes, the closing quote is captured
+                        completed.append(json.loads('"' + "".join(self._capture)))
+                        self._capture = None
+            elif char == '"':
+                self._in_string = True
+                # Strings directly inside the array are prompts, not keys
+                if self._stack == ["{", "["]:
+                    self._capture = []
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+        return completed
+
+
+async def chat_completion(
+    messages, model="gpt-4o", temperature=0.7, max_tokens=None, timeout=None
+):
     """
     Generic function to make a chat completion request to the OpenAI API.
     Supports both text and vision tasks through message formatting.
+    Cancelling the awaiting task aborts the in-flight HTTP request.
     Args:
         messages: List of dictionaries with chat messages.
                  For vision: Include image_url in the content list.
@@ -33,6 +128,7 @@ def chat_completion(messages, model="gpt-4o", temperature=0.7, max_tokens=None):
                     - 0.7: Balanced creativity (default)
                     - 1.0: Most random/creative
         max_tokens: Maximum number of tokens in the response (optional).
+        timeout: Request timeout in seconds (defaults to OPENAI_TIMEOUT).
     Returns:
         The content of the generated response or None if an error occurs.
     """
@@ -45,11 +141,19 @@ def chat_completion(messages, model="gpt-4o", temperature=0.7, max_tokens=None):
         # Make the API call to OpenAI
         # The create() method handles the actual HTTP request to the OpenAI API
         logging.info("Sending request to OpenAI API")
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens if max_tokens else None,
+        response = await call_with_retry(
+            lambda: openai_breaker().call(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens if max_tokens else None,
+                    timeout=timeout if timeout else DEFAULT_TIMEOUT,
+                )
+            ),
+            name="openai.chat_completion",
+            policy=OPENAI_RETRY_POLICY,
+            budget=openai_retry_budget,
         )
         # Extract and log the response content
         content = response.choices[0].message.content
@@ -66,11 +170,32 @@ def chat_completion(messages, model="gpt-4o", temperature=0.7, max_tokens=None):
         return None
 
 
+def build_prompt_messages(num_prompts, trigger_word, style, gender) -> List[Dict]:
+    """Chat messages asking for `num_prompts` prompts in the given style"""
+    # Get the appropriate style and its system prompt
+    prompt_style = style_manager.get_style(style)
+    logging.info(f"Using style: {prompt_style.name} ({prompt_style.description})")
+
+    system_content = prompt_style.get_system_prompt(
+        trigger_word=trigger_word, gender=gender
+    )
+
+    return [
+        {"role": "system", "content": system_content},
+        {
+            "role": "user",
+            "content": f"Begin by generating {num_prompts} prompts immediately. Each prompt should aim to be around 500 characters long and contain the trigger word: {trigger_word} at the start. Focus on creating highly detailed, descriptive prompts that paint a complete picture of the scene.",
+        },
+    ]
+
+
+@traced("generate_prompts")
 async def generate_prompts(
     num_prompts: int,
     trigger_word: str,
     style: str = "professional",
     gender: str = "male",
+    timeout: float = None,
 ) -> List[str]:
     """
     Generate multiple prompts using OpenAI's GPT-4o model with structured output.
@@ -80,6 +205,7 @@ async def generate_prompts(
         trigger_word: The trigger word to include in each prompt
         style: The style to use for prompts (use "random" for random style)
         gender: The gender to use in prompts ("male" or "female")
+        timeout: Request timeout in seconds (defaults to OPENAI_TIMEOUT)
 
     Returns:
         List of generated prompts or empty list if error occurs
@@ -96,28 +222,22 @@ async def generate_prompts(
     )
 
     try:
-        # Get the appropriate style and its system prompt
-        prompt_style = style_manager.get_style(style)
-        logging.info(f"Using style: {prompt_style.name} ({prompt_style.description})")
-
-        system_content = prompt_style.get_system_prompt(
-            trigger_word=trigger_word, gender=gender
-        )
-
-        messages = [
-            {"role": "system", "content": system_content},
-            {
-                "role": "user",
-                "content": f"Begin by generating {num_prompts} prompts immediately. Each prompt should aim to be around 500 characters long and contain the trigger word: {trigger_word} at the start. Focus on creating highly detailed, descriptive prompts that paint a complete picture of the scene.",
-            },
-        ]
+        messages = build_prompt_messages(num_prompts, trigger_word, style, gender)
 
         # Make the API call with structured output
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=messages,
-            temperature=1.0,
-            response_format=PromptResponse,
+        response = await call_with_retry(
+            lambda: openai_breaker().call(
+                lambda: client.beta.chat.completions.parse(
+                    model="gpt-4o",
+                    messages=messages,
+                    temperature=1.0,
+                    response_format=PromptResponse,
+                    timeout=timeout if timeout else DEFAULT_TIMEOUT,
+                )
+            ),
+            name="openai.generate_prompts",
+            policy=OPENAI_RETRY_POLICY,
+            budget=openai_retry_budget,
         )
 
         prompts = response.choices[0].message.parsed.prompts
@@ -125,9 +245,7 @@ async def generate_prompts(
 
         # Log a sample of prompts for debugging
         if prompts:
-            logging.info(f"Sample prompt: {prompts[0]}")
-            if len(prompts) > 1:
-                logging.info(f"Another sample prompt: {prompts[-1]}")
+            logging.debug("Sample prompts: %s | %s", prompts[0], prompts[-1])
 
         return prompts
 
@@ -137,3 +255,174 @@ async def generate_prompts(
             logging.error("Error details from API call:")
             logging.error(f"Response: {response}")
         return []
+
+
+async def generate_prompts_streaming(
+    num_prompts: int,
+    trigger_word: str,
+    style: str = "professional",
+    gender: str = "male",
+    timeout: float = None,
+) -> AsyncIterator[str]:
+    """
+    Same request as generate_prompts() but streamed: each prompt is yielded
+    the moment its closing quote arrives instead of after the whole response.
+    Errors end the stream early, like generate_prompts() returning fewer prompts.
+    """
+    num_prompts = min(num_prompts, MAX_PROMPTS)
+    count = 0
+    try:
+        messages = build_prompt_messages(num_prompts, trigger_word, style, gender)
+        stream = await call_with_retry(
+            lambda: openai_breaker().call(
+                lambda: client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    temperature=1.0,
+                    response_format=PROMPT_RESPONSE_FORMAT,
+                    stream=True,
+                    timeout=timeout if timeout else DEFAULT_TIMEOUT,
+                )
+            ),
+            name="openai.stream_prompts",
+            policy=OPENAI_RETRY_POLICY,
+            budget=openai_retry_budget,
+        )
+        parser = PromptArrayParser()
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                for prompt in parser.feed(chunk.choices[0].delta.content):
+                    count += 1
+                    yield prompt
+                    if count >= num_prompts:
+                        return
+        logging.info(f"Streamed generation complete - Got {count} prompts")
+    except Exception as e:
+        logging.error(
+            f"Error streaming prompts after {count} prompts: {str(e)}", exc_info=True
+        )
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+async def stream_prompts(
+    num_prompts: int,
+    trigger_word: str,
+    style: str = "professional",
+    gender: str = "male",
+    timeout: float = None,
+) -> AsyncIterator[List[str]]:
+    """
+    Generate prompts as parallel chunked requests, yielding new prompts as
+    soon as their request finishes or, with OPENAI_STREAM_PROMPTS=1, as soon
+    as each prompt has been streamed.
+
+    Chunks of PROMPT_CHUNK_SIZE run at most PROMPT_CHUNK_CONCURRENCY at a
+    time. Prompts repeated across chunks are dropped, and if the chunks come
+    back short, up to PROMPT_TOP_UP_ROUNDS follow-up rounds request the rest.
+
+    Args:
+        num_prompts: Total number of prompts wanted (not limited to MAX_PROMPTS)
+        trigger_word: The trigger word to include in each prompt
+        style: The style to use for prompts ("random" picks one for the whole batch)
+        gender: The gender to use in prompts ("male" or "female")
+        timeout: Per-request timeout in seconds (defaults to OPENAI_TIMEOUT)
+
+    Yields:
+        Lists of unique prompts; fewer than num_prompts in total only if
+        the requests keep failing or coming back short
+    """
+    if style == "random":
+        style = style_manager.get_random_style_name()
+
+    semaphore = asyncio.Semaphore(max(1, PROMPT_CHUNK_CONCURRENCY))
+    results = asyncio.Queue()
+    tasks = set()
+    seen = set()
+    produced = 0
+    running = 0
+
+    async def request_chunk(size: int):
+        try:
+            async with semaphore:
+                if STREAM_PROMPTS:
+                    with span("generate_prompts", streamed=True, prompts=size):
+                        async for prompt in generate_prompts_streaming(
+                            size, trigger_word, style=style, gender=gender, timeout=timeout
+                        ):
+                            results.put_nowait([prompt])
+                else:
+                    results.put_nowait(
+                        await generate_prompts(
+                            size, trigger_word, style=style, gender=gender, timeout=timeout
+                        )
+                    )
+        finally:
+            # Marks the chunk as finished
+            results.put_nowait(None)
+
+    def launch(count: int):
+        nonlocal running
+        while count > 0:
+            size = min(count, PROMPT_CHUNK_SIZE)
+            task = asyncio.create_task(request_chunk(size))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            running += 1
+            count -= size
+
+    launch(num_prompts)
+    rounds = 0
+    try:
+        while running:
+            # Take everything that arrived meanwhile, one yield per wakeup
+            items = [await results.get()]
+            while not results.empty():
+                items.append(results.get_nowait())
+
+            fresh = []
+            for item in items:
+                if item is None:
+                    running -= 1
+                    continue
+                for prompt in item:
+                    key = _normalize_prompt(prompt)
+                    if key in seen or produced + len(fresh) >= num_prompts:
+                        continue
+                    seen.add(key)
+                    fresh.append(prompt)
+            if fresh:
+                produced += len(fresh)
+                yield fresh
+
+            if not running and produced < num_prompts and rounds < PROMPT_TOP_UP_ROUNDS:
+                rounds += 1
+                logging.info(
+                    f"Prompt chunks came back short ({produced}/{num_prompts}), "
+                    f"top-up round {rounds}"
+                )
+                launch(num_prompts - produced)
+    finally:
+        # The caller may stop iterating early
+        for task in list(tasks):
+            task.cancel()
+
+
+async def generate_prompts_chunked(
+    num_prompts: int,
+    trigger_word: str,
+    style: str = "professional",
+    gender: str = "male",
+    timeout: float = None,
+) -> List[str]:
+    """Collect stream_prompts() into a single list"""
+    prompts = []
+    async for chunk in stream_prompts(
+        num_prompts, trigger_word, style=style, gender=gender, timeout=timeout
+    ):
+        prompts.extend(chunk)
+    return prompts
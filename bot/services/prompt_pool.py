@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+from ..utils.database import db
+from ..utils.metrics import CallbackMetric
+from ..utils.tracing import span
+from .openai_service import generate_prompts_chunked, stream_prompts
+from .prompt_styles.manager import style_manager
+
+# Prompts kept ready per (style, gender, trigger_word)
+POOL_TARGET = int(os.getenv("PROMPT_POOL_TARGET", "50"))
+# Pool size below which a background refill starts
+POOL_LOW_WATER = int(os.getenv("PROMPT_POOL_LOW_WATER", "20"))
+
+
+def prompt_hash(prompt: str) -> str:
+    """Identity of a prompt, insensitive to case and whitespace changes"""
+    normalized = re.sub(r"\s+", " ", prompt.strip().lower())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class PromptPool:
+    """
+    Pre-generated style prompts stored in SQLite, so batches start their
+    images right away instead of waiting on GPT. Draws take prompts the user
+    has never been served; whatever the pool can't cover is generated inline
+    in parallel chunks and handed out chunk by chunk.
+    After each draw the pool is topped back up to POOL_TARGET in the
+    background once it falls under POOL_LOW_WATER.
+    """
+
+    def __init__(self, target: int = POOL_TARGET, low_water: int = POOL_LOW_WATER):
+        self.target = target
+        self.low_water = low_water
+        self._refills = {}
+        self.served_from_pool = 0
+        self.generated_inline = 0
+        self.refills = 0
+
+    @staticmethod
+    def resolve_style(style: str) -> str:
+        # "random" draws from one concrete style's pool per batch, as before
+        if style == "random":
+            return style_manager.get_random_style_name()
+        return style if style in style_manager.styles else "professional"
+
+    async def stream(self, user_id, style, gender, trigger_word, count):
+        """
+        Yield lists of prompts for a batch, `count` in total, none of them
+        served to `user_id` before: first whatever the pool holds, then the
+        inline-generated rest as each chunk arrives.
+        """
+        style = self.resolve_style(style)
+        try:
+            prompts = await db.take_pooled_prompts(
+                user_id, style, gender, trigger_word, count
+            )
+            self.served_from_pool += len(prompts)
+            if prompts:
+                yield prompts
+
+            missing = count - len(prompts)
+            if missing > 0:
+                logging.info(
+                    f"Prompt pool short by {missing} for ({style}, {gender}), generating inline"
+                )
+                async for chunk in stream_prompts(
+                    missing, trigger_word, style=style, gender=gender
+                ):
+                    fresh = await db.mark_prompts_served(
+                        user_id, [(p, prompt_hash(p)) for p in chunk]
+                    )
+                    self.generated_inline += len(fresh)
+                    if fresh:
+                        yield fresh
+        finally:
+            self.schedule_refill(style, gender, trigger_word)
+
+    async def draw(self, user_id, style, gender, trigger_word, count):
+        """
+        Get `count` prompts for a batch as a single list.
+        Returns:
+            list: The prompts; fewer than `count` only if inline generation failed
+        """
+        prompts = []
+        async for chunk in self.stream(user_id, style, gender, trigger_word, count):
+            prompts.extend(chunk)
+        return prompts
+
+    def warm(self, config: dict):
+        """Start filling the pool for a user's default style ahead of their first batch"""
+        trigger_word = config.get("trigger_word")
+        if trigger_word:
+            self.schedule_refill(
+                self.resolve_style(config.get("style", "professional")),
+                config.get("gender", "male"),
+                trigger_word,
+            )
+
+    def schedule_refill(self, style, gender, trigger_word):
+        key = (style, gender, trigger_word)
+        if key in self._refills:
+            return
+        task = asyncio.create_task(self._refill(*key))
+        self._refills[key] = task
+        task.add_done_callback(lambda _: self._refills.pop(key, None))
+
+    async def _refill(self, style, gender, trigger_word):
+        # Outlives the command that scheduled it, so it gets its own trace
+        with span("prompt_pool.refill", root=True, style=style):
+            await self._fill(style, gender, trigger_word)
+
+    async def _fill(self, style, gender, trigger_word):
+        try:
+            available = await db.count_pooled_prompts(style, gender, trigger_word)
+            if available >= self.low_water:
+                return
+            needed = self.target - available
+            logging.info(f"Refilling prompt pool ({style}, {gender}) with {needed} prompts")
+            prompts = await generate_prompts_chunked(
+                needed, trigger_word, style=style, gender=gender
+            )
+            await db.add_pooled_prompts(
+                style, gender, trigger_word, [(p, prompt_hash(p)) for p in prompts]
+            )
+            self.refills += 1
+        except Exception as e:
+            logging.error(f"Prompt pool refill failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "served_from_pool": self.served_from_pool,
+            "generated_inline": self.generated_inline,
+            "refills": self.refills,
+            "refills_running": len(self._refills),
+        }
+
+    async def close(self):
+        """Cancel running refills, called before the database closes"""
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+prompt_pool = PromptPool()
+
+CallbackMetric(
+    "prompt_pool_refills_running",
+    "Background prompt refills in flight",
+    lambda: prompt_pool.stats()["refills_running"],
+)
+CallbackMetric(
+    "prompt_pool_prompts_total",
+    "Prompts handed out, by where they came from",
+    lambda: {
+        ("pool",): prompt_pool.served_from_pool,
+        ("inline",): prompt_pool.generated_inline,
+    },
+    ["source"],
+    type="counter",
+)
@@ -2,8 +2,145 @@ import replicate
 import logging
 from ..utils.database import db
 import random
+from ..utils.logging_config import LazyJson
 from ..utils.message_utils import format_generation_message
-import json
+from ..utils.metrics import CallbackMetric
+from ..utils.tracing import current_span, span, traced
+from ..utils.rate_limiter import delete_message, edit_text
+from .retry import REPLICATE_RETRY_POLICY, call_with_retry, replicate_retry_budget
+from .circuit_breaker import CircuitOpenError, replicate_breaker
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Maximum Replicate predictions in flight across all users
+MAX_CONCURRENT_JOBS = int(os.getenv("REPLICATE_MAX_CONCURRENCY", "32"))
+# Maximum predictions in flight for a single user
+MAX_JOBS_PER_USER = int(os.getenv("REPLICATE_MAX_PER_USER", "16"))
+# Queue waits longer than this (seconds) are logged
+SLOW_WAIT_THRESHOLD = 5.0
+
+
+class ReplicateScheduler:
+    """
+    Admission control for Replicate calls. Enforces a global in-flight cap and
+    a per-user cap, and hands out free slots round-robin across users so one
+    large batch cannot starve everybody else's jobs.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_JOBS,
+        max_per_user: int = MAX_JOBS_PER_USER,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_user = max(1, max_per_user)
+        # user_id -> deque of waiting futures; order is the round-robin rotation
+        self._waiting = OrderedDict()
+        self._running = {}
+        self.in_flight = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        """Wait for a free slot for `user_id` and hold it for the block"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(future)
+        enqueued_at = time.monotonic()
+        self._dispatch()
+
+        try:
+            with span("replicate.queue", queue_depth=self.queue_depth):
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we were cancelled, give it back
+                self._release(user_id)
+            else:
+                self._discard(user_id, future)
+            raise
+
+        wait = time.monotonic() - enqueued_at
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait >= SLOW_WAIT_THRESHOLD:
+            logging.info(
+                f"[User {user_id}] Waited {wait:.1f}s for a Replicate slot "
+                f"(queue depth: {self.queue_depth}, in flight: {self.in_flight})"
+            )
+
+        try:
+            yield wait
+        finally:
+            self._release(user_id)
+
+    def _dispatch(self):
+        """Grant free slots, one per eligible user per round"""
+        while self.in_flight < self.max_concurrent:
+            for user_id in list(self._waiting):
+                if self._running.get(user_id, 0) < self.max_per_user:
+                    break
+            else:
+                return
+
+            waiters = self._waiting[user_id]
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+
+            self.in_flight += 1
+            self._running[user_id] = self._running.get(user_id, 0) + 1
+            future.set_result(None)
+
+    def _release(self, user_id):
+        self.in_flight -= 1
+        self._running[user_id] -= 1
+        if not self._running[user_id]:
+            del self._running[user_id]
+        self._dispatch()
+
+    def _discard(self, user_id, future):
+        waiters = self._waiting.get(user_id)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiting[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "waiting_users": len(self._waiting),
+            "granted": self.granted,
+            "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+# Shared scheduler for every Replicate call made by this process
+replicate_scheduler = ReplicateScheduler()
+
+CallbackMetric(
+    "replicate_predictions_in_flight",
+    "Replicate predictions holding a scheduler slot",
+    lambda: replicate_scheduler.in_flight,
+)
+CallbackMetric(
+    "replicate_predictions_queued",
+    "Replicate predictions waiting for a scheduler slot",
+    lambda: replicate_scheduler.queue_depth,
+)
 
 
 class ReplicateService:
@@ -31,72 +168,113 @@ class ReplicateService:
     }
 
     @staticmethod
+    @traced("ReplicateService.generate_image")
     async def generate_image(
-        prompt, user_id=None, message=None, operation_type="single"
+        prompt,
+        user_id=None,
+        message=None,
+        operation_type="single",
+        config=None,
+        style=None,
+        delivery=None,
     ):
         """
         Generates an image using the Replicate API.
+        Successful and failed generations are both recorded in the history.
+        Args:
+            config: Config snapshot resolved once by the calling handler. Every
+                    image of a batch copies the same snapshot; when omitted the
+                    user's config is read from the database.
+            style: Prompt style the prompt was generated with, for the history
+            delivery: Optional MediaGroupBatcher; batches hand finished images
+                      to it instead of sending a photo and a caption message
         Returns:
             tuple: (image_url, input_params) or (None, None) on failure
         """
+        input_params = None
+        started_at = None
         try:
-            # Log the full prompt and its length for debugging
-            logging.info(f"Full prompt length: {len(prompt)} characters")
-            logging.info(f"Full prompt content: {prompt}")
+            # Full prompt for debugging, only formatted when DEBUG is enabled
+            logging.debug("Full prompt (%d characters): %s", len(prompt), prompt)
 
             # Initialize status message if needed - solo si NO es una variación
             status_message = None
             if message and operation_type != "variation":
                 # Eliminamos los mensajes individuales por imagen
                 if status_message:
-                    await status_message.delete()
+                    await delete_message(status_message)
 
-            # Get configuration - simplified
-            input_params = (
-                await db.get_user_config(
+            # Get configuration - copy the snapshot so per-image params don't leak
+            if config is not None:
+                input_params = dict(config)
+            elif user_id is not None:
+                input_params = await db.get_user_config(
                     user_id, ReplicateService.default_params.copy()
                 )
-                if user_id is not None
-                else ReplicateService.default_params.copy()
-            )
+            else:
+                input_params = ReplicateService.default_params.copy()
 
             # Validate config
             if not input_params.get("trigger_word") or not input_params.get(
                 "model_endpoint"
             ):
                 if status_message:
-                    await status_message.edit_text("❌ Configuración incompleta.")
+                    await edit_text(status_message, "❌ Configuración incompleta.")
                 return None, None
 
             # Prepare generation parameters
             input_params["seed"] = random.randint(1, 1000000)
             input_params["prompt"] = prompt
 
-            # Log the parameters being sent to Replicate
-            logging.info(
-                f"Sending to Replicate - Prompt length: {len(input_params['prompt'])} characters"
-            )
-            logging.info(
-                f"Sending to Replicate - Full parameters: {json.dumps(input_params, indent=2)}"
+            # Log the parameters being sent to Replicate; serialized lazily
+            logging.debug(
+                "Sending to Replicate - Full parameters: %s", LazyJson(input_params, indent=2)
             )
 
-            # Generate image
-            logging.info("Iniciando generación con async_run...")
-            output = await replicate.async_run(
-                input_params["model_endpoint"],
-                input=input_params,
-            )
+            # Fail fast, without queueing, while the endpoint's circuit is open
+            breaker = replicate_breaker(input_params["model_endpoint"])
+            if breaker.is_open():
+                raise CircuitOpenError(breaker.name, breaker.retry_in())
+
+            # Generate image once the scheduler grants this user a slot
+            async with replicate_scheduler.slot(user_id):
+                logging.info("Iniciando generación con async_run...")
+                started_at = time.monotonic()
+                # Plain URL strings instead of FileOutput objects, the rest of
+                # the pipeline (history, Telegram) expects URLs
+                with span("replicate.inference", model=input_params["model_endpoint"]):
+                    output = await call_with_retry(
+                        lambda: breaker.call(
+                            lambda: replicate.async_run(
+                                input_params["model_endpoint"],
+                                input=input_params,
+                                use_file_output=False,
+                            )
+                        ),
+                        name="replicate.async_run",
+                        policy=REPLICATE_RETRY_POLICY,
+                        budget=replicate_retry_budget,
+                    )
+                latency_ms = int((time.monotonic() - started_at) * 1000)
 
             if not output or not output[0]:
                 raise Exception("No se generó ninguna imagen")
 
             # Save prediction and get prediction_id
             prediction_id = await db.save_prediction(
-                user_id=user_id, prompt=prompt, output_url=output[0]
+                user_id=user_id,
+                prompt=prompt,
+                output_url=output[0],
+                input_params=input_params,
+                style=style,
+                seed=input_params["seed"],
+                latency_ms=latency_ms,
             )
 
             # Si la generación fue exitosa y tenemos un mensaje
-            if output and output[0] and message:
+            if delivery is not None:
+                await delivery.add(output[0], prompt)
+            elif output and output[0] and message:
                 await format_generation_message(
                     prompt, message, output[0], prediction_id
                 )
@@ -105,6 +283,30 @@ class ReplicateService:
 
         except Exception as e:
             logging.error(f"Error generating image: {e}")
+            current_span().record_exception(e)
+            if started_at is not None:
+                await ReplicateService.record_failure(
+                    user_id, prompt, input_params, style, started_at
+                )
             if status_message:
-                await status_message.edit_text("❌ Error inesperado")
+                await edit_text(status_message, "❌ Error inesperado")
             return None, None
+
+    @staticmethod
+    async def record_failure(user_id, prompt, input_params, style, started_at):
+        """
+        Store a failed generation in the history without masking the original error.
+        """
+        try:
+            await db.save_prediction(
+                user_id=user_id,
+                prompt=prompt,
+                output_url=None,
+                input_params=input_params,
+                style=style,
+                seed=input_params.get("seed"),
+                latency_ms=int((time.monotonic() - started_at) * 1000),
+                status="failed",
+            )
+        except Exception as e:
+            logging.error(f"Error recording failed prediction: {e}")
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+import openai
+from replicate.exceptions import ModelError, ReplicateError
+
+from ..utils.metrics import CallbackMetric, Counter, Gauge, Histogram
+
+# HTTP status codes worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Duration of each attempt of an OpenAI or Replicate call",
+    ["upstream", "outcome"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight", "OpenAI and Replicate calls awaiting a response", ["upstream"]
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Failed attempts by error class", ["upstream", "error"]
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Attempts retried after a transient error", ["upstream"]
+)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: before retry n the caller sleeps a
+    random time in [0, min(max_delay, base_delay * 2**n)]. No attempt starts
+    after `deadline` seconds from the first one.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        deadline: float = 120.0,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, retry_number: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry_number))
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries to a fraction of regular traffic. Every call
+    deposits `ratio` tokens and every retry withdraws one, so during an outage
+    retries stop instead of multiplying the load on the failing upstream.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_call(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+        }
+
+
+def status_code_of(exc: BaseException):
+    """HTTP status attached to an OpenAI, Replicate or httpx error, if any"""
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code
+    if isinstance(exc, ReplicateError):
+        return exc.status
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Classify an upstream error. Throttling, 5xx, timeouts and connection
+    problems are transient; bad requests, auth errors and model failures
+    (the prediction itself failed) are not.
+    """
+    if isinstance(exc, ModelError):
+        return False
+    if isinstance(
+        exc,
+        (
+            TimeoutError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            httpx.TimeoutException,
+            httpx.TransportError,
+        ),
+    ):
+        return True
+    status = status_code_of(exc)
+    return status is not None and status in RETRYABLE_STATUS_CODES
+
+
+def error_class(exc: BaseException) -> str:
+    """Low-cardinality label for an upstream error: timeout, http_429, http_5xx..."""
+    if isinstance(exc, (TimeoutError, openai.APITimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(exc, ModelError):
+        return "model_error"
+    status = status_code_of(exc)
+    if status is not None:
+        return "http_429" if status == 429 else f"http_{status // 100}xx"
+    return type(exc).__name__
+
+
+def retry_after_of(exc: BaseException):
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_with_retry(operation, *, name: str, policy: RetryPolicy, budget: RetryBudget):
+    """
+    Await `operation()` and retry it on transient errors according to `policy`,
+    as long as `budget` allows. The last error is re-raised when giving up.
+
+    Args:
+        operation: Zero-argument callable returning a fresh awaitable per attempt
+        name: Upstream name used in log messages and metric labels
+        policy: Backoff and deadline settings
+        budget: Shared retry budget for this upstream
+    """
+    started = time.monotonic()
+    budget.record_call()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with UPSTREAM_DURATION.time_outcome(
+                upstream=name
+            ), UPSTREAM_IN_FLIGHT.track_inprogress(upstream=name):
+                return await operation()
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream=name, error=error_class(e))
+            elapsed = time.monotonic() - started
+            if not is_retryable(e):
+                raise
+            if attempt >= policy.max_attempts:
+                logging.warning(f"{name}: giving up after {attempt} attempts: {e}")
+                raise
+
+            delay = policy.backoff(attempt - 1)
+            retry_after = retry_after_of(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, policy.max_delay))
+            if elapsed + delay >= policy.deadline:
+                logging.warning(f"{name}: deadline of {policy.deadline}s reached: {e}")
+                raise
+            if not budget.try_spend():
+                logging.warning(f"{name}: retry budget exhausted, not retrying: {e}")
+                raise
+
+            logging.info(
+                f"{name}: attempt {attempt} failed ({type(e).__name__}: {e}), "
+                f"retrying in {delay:.2f}s"
+            )
+            UPSTREAM_RETRIES.inc(upstream=name)
+            await asyncio.sleep(delay)
+
+
+# Shared policies and budgets, one per upstream
+OPENAI_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("OPENAI_MAX_ATTEMPTS", "4")),
+    deadline=float(os.getenv("OPENAI_RETRY_DEADLINE", "180")),
+)
+REPLICATE_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("REPLICATE_MAX_ATTEMPTS", "4")),
+    deadline=float(os.getenv("REPLICATE_RETRY_DEADLINE", "300")),
+)
+openai_retry_budget = RetryBudget()
+replicate_retry_budget = RetryBudget()
+
+CallbackMetric(
+    "upstream_retry_budget_tokens",
+    "Retries each upstream may still spend",
+    lambda: {
+        ("openai",): openai_retry_budget.tokens,
+        ("replicate",): replicate_retry_budget.tokens,
+    },
+    ["upstream"],
+)
@@ -0,0 +1,98 @@
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get when the key is absent or expired
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-memory LRU cache whose entries also expire after `ttl` seconds.
+    A maxsize of 0 disables caching. Tracks hit and miss counters.
+
+    Values read from the source on a miss go in with fill(), which drops them
+    if the key was set or invalidated while the read was in flight, so a slow
+    read can't overwrite a newer write-through with the value it replaced.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Clock ticking on every set/invalidate, the clock of each key's last
+        # one (bounded, oldest forgotten first) and the newest one forgotten
+        self._clock = 0
+        self._written = OrderedDict()
+        self._forgotten = 0
+
+    def get(self, key):
+        """Return the cached value or MISSING, refreshing its LRU position"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return MISSING
+
+    def generation(self) -> int:
+        """Token to take before reading from the source, for fill()"""
+        return self._clock
+
+    def fill(self, key, value, generation: int) -> bool:
+        """
+        Cache a value read from the source, unless `key` was set or invalidated
+        since `generation` was taken. Returns whether it was cached.
+        """
+        # A key no longer tracked may have been written after any generation
+        # older than the newest forgotten write
+        if self._written.get(key, self._forgotten) > generation:
+            return False
+        self._store(key, value)
+        return True
+
+    def set(self, key, value):
+        self._written_now(key)
+        self._store(key, value)
+
+    def invalidate(self, key):
+        self._written_now(key)
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._clock += 1
+        self._written.clear()
+        self._forgotten = self._clock
+        self._entries.clear()
+
+    def _written_now(self, key):
+        self._clock += 1
+        self._written[key] = self._clock
+        self._written.move_to_end(key)
+        while len(self._written) > max(self.maxsize, 1):
+            _, self._forgotten = self._written.popitem(last=False)
+
+    def _store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
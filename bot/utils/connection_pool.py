@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+# Number of long-lived connections kept open per database file
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Compiled statements cached per connection; the SQL strings in database.py are
+# module constants so every call reuses the same prepared statement
+STATEMENT_CACHE_SIZE = 128
+
+# Seconds SQLite waits on a locked database before raising
+BUSY_TIMEOUT = 5.0
+
+
+class ConnectionPool:
+    """
+    Small pool of persistent aiosqlite connections. Connections are opened
+    lazily in WAL mode with synchronous=NORMAL and handed out one coroutine at
+    a time, which avoids paying a connect (and a new worker thread) per query.
+    """
+
+    def __init__(self, db_path, size: int = POOL_SIZE):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle = None
+        self._connections = []
+        self._opening = 0
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        logging.info(
+            f"Opened pooled database connection {len(self._connections) + 1}/{self.size}"
+        )
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Borrow a connection for the duration of the block. A transaction left
+        open by a failing block is rolled back before the connection is reused;
+        if that fails, or the pool was closed meanwhile, it is closed instead.
+        """
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        idle = self._idle
+
+        if self._idle.empty() and len(self._connections) + self._opening < self.size:
+            # Reserve the slot before awaiting so concurrent callers don't overshoot
+            self._opening += 1
+            try:
+                conn = await self._open_connection()
+                self._connections.append(conn)
+            finally:
+                self._opening -= 1
+        else:
+            conn = await self._idle.get()
+
+        try:
+            yield conn
+        finally:
+            reusable = False
+            try:
+                # close() already closed it when the pool was closed meanwhile
+                if self._idle is idle:
+                    if conn.in_transaction:
+                        await conn.rollback()
+                    reusable = True
+            except Exception as e:
+                logging.error(f"Error rolling back pooled connection: {e}", exc_info=True)
+            finally:
+                if reusable:
+                    idle.put_nowait(conn)
+                else:
+                    await self._discard(conn)
+
+    async def _discard(self, conn: aiosqlite.Connection):
+        """Close a connection that can't go back to the pool, freeing its slot"""
+        if conn in self._connections:
+            self._connections.remove(conn)
+        try:
+            await conn.close()
+        except Exception as e:
+            logging.error(f"Error closing database connection: {e}", exc_info=True)
+
+    async def close(self):
+        """
+        Close every pooled connection. The pool can be used again afterwards,
+        in which case connections are reopened lazily.
+        """
+        connections, self._connections = self._connections, []
+        self._idle = None
+        for conn in connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                logging.error(f"Error closing database connection: {e}", exc_info=True)
+        if connections:
+            logging.info(f"Closed {len(connections)} pooled database connections")
@@ -1,17 +1,156 @@
-import aiosqlite
+import copy
+import functools
 import json
+import os
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
 import sqlite3
 import uuid
+from .cache import MISSING, TTLCache
+from .connection_pool import ConnectionPool
+from .metrics import CallbackMetric, Histogram
+from .migrations import apply_migrations
+from .tracing import span
+from .prediction_writer import PredictionWriter
+
+# User config cache bounds; CONFIG_CACHE_SIZE=0 disables the cache
+CONFIG_CACHE_SIZE = int(os.getenv("CONFIG_CACHE_SIZE", "10000"))
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "300"))
+# Entries kept in the persistent image analysis cache, least recently used go first
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "5000"))
+
+# SQL statements are kept as constants so pooled connections reuse the same
+# prepared statement from their statement cache on every call
+SELECT_USER_CONFIG_SQL = "SELECT config FROM user_configs WHERE user_id = ?"
+
+UPSERT_USER_CONFIG_SQL = """
+    INSERT INTO user_configs (user_id, config)
+    VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        config=excluded.config,
+        updated_at=CURRENT_TIMESTAMP
+"""
+
+INSERT_PREDICTION_SQL = """
+    INSERT INTO predictions
+    (prediction_id, user_id, prompt, output_url, input_params,
+     style, seed, latency_ms, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_PREDICTION_SQL = """
+    SELECT prompt, output_url
+    FROM predictions
+    WHERE prediction_id = ?
+"""
+
+# Keyset pagination over idx_predictions_user_created: the (created_at, rowid)
+# of the last row of a page is the cursor for the next one, so deep pages cost
+# the same index seek as the first page instead of an OFFSET scan
+SELECT_HISTORY_SQL = """
+    SELECT rowid, prediction_id, prompt, output_url, style, seed,
+           latency_ms, status, created_at
+    FROM predictions
+    WHERE user_id = ?
+      AND created_at <= ?
+      AND (created_at < ? OR rowid < ?)
+    ORDER BY created_at DESC, rowid DESC
+    LIMIT ?
+"""
+
+# Sorts after any stored timestamp, used as the cursor of the first page
+HISTORY_START_CURSOR = ("9999-12-31 23:59:59.999999", 2**63 - 1)
+
+SELECT_ANALYSIS_SQL = "SELECT description FROM analysis_cache WHERE cache_key = ?"
+
+TOUCH_ANALYSIS_SQL = "UPDATE analysis_cache SET last_used_at = ? WHERE cache_key = ?"
+
+UPSERT_ANALYSIS_SQL = """
+    INSERT INTO analysis_cache (cache_key, description, created_at, last_used_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(cache_key) DO UPDATE SET
+        description=excluded.description,
+        last_used_at=excluded.last_used_at
+"""
+
+# Drops the least recently used entries beyond the size bound, walking
+# idx_analysis_cache_last_used from the oldest end
+EVICT_ANALYSIS_SQL = """
+    DELETE FROM analysis_cache WHERE cache_key IN (
+        SELECT cache_key FROM analysis_cache
+        ORDER BY last_used_at
+        LIMIT max(0, (SELECT COUNT(*) FROM analysis_cache) - ?)
+    )
+"""
+
+
+COUNT_POOLED_PROMPTS_SQL = """
+    SELECT COUNT(*) FROM prompt_pool
+    WHERE style = ? AND gender = ? AND trigger_word = ?
+"""
+
+# Takes the oldest pooled prompts the user has not been served yet; the
+# DELETE makes a prompt go to exactly one batch even under concurrent draws
+TAKE_POOLED_PROMPTS_SQL = """
+    DELETE FROM prompt_pool WHERE id IN (
+        SELECT id FROM prompt_pool
+        WHERE style = ? AND gender = ? AND trigger_word = ?
+          AND prompt_hash NOT IN (
+              SELECT prompt_hash FROM served_prompts WHERE user_id = ?
+          )
+        ORDER BY id
+        LIMIT ?
+    )
+    RETURNING prompt, prompt_hash
+"""
+
+INSERT_POOLED_PROMPT_SQL = """
+    INSERT OR IGNORE INTO prompt_pool
+    (style, gender, trigger_word, prompt, prompt_hash, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_SERVED_PROMPT_SQL = """
+    INSERT OR IGNORE INTO served_prompts (user_id, prompt_hash, served_at)
+    VALUES (?, ?, ?)
+"""
+
+SELECT_SERVED_PROMPT_SQL = """
+    SELECT 1 FROM served_prompts WHERE user_id = ? AND prompt_hash = ?
+"""
+
+
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of Database calls, including pool waits and cache hits",
+    ["query"],
+)
+
+
+def timed_query(func):
+    """Time a Database coroutine method and trace it as a db.<name> span"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(f"db.{name}"), QUERY_DURATION.time(query=name):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def utc_timestamp() -> str:
+    """Sortable UTC timestamp with microseconds, as stored in the database"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
 
 
 # Create a singleton instance
 class Database:
     """
     Handles all database operations for the bot, including user configurations
-    and generation history. Uses aiosqlite for asynchronous persistent storage
-    with automatic timestamp tracking for updates.
+    and generation history. Uses a pool of persistent aiosqlite connections for
+    asynchronous storage with automatic timestamp tracking for updates.
     """
 
     _instance = None
@@ -20,36 +159,39 @@ class Database:
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
             cls._instance.db_path = Path("bot_data.db")
+            # Number of user_configs reads that actually hit SQLite
+            cls._instance.config_reads = 0
+            # user_id -> config dict, or None when the user has no saved config
+            cls._instance.config_cache = TTLCache(CONFIG_CACHE_SIZE, CONFIG_CACHE_TTL)
             cls._instance.init_database()
+            cls._instance.pool = ConnectionPool(cls._instance.db_path)
+            cls._instance.prediction_writer = PredictionWriter(
+                cls._instance.pool, INSERT_PREDICTION_SQL
+            )
         return cls._instance
 
     def init_database(self):
         """
-        Initializes the database schema if it doesn't exist.
+        Brings the database schema up to date by applying pending migrations.
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                # User configurations table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS user_configs (
-                        user_id INTEGER PRIMARY KEY,
-                        config TEXT NOT NULL,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """
-                )
-                conn.commit()
+            # isolation_level=None lets each migration manage its own transaction
+            with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+                # WAL is persistent on the database file, pooled connections inherit it
+                conn.execute("PRAGMA journal_mode=WAL")
+                version = apply_migrations(conn)
+                logging.info(f"Database schema at version {version}")
         except Exception as e:
             logging.error(f"Error initializing database: {e}")
             raise
 
+    @timed_query
     async def get_user_config(self, user_id, default_config):
         """
         Retrieves user-specific configuration or falls back to defaults.
-        Uses asynchronous context manager for automatic connection handling.
+        Served from the in-memory config cache when possible; otherwise borrows
+        a pooled connection for the query. Always returns a copy the caller may
+        mutate freely.
 
         Args:
             user_id: Telegram user ID
@@ -58,30 +200,39 @@ class Database:
         Returns:
             dict: User's configuration or default if none exists
         """
+        cached = self.config_cache.get(user_id)
+        if cached is not MISSING:
+            return copy.deepcopy(cached) if cached is not None else default_config
+
+        # A set_user_config finishing while we read makes our row stale
+        generation = self.config_cache.generation()
         try:
             logging.info(f"Retrieving config for user {user_id}")
-            async with aiosqlite.connect(self.db_path) as conn:
-                cursor = await conn.cursor()
-                await cursor.execute(
-                    "SELECT config FROM user_configs WHERE user_id = ?", (user_id,)
-                )
-                result = await cursor.fetchone()
+            async with self.pool.acquire() as conn:
+                self.config_reads += 1
+                async with conn.execute(SELECT_USER_CONFIG_SQL, (user_id,)) as cursor:
+                    result = await cursor.fetchone()
 
-                if result:
-                    logging.info(f"Found existing config for user {user_id}")
-                    return json.loads(result[0])
-                else:
-                    logging.info(f"No config found for user {user_id}, using default")
-                    return default_config
+            if result:
+                logging.info(f"Found existing config for user {user_id}")
+                config = json.loads(result[0])
+                self.config_cache.fill(user_id, config, generation)
+                return copy.deepcopy(config)
+            else:
+                logging.info(f"No config found for user {user_id}, using default")
+                self.config_cache.fill(user_id, None, generation)
+                return default_config
 
         except Exception as e:
             logging.error(f"Error retrieving user config: {e}", exc_info=True)
             return default_config
 
+    @timed_query
     async def set_user_config(self, user_id, config):
         """
         Updates or creates user configuration using UPSERT pattern.
-        Automatically handles JSON serialization of config data.
+        Automatically handles JSON serialization of config data and writes the
+        new value through to the config cache once it is committed.
 
         Args:
             user_id: Telegram user ID
@@ -90,66 +241,84 @@ class Database:
         try:
             logging.info(f"Updating config for user {user_id}")
             logging.info(f"New config: {config}")
-            async with aiosqlite.connect(self.db_path) as conn:
-                cursor = await conn.cursor()
-                await cursor.execute(
-                    """
-                    INSERT INTO user_configs (user_id, config)
-                    VALUES (?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        config=excluded.config,
-                        updated_at=CURRENT_TIMESTAMP
-                    """,
-                    (user_id, json.dumps(config)),
-                )
+            # Drop the cached entry first so a failed write can't leave it stale
+            self.config_cache.invalidate(user_id)
+            async with self.pool.acquire() as conn:
+                await conn.execute(UPSERT_USER_CONFIG_SQL, (user_id, json.dumps(config)))
                 await conn.commit()
-                logging.info(f"Successfully updated config for user {user_id}")
+            self.config_cache.set(user_id, copy.deepcopy(config))
+            logging.info(f"Successfully updated config for user {user_id}")
 
         except Exception as e:
             logging.error(f"Error setting user config: {e}", exc_info=True)
             raise
 
-    async def save_prediction(self, user_id, prompt, output_url):
+    @timed_query
+    async def save_prediction(
+        self,
+        user_id,
+        prompt,
+        output_url,
+        input_params=None,
+        style=None,
+        seed=None,
+        latency_ms=None,
+        status="succeeded",
+    ):
         """
-        Save prediction data with unique prediction_id using full UUID
+        Save prediction data with unique prediction_id using full UUID.
+        The row is buffered by the write-behind PredictionWriter and the
+        prediction_id is returned immediately, before it reaches SQLite.
+
+        Args:
+            user_id: Telegram user ID
+            prompt: Prompt sent to the model
+            output_url: Generated image URL (None for failed generations)
+            input_params: Parameters sent to Replicate, stored as JSON
+            style: Prompt style used for the generation, if any
+            seed: Seed used for the generation
+            latency_ms: Time spent waiting for Replicate
+            status: "succeeded" or "failed"
         """
         try:
             prediction_id = str(
                 uuid.uuid4()
             )  # UUID completo, ej: 550e8400-e29b-41d4-a716-446655440000
-            async with aiosqlite.connect(self.db_path) as conn:
-                cursor = await conn.cursor()
-                await cursor.execute(
-                    """
-                    INSERT INTO predictions
-                    (prediction_id, user_id, prompt, output_url)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (prediction_id, user_id, prompt, output_url),
+            # Timestamp taken now so the write-behind delay doesn't skew history
+            created_at = utc_timestamp()
+            await self.prediction_writer.enqueue(
+                (
+                    prediction_id,
+                    user_id,
+                    prompt,
+                    output_url,
+                    json.dumps(input_params) if input_params is not None else None,
+                    style,
+                    seed,
+                    latency_ms,
+                    status,
+                    created_at,
                 )
-                await conn.commit()
-                return prediction_id
+            )
+            return prediction_id
         except Exception as e:
             logging.error(f"Error saving prediction: {e}", exc_info=True)
             raise
 
+    @timed_query
     async def get_prediction(self, prediction_id):
         """
         Retrieve prediction data by prediction_id
         """
         try:
             logging.info(f"Retrieving prediction data for ID: {prediction_id}")
-            async with aiosqlite.connect(self.db_path) as conn:
-                cursor = await conn.cursor()
-                await cursor.execute(
-                    """
-                    SELECT prompt, output_url
-                    FROM predictions
-                    WHERE prediction_id = ?
-                    """,
-                    (prediction_id,),
-                )
-                result = await cursor.fetchone()
+            # Serve rows still waiting in the write-behind buffer
+            pending = self.prediction_writer.get_pending(prediction_id)
+            if pending:
+                return pending[2], pending[3]
+            async with self.pool.acquire() as conn:
+                async with conn.execute(SELECT_PREDICTION_SQL, (prediction_id,)) as cursor:
+                    result = await cursor.fetchone()
                 if result:
                     logging.info(f"Found prediction data for ID: {prediction_id}")
                 else:
@@ -159,9 +328,198 @@ class Database:
             logging.error(f"Error retrieving prediction: {e}", exc_info=True)
             return None
 
+    @timed_query
+    async def get_prediction_history(self, user_id, limit=20, cursor=None):
+        """
+        Retrieve a page of a user's generations, newest first.
+
+        Args:
+            user_id: Telegram user ID
+            limit: Maximum number of rows in the page
+            cursor: Value returned as next_cursor by the previous page, or None
+                    for the first page
+
+        Returns:
+            tuple: (list of prediction dicts, next_cursor or None if last page)
+        """
+        try:
+            # Make sure recently buffered predictions are visible
+            await self.prediction_writer.flush()
+            created_at, rowid = cursor or HISTORY_START_CURSOR
+            async with self.pool.acquire() as conn:
+                async with conn.execute(
+                    SELECT_HISTORY_SQL, (user_id, created_at, created_at, rowid, limit)
+                ) as db_cursor:
+                    rows = await db_cursor.fetchall()
+
+            history = [
+                {
+                    "prediction_id": row[1],
+                    "prompt": row[2],
+                    "output_url": row[3],
+                    "style": row[4],
+                    "seed": row[5],
+                    "latency_ms": row[6],
+                    "status": row[7],
+                    "created_at": row[8],
+                }
+                for row in rows
+            ]
+            next_cursor = (rows[-1][8], rows[-1][0]) if len(rows) == limit else None
+            return history, next_cursor
+        except Exception as e:
+            logging.error(f"Error retrieving prediction history: {e}", exc_info=True)
+            return [], None
+
+    @timed_query
+    async def get_cached_analysis(self, *cache_keys):
+        """
+        Return the cached description for the first of `cache_keys` present,
+        marking it as recently used, or None.
+        """
+        try:
+            async with self.pool.acquire() as conn:
+                for cache_key in cache_keys:
+                    async with conn.execute(SELECT_ANALYSIS_SQL, (cache_key,)) as cursor:
+                        row = await cursor.fetchone()
+                    if row:
+                        await conn.execute(TOUCH_ANALYSIS_SQL, (utc_timestamp(), cache_key))
+                        await conn.commit()
+                        return row[0]
+            return None
+        except Exception as e:
+            logging.error(f"Error reading analysis cache: {e}", exc_info=True)
+            return None
+
+    @timed_query
+    async def save_cached_analysis(self, cache_keys, description):
+        """
+        Store `description` under every key in `cache_keys` and evict the
+        least recently used entries beyond ANALYSIS_CACHE_SIZE.
+        """
+        try:
+            now = utc_timestamp()
+            async with self.pool.acquire() as conn:
+                await conn.executemany(
+                    UPSERT_ANALYSIS_SQL,
+                    [(cache_key, description, now, now) for cache_key in cache_keys],
+                )
+                await conn.execute(EVICT_ANALYSIS_SQL, (ANALYSIS_CACHE_SIZE,))
+                await conn.commit()
+        except Exception as e:
+            logging.error(f"Error saving analysis cache: {e}", exc_info=True)
+
+    @timed_query
+    async def count_pooled_prompts(self, style, gender, trigger_word):
+        """Number of prompts waiting in the pool for this key"""
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.execute(
+                    COUNT_POOLED_PROMPTS_SQL, (style, gender, trigger_word)
+                ) as cursor:
+                    return (await cursor.fetchone())[0]
+        except Exception as e:
+            logging.error(f"Error counting pooled prompts: {e}", exc_info=True)
+            return 0
+
+    @timed_query
+    async def take_pooled_prompts(self, user_id, style, gender, trigger_word, limit):
+        """
+        Remove up to `limit` prompts from the pool that `user_id` has never been
+        served and record them as served, in one transaction.
+
+        Returns:
+            list: The prompts taken, possibly fewer than `limit`
+        """
+        try:
+            now = utc_timestamp()
+            async with self.pool.acquire() as conn:
+                async with conn.execute(
+                    TAKE_POOLED_PROMPTS_SQL, (style, gender, trigger_word, user_id, limit)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                await conn.executemany(
+                    INSERT_SERVED_PROMPT_SQL,
+                    [(user_id, prompt_hash, now) for _, prompt_hash in rows],
+                )
+                await conn.commit()
+            return [prompt for prompt, _ in rows]
+        except Exception as e:
+            logging.error(f"Error taking pooled prompts: {e}", exc_info=True)
+            return []
+
+    @timed_query
+    async def add_pooled_prompts(self, style, gender, trigger_word, prompts):
+        """
+        Add (prompt, prompt_hash) pairs to the pool; duplicates already pooled
+        for the same key are ignored.
+        """
+        try:
+            now = utc_timestamp()
+            async with self.pool.acquire() as conn:
+                await conn.executemany(
+                    INSERT_POOLED_PROMPT_SQL,
+                    [
+                        (style, gender, trigger_word, prompt, prompt_hash, now)
+                        for prompt, prompt_hash in prompts
+                    ],
+                )
+                await conn.commit()
+        except Exception as e:
+            logging.error(f"Error adding pooled prompts: {e}", exc_info=True)
+
+    @timed_query
+    async def mark_prompts_served(self, user_id, prompts):
+        """
+        Record (prompt, prompt_hash) pairs as served to `user_id`, returning
+        only the ones the user had not been served before.
+        """
+        try:
+            now = utc_timestamp()
+            fresh = []
+            async with self.pool.acquire() as conn:
+                for prompt, prompt_hash in prompts:
+                    async with conn.execute(
+                        SELECT_SERVED_PROMPT_SQL, (user_id, prompt_hash)
+                    ) as cursor:
+                        if await cursor.fetchone():
+                            continue
+                    await conn.execute(
+                        INSERT_SERVED_PROMPT_SQL, (user_id, prompt_hash, now)
+                    )
+                    fresh.append(prompt)
+                await conn.commit()
+            return fresh
+        except Exception as e:
+            logging.error(f"Error recording served prompts: {e}", exc_info=True)
+            return [prompt for prompt, _ in prompts]
+
+    async def close(self):
+        """
+        Flushes buffered predictions and closes the pooled connections.
+        Called from the Application shutdown hook.
+        """
+        try:
+            await self.prediction_writer.close()
+        finally:
+            await self.pool.close()
+
 
 # Create the singleton instance
 db = Database()
 
+CallbackMetric(
+    "db_config_cache_hits_total",
+    "User config lookups served from memory",
+    lambda: db.config_cache.hits,
+    type="counter",
+)
+CallbackMetric(
+    "db_config_reads_total",
+    "User config lookups that hit SQLite",
+    lambda: db.config_reads,
+    type="counter",
+)
+
 # Export the singleton instance
 __all__ = ["db"]
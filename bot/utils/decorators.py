@@ -3,9 +3,16 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from ..services.replicate_service import ReplicateService
 from ..utils.database import db
+from ..utils.rate_limiter import reply_text
 
 
 def require_configured(func):
+    """
+    Ensures the user has a trigger word and model endpoint configured.
+    The config snapshot read here is passed to the handler as the `config`
+    keyword argument so the command does not read it from the database again.
+    """
+
     @wraps(func)
     async def wrapper(
         update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
@@ -15,10 +22,11 @@ def require_configured(func):
         trigger_word = config.get("trigger_word")
         model_endpoint = config.get("model_endpoint")
         if not trigger_word or not model_endpoint:
-            await update.message.reply_text(
+            await reply_text(
+                update.message,
                 "❌ Configuración incompleta. Por favor, establece la palabra clave y el endpoint del modelo usando el comando `/config`."
             )
             return
-        return await func(update, context, *args, **kwargs)
+        return await func(update, context, *args, config=config, **kwargs)
 
     return wrapper
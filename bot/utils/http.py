@@ -0,0 +1,65 @@
+import logging
+import os
+
+import aiohttp
+
+# Telegram bots can't download files above 20 MB anyway
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+# Open connections kept by the shared session
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "50"))
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(Exception):
+    """The remote file is bigger than the allowed download size"""
+
+
+class HttpClient:
+    """
+    One aiohttp session for the whole process, so downloads reuse pooled
+    connections instead of opening a session and a TLS handshake per request.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT),
+            )
+        return self._session
+
+    async def download(self, url: str, max_bytes: int = MAX_DOWNLOAD_BYTES) -> bytes:
+        """
+        Stream `url` into memory, refusing anything larger than `max_bytes`.
+        Args:
+            url: File to fetch
+            max_bytes: Size cap, checked against Content-Length and while streaming
+        Returns:
+            bytes: File contents
+        """
+        async with self.session().get(url) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to download image: {response.status}")
+            if response.content_length and response.content_length > max_bytes:
+                raise DownloadTooLarge(
+                    f"{response.content_length} bytes exceeds the {max_bytes} byte limit"
+                )
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data += chunk
+                if len(data) > max_bytes:
+                    raise DownloadTooLarge(f"Download exceeds the {max_bytes} byte limit")
+            return bytes(data)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            logging.info("Closing shared HTTP session")
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,63 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are then sent as downloaded
+    Image = None
+
+# Longest side sent to the vision model; GPT-4o tiles larger images anyway
+ANALYSIS_MAX_SIDE = int(os.getenv("ANALYSIS_MAX_SIDE", "1024"))
+# Threads re-encoding images; bounds CPU use and the decoded bitmaps in memory
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+JPEG_QUALITY = 85
+# JPEGs up to this factor over ANALYSIS_MAX_SIDE are sent as they are, the
+# vision model resizes them itself and re-encoding would only cost CPU
+DOWNSCALE_SLACK = 1.5
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+def pick_photo_size(photo_sizes, min_side: int = ANALYSIS_MAX_SIDE):
+    """
+    Pick the smallest Telegram PhotoSize whose longest side still reaches
+    `min_side`, or the largest one when none does.
+    """
+    sizes = sorted(photo_sizes, key=lambda p: p.width * p.height)
+    for size in sizes:
+        if max(size.width, size.height) >= min_side:
+            return size
+    return sizes[-1]
+
+
+def _downscale(data: bytes, max_side: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= max_side * DOWNSCALE_SLACK and image.format == "JPEG":
+            return data
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=JPEG_QUALITY)
+        return output.getvalue()
+
+
+async def prepare_for_vision(data: bytes, max_side: int = ANALYSIS_MAX_SIDE) -> bytes:
+    """
+    Downscale and re-encode an image to a JPEG no larger than `max_side` on
+    its longest side, off the event loop. Returns the input unchanged when
+    Pillow is not installed or the image can't be decoded.
+    """
+    if Image is None or max_side <= 0:
+        return data
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_executor, _downscale, data, max_side)
+    except Exception as e:
+        logging.warning(f"Image preprocessing failed, sending original: {e}")
+        return data
@@ -1,18 +1,116 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+
+from .tracing import install_log_correlation
+
+# Atributos estándar de LogRecord; el resto llegó por `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class LazyJson:
+    """
+    Serializa `value` a JSON solo si el registro llega a emitirse:
+    logging.debug("Parámetros: %s", LazyJson(params)) no cuesta nada con DEBUG
+    desactivado.
+    """
+
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value, indent=None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent, default=str, ensure_ascii=False)
+
+
+def cap_text(text: str, limit: int) -> str:
+    """Recorta textos largos (prompts, payloads) indicando cuánto se omitió"""
+    if limit and len(text) > limit:
+        return f"{text[:limit]}… (+{len(text) - limit} chars)"
+    return text
+
+
+class CappedFormatter(logging.Formatter):
+    """Formato de texto con el mensaje recortado a `max_chars`"""
+
+    def __init__(self, fmt=None, datefmt=None, max_chars: int = 0):
+        super().__init__(fmt, datefmt)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record):
+        record.message = cap_text(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea, con trace_id/span_id y los campos de `extra=`"""
+
+    def __init__(self, max_chars: int = 0):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": cap_text(record.getMessage(), self.max_chars),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _LoopQueueHandler(QueueHandler):
+    """
+    Encola el registro para el hilo del QueueListener. En el hilo que loguea
+    (el event loop) solo se resuelve el mensaje, para que cambios posteriores
+    en los argumentos no lo alteren; el formato, las trazas de excepción y la
+    escritura en disco ocurren en el listener.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
 
 def setup_logging():
+    global _listener
+
     # Eliminar handlers existentes
     root = logging.getLogger()
     for handler in root.handlers[:]:
         root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
     # Configuración básica
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    log_format = "%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
+    # "text" o "json" (una línea JSON por registro)
+    output = os.getenv("LOG_FORMAT", "text").lower()
+    # Escritura en un hilo aparte para no bloquear el event loop (1 por defecto)
+    use_queue = os.getenv("LOG_ASYNC", "1") == "1"
+    # Longitud máxima de un mensaje, 0 sin límite
+    max_chars = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
 
     # Niveles disponibles
     valid_levels = {
@@ -23,6 +121,9 @@ def setup_logging():
         "CRITICAL": logging.CRITICAL,
     }
 
+    # ID de traza del span activo en cada registro
+    install_log_correlation()
+
     # Verificar y establecer nivel
     level = valid_levels.get(log_level, logging.INFO)
     root.setLevel(level)
@@ -32,6 +133,11 @@ def setup_logging():
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
+    if output == "json":
+        formatter = JsonFormatter(max_chars)
+    else:
+        formatter = CappedFormatter(log_format, date_format, max_chars)
+
     # Configurar handler de archivo rotativo
     file_handler = RotatingFileHandler(
         os.path.join(log_dir, "bot.log"),
@@ -40,17 +146,35 @@ def setup_logging():
         encoding="utf-8",
     )
     file_handler.setLevel(level)
-    file_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+    file_handler.setFormatter(formatter)
 
     # Configurar handler de consola
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
-    console_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+    console_handler.setFormatter(formatter)
 
-    # Añadir handlers
-    root.addHandler(file_handler)
-    root.addHandler(console_handler)
+    # Añadir handlers, detrás de una cola si el modo asíncrono está activo
+    if use_queue:
+        _listener = QueueListener(
+            queue.SimpleQueue(), file_handler, console_handler, respect_handler_level=True
+        )
+        _listener.start()
+        root.addHandler(_LoopQueueHandler(_listener.queue))
+    else:
+        root.addHandler(file_handler)
+        root.addHandler(console_handler)
 
     # Log de prueba
     logging.info("Configuración de logging completada")
     logging.debug(f"Nivel de log configurado: {log_level}")
+
+
+def stop_logging():
+    """Vacía la cola de logs pendientes; se llama también al salir del proceso"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,201 @@
+import asyncio
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from .metrics import Counter, Histogram
+
+# "1" watches the event loop for lag and logs what blocked it; "debug" also
+# flags synchronous I/O made from coroutines; "0" (default) disables it
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "0").lower()
+# Seconds between lag samples
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+# Lag in seconds past which the blocking stack is logged
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+
+# Audit events (see sys.addaudithook) that block the calling thread;
+# time.sleep is only audited from Python 3.12, the watchdog still catches it
+SYNC_IO_EVENTS = frozenset(
+    {
+        "open",
+        "time.sleep",
+        "socket.connect",
+        "socket.getaddrinfo",
+        "socket.gethostbyname",
+        "sqlite3.connect",
+        "subprocess.Popen",
+        "os.system",
+        "os.listdir",
+        "os.scandir",
+        "os.remove",
+        "os.rename",
+        "shutil.copyfile",
+        "urllib.Request",
+    }
+)
+
+# Frames from these files are reported as the caller of a sync I/O call
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total", "Times the event loop stayed blocked past the lag threshold"
+)
+SYNC_IO_CALLS = Counter(
+    "event_loop_sync_io_total", "Synchronous I/O calls made from coroutines", ["event"]
+)
+
+
+def _reading_source(frame) -> bool:
+    """Whether linecache is loading source lines to format a traceback"""
+    for _ in range(4):
+        if frame is None:
+            return False
+        if frame.f_code.co_filename == linecache.__file__:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def _caller(frame):
+    """Innermost frame of our own code, where a blocking call was made"""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_ROOT) and filename != __file__:
+            return frame
+        frame = frame.f_back
+    return None
+
+
+class LoopMonitor:
+    """
+    Samples event-loop lag with a task that sleeps `interval` and measures how
+    late it wakes up. A watchdog thread notices when that task hasn't run for
+    longer than `threshold` and logs the loop thread's stack at that moment,
+    i.e. the code that is blocking it.
+
+    In debug mode an audit hook also reports synchronous I/O (file opens,
+    blocking sockets, sqlite3.connect, time.sleep...) made from a coroutine,
+    once per call site. asyncio's own debug mode is left off: it records a
+    traceback for every callback, which slows the loop down by an order of
+    magnitude, and the watchdog already reports slow callbacks with a stack.
+    """
+
+    def __init__(
+        self,
+        mode: str = LOOP_MONITOR,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+    ):
+        self.enabled = mode in ("1", "debug")
+        self.debug = mode == "debug"
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._last_beat = 0.0
+        self._reported_beat = None
+        self._sync_io_sites = set()
+        self._hook_installed = False
+        self._in_hook = threading.local()
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        if self.debug and not self._hook_installed:
+            # Audit hooks can't be removed; the hook checks _loop_thread instead
+            sys.addaudithook(self._audit)
+            self._hook_installed = True
+        logging.info(
+            f"Event loop monitor started (threshold {self.threshold * 1000:.0f}ms"
+            f"{', debug mode' if self.debug else ''})"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._stopping.set()
+        self._watchdog.join(timeout=1)
+        self._loop_thread = None
+        logging.info(f"Event loop monitor stopped, loop blocked {self.blocked} times")
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                logging.warning(f"Event loop lagged {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        while not self._stopping.wait(self.threshold / 2):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or beat == self._reported_beat:
+                continue
+            # Report each stall once, with the stack as it is while still blocked
+            self._reported_beat = beat
+            self.blocked += 1
+            LOOP_BLOCKED.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(unavailable)\n"
+            logging.warning(
+                f"Event loop blocked for over {blocked * 1000:.0f}ms, "
+                f"loop thread stack:\n{stack.rstrip()}"
+            )
+
+    def _audit(self, event, args):
+        if event not in SYNC_IO_EVENTS or threading.get_ident() != self._loop_thread:
+            return
+        if getattr(self._in_hook, "active", False):
+            return
+        if event == "socket.connect" and args[0].gettimeout() == 0:
+            # Non-blocking connect, as asyncio's transports do
+            return
+        self._in_hook.active = True
+        try:
+            if asyncio.current_task(self._loop) is None or _reading_source(sys._getframe(1)):
+                return
+            SYNC_IO_CALLS.inc(event=event)
+            caller = _caller(sys._getframe(1))
+            site = (event, caller.f_code.co_filename, caller.f_lineno) if caller else (event,)
+            if site in self._sync_io_sites:
+                return
+            self._sync_io_sites.add(site)
+            target = args[0] if args else ""
+            stack = "".join(traceback.format_stack(caller or sys._getframe(1), limit=6))
+            logging.warning(f"Synchronous {event} {target!r} from a coroutine:\n{stack.rstrip()}")
+        finally:
+            self._in_hook.active = False
+
+
+loop_monitor = LoopMonitor()
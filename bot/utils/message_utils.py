@@ -1,6 +1,49 @@
+import asyncio
 import logging
+import os
+import time
 
+from telegram import InputMediaPhoto
 
+from .tracing import traced
+from .rate_limiter import (
+    BULK,
+    INTERACTIVE,
+    edit_text,
+    reply_media_group,
+    reply_photo,
+    reply_text,
+)
+
+# Telegram accepts 2-10 photos per sendMediaGroup call
+MEDIA_GROUP_SIZE = 10
+# Longest time a finished image waits for its album to fill up
+MEDIA_GROUP_FLUSH_DELAY = float(os.getenv("MEDIA_GROUP_FLUSH_DELAY", "3"))
+# Telegram caption limit for photos
+CAPTION_LIMIT = 1024
+# Minimum seconds between two progress edits of the same status message
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "3"))
+
+
+def format_prompt_text(prompt: str, limit: int = 4096, markdown: bool = True) -> str:
+    """
+    "📝 Prompt: `...`" text that fits in `limit` characters, with the prompt
+    in a Markdown code span, or as plain text when `markdown` is False.
+    """
+    if markdown:
+        # A backtick in the prompt would close the code span early and make
+        # Telegram reject the whole message; nothing else is special inside it
+        base_text, end = "📝 Prompt: `", "`"
+        prompt = prompt.replace("`", "'")
+    else:
+        base_text, end = "📝 Prompt: ", ""
+    room = limit - len(base_text) - len(end)
+    if len(prompt) > room:
+        prompt = prompt[: room - 3] + "..."
+    return base_text + prompt + end
+
+
+@traced("format_generation_message")
 async def format_generation_message(
     prompt: str, message=None, image_url=None, prediction_id=None
 ) -> str:
@@ -8,23 +51,210 @@ async def format_generation_message(
     Format and optionally send a message with image for generation results.
     """
     try:
-        base_text = "📝 Prompt: `"
-        hint_text = ""
-
-        if len(prompt) > 4093:
-            formatted_prompt = prompt[:4090] + "...`"
-        else:
-            formatted_prompt = prompt + "`"
-
-        formatted_text = base_text + formatted_prompt + hint_text
+        formatted_text = format_prompt_text(prompt)
 
         # If message and image_url are provided, send to chat
         if message and image_url:
-            await message.reply_photo(photo=image_url)
-            await message.reply_text(formatted_text, parse_mode="Markdown")
+            # Same priority for both so the prompt cannot overtake its photo
+            await reply_photo(message, photo=image_url, priority=INTERACTIVE)
+            await reply_text(message, formatted_text, parse_mode="Markdown")
             return None
 
         return formatted_text
     except Exception as e:
         logging.warning(f"Failed to format message: {e}")
         return "❌ Error formatting message"
+
+
+def progress_text(
+    completed: int, failed: int, total: int, elapsed: float, title: str = "Generando"
+) -> str:
+    """Status message for a batch, with an ETA from the time spent so far"""
+    done = completed + failed
+    text = f"⏳ {title} {done}/{total} imágenes\n✅ {completed}  ❌ {failed}"
+    remaining = total - done
+    if done and remaining > 0:
+        text += f"\n⏱️ Quedan ~{int(elapsed / done * remaining) + 1} s"
+    return text
+
+
+def _resolve(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class MediaGroupBatcher:
+    """
+    Collects finished images for one chat and delivers them as albums of up to
+    MEDIA_GROUP_SIZE photos, with the prompt as caption, instead of a photo
+    and a text message per image. An album is sent as soon as it is full or
+    MEDIA_GROUP_FLUSH_DELAY seconds after its first image arrived, so the
+    first results of a long batch are not held back.
+    """
+
+    def __init__(
+        self,
+        message,
+        max_size: int = MEDIA_GROUP_SIZE,
+        flush_delay: float = MEDIA_GROUP_FLUSH_DELAY,
+    ):
+        self.message = message
+        self.max_size = max(1, min(max_size, MEDIA_GROUP_SIZE))
+        self.flush_delay = flush_delay
+        self.pending = []
+        self.sent_groups = 0
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    async def add(self, image_url: str, prompt: str) -> asyncio.Future:
+        """
+        Queue an image; sends the album right away once it is full. Returns a
+        future set to True once the image was sent, False if that failed.
+        """
+        sent = asyncio.get_running_loop().create_future()
+        self.pending.append((image_url, prompt, sent))
+        if len(self.pending) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return sent
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._timer = None
+        await self.flush()
+
+    @traced("MediaGroupBatcher.flush")
+    async def flush(self):
+        """Send everything queued so far"""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            while self.pending:
+                items = self.pending[: self.max_size]
+                del self.pending[: self.max_size]
+                await self._send(items)
+
+    async def close(self):
+        """Deliver whatever is left at the end of a batch"""
+        await self.flush()
+
+    async def _send(self, items: list):
+        prompts = {prompt for _, prompt, _ in items}
+        # A batch of one prompt only needs it once, on the album's first photo
+        captions = [
+            format_prompt_text(prompt, CAPTION_LIMIT)
+            if len(prompts) > 1 or i == 0
+            else None
+            for i, (_, prompt, _) in enumerate(items)
+        ]
+        try:
+            if len(items) == 1:
+                await reply_photo(
+                    self.message,
+                    photo=items[0][0], caption=captions[0], parse_mode="Markdown"
+                )
+            else:
+                await reply_media_group(
+                    self.message,
+                    media=[
+                        InputMediaPhoto(
+                            media=url, caption=caption, parse_mode="Markdown"
+                        )
+                        for (url, _, _), caption in zip(items, captions)
+                    ]
+                )
+            self.sent_groups += 1
+            for _, _, sent in items:
+                _resolve(sent, True)
+        except Exception as e:
+            # One bad photo fails the whole album, don't lose the others with it.
+            # Plain captions, so a caption Telegram couldn't parse can't fail
+            # every photo again
+            logging.warning(f"Media group delivery failed, sending one by one: {e}")
+            for url, prompt, sent in items:
+                try:
+                    await reply_photo(
+                        self.message,
+                        photo=url,
+                        caption=format_prompt_text(prompt, CAPTION_LIMIT, markdown=False),
+                    )
+                    _resolve(sent, True)
+                except Exception as e:
+                    logging.error(f"Failed to deliver image {url}: {e}")
+                    _resolve(sent, False)
+
+
+class BatchProgress:
+    """
+    Live progress for a batch's status message. Image tasks call report()
+    as they finish, which only updates counters; a single pending edit shows
+    the latest counts and ETA at most once every PROGRESS_EDIT_INTERVAL
+    seconds, however many images finish in between.
+    """
+
+    def __init__(
+        self,
+        status_message,
+        total: int,
+        title: str = "Generando",
+        interval: float = PROGRESS_EDIT_INTERVAL,
+    ):
+        self.status_message = status_message
+        self.total = total
+        self.title = title
+        self.interval = interval
+        self.completed = 0
+        self.failed = 0
+        self.edits = 0
+        self.started_at = time.monotonic()
+        self._last_edit_at = self.started_at
+        self._last_text = None
+        self._pending = None
+
+    def report(self, ok: bool = True, count: int = 1):
+        """Record finished images and schedule a coalesced edit"""
+        if ok:
+            self.completed += count
+        else:
+            self.failed += count
+        if self._pending is None:
+            self._pending = asyncio.create_task(self._edit_later())
+
+    def render(self) -> str:
+        return progress_text(
+            self.completed,
+            self.failed,
+            self.total,
+            time.monotonic() - self.started_at,
+            self.title,
+        )
+
+    async def _edit_later(self):
+        # Only one edit is ever in flight; reports arriving meanwhile are
+        # picked up by the next one
+        while True:
+            delay = self._last_edit_at + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = self.render()
+            # Telegram rejects edits that don't change the text
+            if text == self._last_text:
+                break
+            self._last_text = text
+            try:
+                await edit_text(self.status_message, text, priority=BULK)
+                self.edits += 1
+            except Exception as e:
+                logging.warning(f"Failed to update batch progress: {e}")
+            self._last_edit_at = time.monotonic()
+            if self.completed + self.failed >= self.total:
+                break
+        self._pending = None
+
+    async def close(self):
+        """Drop the pending edit, the status message is about to go away"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
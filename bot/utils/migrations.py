@@ -0,0 +1,212 @@
+import logging
+import sqlite3
+
+
+def create_user_configs(conn: sqlite3.Connection):
+    """User configurations table"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_configs (
+            user_id INTEGER PRIMARY KEY,
+            config TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+# Columns of the predictions history table, in insert order
+PREDICTION_COLUMNS = {
+    "prediction_id": "TEXT NOT NULL",
+    "user_id": "INTEGER",
+    "prompt": "TEXT",
+    "output_url": "TEXT",
+    "input_params": "TEXT",
+    "style": "TEXT",
+    "seed": "INTEGER",
+    "latency_ms": "INTEGER",
+    "status": "TEXT",
+    "created_at": "TEXT",
+}
+
+
+def create_predictions(conn: sqlite3.Connection):
+    """
+    Generation history table. Older deployments may already have a partial
+    predictions table created by hand, so missing columns are added in place.
+    """
+    columns = ",\n".join(f"{name} {kind}" for name, kind in PREDICTION_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS predictions (\n{columns}\n)")
+
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(predictions)")}
+    for name, kind in PREDICTION_COLUMNS.items():
+        if name not in existing:
+            # ALTER TABLE cannot add NOT NULL columns without a default
+            conn.execute(
+                f"ALTER TABLE predictions ADD COLUMN {name} {kind.replace(' NOT NULL', '')}"
+            )
+            logging.info(f"Added column predictions.{name}")
+
+    # Legacy rows only ever stored successful generations and had no timestamp;
+    # give them the epoch so they sort last in the history instead of vanishing
+    conn.execute("UPDATE predictions SET status = 'succeeded' WHERE status IS NULL")
+    conn.execute(
+        "UPDATE predictions SET created_at = '1970-01-01 00:00:00.000000' "
+        "WHERE created_at IS NULL"
+    )
+
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_prediction_id "
+        "ON predictions (prediction_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_predictions_user_created "
+        "ON predictions (user_id, created_at)"
+    )
+
+
+def create_analysis_cache(conn: sqlite3.Connection):
+    """
+    Image descriptions keyed by photo identity (Telegram file_unique_id or a
+    content hash) plus trigger word and analysis prompt version.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            description TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used "
+        "ON analysis_cache (last_used_at)"
+    )
+
+
+def create_prompt_pool(conn: sqlite3.Connection):
+    """
+    Pre-generated prompts per (style, gender, trigger_word), and the prompts
+    already served to each user so they are never handed out to them twice.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS prompt_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            style TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            trigger_word TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            prompt_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_prompt_pool_key_hash "
+        "ON prompt_pool (style, gender, trigger_word, prompt_hash)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS served_prompts (
+            user_id INTEGER NOT NULL,
+            prompt_hash TEXT NOT NULL,
+            served_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, prompt_hash)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def create_job_queue(conn: sqlite3.Connection):
+    """
+    Image generation jobs handed from the bot to worker processes, and the
+    per-batch counters used to tell when a queued batch is finished.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            batch_id TEXT,
+            user_id INTEGER,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            available_at REAL NOT NULL,
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_available "
+        "ON jobs (status, available_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_lease "
+        "ON jobs (status, lease_expires_at)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_batches (
+            batch_id TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            succeeded INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def add_batch_progress(conn: sqlite3.Connection):
+    """
+    Progress state of queued batches shared by the bot and its workers: when
+    the batch started, for the ETA, and when its status message was last
+    edited, so the processes take turns instead of each editing it.
+    """
+    conn.execute("ALTER TABLE job_batches ADD COLUMN started_at REAL")
+    conn.execute("ALTER TABLE job_batches ADD COLUMN progress_edited_at REAL")
+
+
+# Ordered schema migrations; the applied version is stored in PRAGMA user_version.
+# Append new steps at the end, never edit or reorder released ones.
+MIGRATIONS = [
+    (1, create_user_configs),
+    (2, create_predictions),
+    (3, create_analysis_cache),
+    (4, create_prompt_pool),
+    (5, create_job_queue),
+    (6, add_batch_progress),
+]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Apply every migration newer than the database's user_version, each one in
+    its own transaction. Returns the resulting schema version.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying database migration {version}: {migration.__name__}")
+        try:
+            conn.execute("BEGIN")
+            migration(conn)
+            # PRAGMA doesn't accept bound parameters; version is a trusted int
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.error(f"Database migration {version} failed", exc_info=True)
+            raise
+        current = version
+    return current
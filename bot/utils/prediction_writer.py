@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+
+# Flush as soon as this many predictions are buffered...
+FLUSH_BATCH_SIZE = int(os.getenv("PREDICTION_FLUSH_SIZE", "50"))
+# ...or after this many seconds, whichever comes first
+FLUSH_INTERVAL = float(os.getenv("PREDICTION_FLUSH_INTERVAL", "1.0"))
+# Upper bound of buffered rows; past it enqueue flushes inline before returning
+MAX_PENDING = int(os.getenv("PREDICTION_MAX_PENDING", "1000"))
+
+
+class PredictionWriter:
+    """
+    Write-behind buffer for prediction rows. Callers get control back as soon
+    as the row is buffered; a background task writes buffered rows in a single
+    executemany transaction when the batch is full or the interval elapses.
+    """
+
+    def __init__(
+        self,
+        pool,
+        insert_sql: str,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.pool = pool
+        self.insert_sql = insert_sql
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        # prediction_id -> row, insertion ordered; rows leave only once committed
+        self._pending = {}
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, row: tuple):
+        """
+        Buffer a row whose first column is the prediction_id. If the buffer is
+        full the caller flushes synchronously, applying backpressure.
+        """
+        self._ensure_started()
+        if len(self._pending) >= self.max_pending:
+            logging.warning(
+                f"Prediction buffer full ({len(self._pending)} rows), flushing inline"
+            )
+            try:
+                await self.flush()
+            except Exception as e:
+                # Never grow without bound when the database keeps failing
+                dropped = list(self._pending)[: self.batch_size]
+                for prediction_id in dropped:
+                    self._pending.pop(prediction_id, None)
+                logging.error(
+                    f"Inline prediction flush failed, dropped {len(dropped)} rows: {e}"
+                )
+
+        self._pending[row[0]] = row
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def get_pending(self, prediction_id):
+        """Return a buffered row that has not been written yet, if any"""
+        return self._pending.get(prediction_id)
+
+    async def _run(self):
+        while True:
+            try:
+                async with asyncio.timeout(self.flush_interval):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Rows stay buffered and are retried on the next flush
+                logging.error(f"Error flushing predictions: {e}", exc_info=True)
+
+    async def flush(self):
+        """Write every buffered row in one transaction"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            rows = list(self._pending.values())
+            if not rows:
+                return
+            async with self.pool.acquire() as conn:
+                await conn.executemany(self.insert_sql, rows)
+                await conn.commit()
+            for row in rows:
+                self._pending.pop(row[0], None)
+            logging.debug(f"Flushed {len(rows)} predictions")
+
+    async def close(self):
+        """Stop the background task and flush whatever is still buffered"""
+        if self._task is not None:
+            # Cancel between flushes: a write cancelled after its commit would
+            # leave the rows buffered and insert them a second time below
+            async with self._flush_lock:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,253 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from telegram.error import RetryAfter
+
+from .metrics import CallbackMetric, Counter, Histogram
+from .tracing import span
+
+# Share of the bot token's limits this process may use. Buckets live in each
+# process, so when the bot and N queue workers send for the same token give
+# each of them 1 / (N + 1) to stay within Telegram's limits overall
+RATE_SHARE = float(os.getenv("TELEGRAM_RATE_SHARE", "1"))
+# Telegram allows about 30 messages per second overall and about 1 per second
+# per chat, with short bursts tolerated
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")) * RATE_SHARE
+CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1")) * RATE_SHARE
+CHAT_BURST = max(1, int(int(os.getenv("TELEGRAM_CHAT_BURST", "3")) * RATE_SHARE))
+# Global tokens only interactive replies may use, so bulk photos for many
+# chats cannot starve /help or /config answers
+INTERACTIVE_RESERVE = float(os.getenv("TELEGRAM_INTERACTIVE_RESERVE", "5")) * RATE_SHARE
+# Times a send is retried after Telegram answers with RetryAfter
+MAX_FLOOD_RETRIES = 3
+
+# Send priorities, lower goes first
+INTERACTIVE = 0
+BULK = 1
+
+SEND_DURATION = Histogram(
+    "telegram_send_duration_seconds",
+    "Duration of Bot API calls, excluding time spent waiting for rate limits",
+    ["method"],
+)
+SEND_WAIT = Histogram(
+    "telegram_send_wait_seconds", "Time Bot API calls waited for rate limits", ["method"]
+)
+SEND_ERRORS = Counter(
+    "telegram_send_errors_total", "Failed Bot API calls by error class", ["method", "error"]
+)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, now: float, reserve: float = 0.0) -> float:
+        """Seconds until a token is available while keeping `reserve` untouched"""
+        self._refill(now)
+        missing = 1 + reserve - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _ChatState:
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+        self.waiting = []  # heap of (priority, sequence) tickets
+        self.changed = asyncio.Condition()
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class OutboundLimiter:
+    """
+    Paces outbound Bot API calls with a global token bucket plus one bucket per
+    chat. Within a chat, interactive replies are sent before queued bulk
+    deliveries. A RetryAfter from Telegram pauses only the chat it was raised
+    for, and the call is retried once the pause is over.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        interactive_reserve: float = INTERACTIVE_RESERVE,
+    ):
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.interactive_reserve = interactive_reserve
+        self.chats = {}
+        self._sequence = itertools.count()
+        self.sent = 0
+        self.flood_waits = 0
+        self.total_wait = 0.0
+
+    def _chat(self, chat_id) -> _ChatState:
+        state = self.chats.get(chat_id)
+        if state is None:
+            state = self.chats[chat_id] = _ChatState(self.chat_rate, self.chat_burst)
+        return state
+
+    def pause(self, chat_id, seconds: float):
+        """Hold back every send to `chat_id` for `seconds`"""
+        state = self._chat(chat_id)
+        state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+
+    @staticmethod
+    async def _notify(state: _ChatState):
+        async with state.changed:
+            state.changed.notify_all()
+
+    async def _acquire(self, chat_id, priority: int):
+        state = self._chat(chat_id)
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(state.waiting, ticket)
+        await self._notify(state)
+        started = time.monotonic()
+        try:
+            while True:
+                async with state.changed:
+                    timeout = None
+                    if state.waiting[0] == ticket:
+                        now = time.monotonic()
+                        reserve = (
+                            0.0 if priority == INTERACTIVE else self.interactive_reserve
+                        )
+                        timeout = max(
+                            state.paused_until - now,
+                            state.bucket.wait_time(now),
+                            self.global_bucket.wait_time(now, reserve),
+                        )
+                        if timeout <= 0:
+                            state.bucket.take()
+                            self.global_bucket.take()
+                            return
+                    # Wake up early when the head of the queue changes
+                    try:
+                        async with asyncio.timeout(timeout):
+                            await state.changed.wait()
+                    except TimeoutError:
+                        pass
+        finally:
+            state.waiting.remove(ticket)
+            heapq.heapify(state.waiting)
+            self.total_wait += time.monotonic() - started
+            await self._notify(state)
+
+    async def send(self, chat_id, operation, priority: int = BULK, method: str = "other"):
+        """
+        Await `operation()` once the chat and global budgets allow it.
+        Args:
+            chat_id: Chat the call targets
+            operation: Zero-argument callable returning the Bot API coroutine
+            priority: INTERACTIVE or BULK
+            method: Bot API method name, used as metric label
+        """
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            with span("telegram.rate_limit"), SEND_WAIT.time(method=method):
+                await self._acquire(chat_id, priority)
+            try:
+                with span(f"telegram.{method}"), SEND_DURATION.time(method=method):
+                    result = await operation()
+                self.sent += 1
+                return result
+            except Exception as e:
+                SEND_ERRORS.inc(method=method, error=type(e).__name__)
+                if not isinstance(e, RetryAfter):
+                    raise
+                if attempt == MAX_FLOOD_RETRIES:
+                    raise
+                seconds = retry_after_seconds(e)
+                self.flood_waits += 1
+                logging.warning(
+                    f"Flood control for chat {chat_id}, pausing it for {seconds:.0f}s"
+                )
+                self.pause(chat_id, seconds)
+                await self._notify(self._chat(chat_id))
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "flood_waits": self.flood_waits,
+            "total_wait": self.total_wait,
+            "queued": sum(len(state.waiting) for state in self.chats.values()),
+        }
+
+
+outbound_limiter = OutboundLimiter()
+
+CallbackMetric(
+    "telegram_sends_queued",
+    "Bot API calls waiting for rate limits",
+    lambda: outbound_limiter.stats()["queued"],
+)
+CallbackMetric(
+    "telegram_flood_waits_total",
+    "RetryAfter answers from Telegram",
+    lambda: outbound_limiter.flood_waits,
+    type="counter",
+)
+
+
+async def reply_text(message, *args, priority: int = INTERACTIVE, **kwargs):
+    return await outbound_limiter.send(
+        message.chat_id, lambda: message.reply_text(*args, **kwargs),
+        priority,
+        method="sendMessage",
+    )
+
+
+async def reply_photo(message, *args, priority: int = BULK, **kwargs):
+    return await outbound_limiter.send(
+        message.chat_id, lambda: message.reply_photo(*args, **kwargs),
+        priority,
+        method="sendPhoto",
+    )
+
+
+async def reply_media_group(message, *args, priority: int = BULK, **kwargs):
+    return await outbound_limiter.send(
+        message.chat_id, lambda: message.reply_media_group(*args, **kwargs),
+        priority,
+        method="sendMediaGroup",
+    )
+
+
+async def edit_text(message, *args, priority: int = INTERACTIVE, **kwargs):
+    return await outbound_limiter.send(
+        message.chat_id, lambda: message.edit_text(*args, **kwargs),
+        priority,
+        method="editMessageText",
+    )
+
+
+async def delete_message(message, priority: int = BULK):
+    return await outbound_limiter.send(
+        message.chat_id, message.delete, priority, method="deleteMessage"
+    )
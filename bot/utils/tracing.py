@@ -0,0 +1,348 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Directory finished spans are written to as OTLP/JSON lines (one file per
+# process); empty disables export, trace IDs still show up in the logs
+TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR", "")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "pixel-prophet-bot")
+# Finished spans buffered before a write, unless a root span ends first
+TRACE_EXPORT_BATCH = int(os.getenv("TRACE_EXPORT_BATCH", "512"))
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class Span:
+    """One timed operation of a trace, shaped after the OpenTelemetry span model"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "remote_parent",
+        "attributes",
+        "events",
+        "status",
+        "status_message",
+        "start_ns",
+        "end_ns",
+        "_started",
+        "_tracer",
+    )
+
+    def __init__(
+        self, tracer, name: str, trace_id: str, parent_id, attributes: dict, remote_parent=False
+    ):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        # Parent lives in another process (e.g. the bot that enqueued a job)
+        self.remote_parent = remote_parent
+        self.attributes = attributes
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        # Durations come from the monotonic clock, wall time only anchors the start
+        self._started = time.perf_counter_ns()
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value, to continue the trace in another process"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+        self.events.append(
+            {
+                "timeUnixNano": str(time.time_ns()),
+                "name": "exception",
+                "attributes": _otlp_attributes(
+                    {"exception.type": type(exc).__name__, "exception.message": str(exc)}
+                ),
+            }
+        )
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+        self._tracer.on_end(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def parse_traceparent(value: str):
+    """(trace_id, parent span_id) from a W3C traceparent, or None if malformed"""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+class JsonSpanExporter:
+    """
+    Appends finished spans to `<directory>/spans-<pid>.jsonl`, one OTLP/JSON
+    ExportTraceServiceRequest per line: the format of the OpenTelemetry
+    Collector's otlpjsonfile receiver, and what bench/trace_summary.py reads.
+
+    Like the log listener, export() only takes a snapshot of the spans on the
+    calling thread (the event loop); encoding and the file append happen in
+    a writer thread. shutdown() waits for it to write what is still queued.
+    """
+
+    def __init__(self, directory: str, service_name: str = SERVICE_NAME):
+        self.path = Path(directory) / f"spans-{os.getpid()}.jsonl"
+        self.resource = {
+            "attributes": _otlp_attributes(
+                {"service.name": service_name, "process.pid": os.getpid()}
+            )
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: list):
+        self._queue.put([span.to_otlp() for span in spans])
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write, name="span-exporter", daemon=True
+                )
+                self._writer.start()
+
+    def _request(self, spans: list) -> str:
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": "bot"}, "spans": spans}],
+                }
+            ]
+        }
+        return json.dumps(request, separators=(",", ":")) + "\n"
+
+    def _write(self):
+        stopping = False
+        while not stopping:
+            batches = [self._queue.get()]
+            # Whatever else queued up meanwhile goes out in the same append
+            while not self._queue.empty():
+                batches.append(self._queue.get())
+            if None in batches:
+                stopping = True
+                batches = [batch for batch in batches if batch is not None]
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(self._request(spans) for spans in batches)
+            except Exception as e:
+                logging.error(f"Error exporting {len(batches)} span batches: {e}")
+
+    def shutdown(self, timeout: float = 5):
+        """Write the spans still queued and stop the writer thread"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join(timeout)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporter in batches"""
+
+    def __init__(self, exporter=None, batch_size: int = TRACE_EXPORT_BATCH):
+        self.exporter = exporter
+        self.batch_size = max(1, batch_size)
+        self._finished = []
+
+    def start_span(self, name: str, parent=None, root: bool = False, attributes=None) -> Span:
+        """
+        Start a span under `parent` (a Span or a traceparent string), by default
+        under the current span. With `root` it starts a new trace instead.
+        """
+        if parent is None and not root:
+            parent = _current_span.get()
+        remote = isinstance(parent, str)
+        if remote:
+            parent = parse_traceparent(parent)
+        elif isinstance(parent, Span):
+            parent = (parent.trace_id, parent.span_id)
+        if parent:
+            trace_id, parent_id = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+        return Span(
+            self,
+            name,
+            trace_id,
+            parent_id,
+            attributes or {},
+            remote_parent=remote and parent_id is not None,
+        )
+
+    def on_end(self, span: Span):
+        if self.exporter is None:
+            return
+        self._finished.append(span)
+        # A span without a local parent closes a command or a job: write it
+        # out together with its children
+        local_root = span.parent_id is None or span.remote_parent
+        if local_root or len(self._finished) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._finished:
+            return
+        spans, self._finished = self._finished, []
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logging.error(f"Error exporting {len(spans)} spans: {e}")
+
+    def shutdown(self):
+        """Export the buffered spans and wait until the exporter wrote them"""
+        self.flush()
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+tracer = Tracer(JsonSpanExporter(TRACE_EXPORT_DIR) if TRACE_EXPORT_DIR else None)
+# Spans of a process exiting without on_shutdown still reach the file
+atexit.register(tracer.shutdown)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    """traceparent of the current span, to hand to a job or another process"""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def set_span_attributes(**attributes):
+    """Add attributes to the current span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+
+@contextmanager
+def span(name: str, parent=None, root: bool = False, **attributes):
+    """
+    Run the block as a span, the current span for whatever it calls or spawns.
+    Errors mark the span as failed and propagate. Don't yield from an async
+    generator inside the block: the span would leak into the consumer.
+
+    Args:
+        name: Operation name
+        parent: Span or traceparent string; defaults to the current span
+        root: Start a new trace even if a span is current
+        **attributes: Span attributes
+    """
+    current = tracer.start_span(name, parent, root, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: str = None, **attributes):
+    """Decorator running every call of a coroutine function as a span"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def install_log_correlation():
+    """
+    Give every log record `trace_id` and `span_id` attributes from the span
+    current where it was logged ("-" outside of any span).
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "adds_trace_context", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        current = _current_span.get()
+        record.trace_id = current.trace_id if current else "-"
+        record.span_id = current.span_id if current else "-"
+        return record
+
+    record_factory.adds_trace_context = True
+    logging.setLogRecordFactory(record_factory)
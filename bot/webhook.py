@@ -0,0 +1,191 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+# Address the webhook server binds to, and the path Telegram posts updates to
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Public base URL (e.g. https://bot.example.com); when set, the webhook is
+# registered with Telegram on startup. Leave empty if it's managed elsewhere.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token on every update
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+# How long shutdown waits for in-flight updates (whole batches) to finish
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "600"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates over HTTP and feeds them to the application, as
+    an alternative to long polling that can run as several replicas behind a
+    load balancer. Also serves /healthz (process is up) and /readyz (accepting
+    updates), and drains in-flight updates before shutting down.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        listen: str = WEBHOOK_LISTEN,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+        secret_token: str = WEBHOOK_SECRET_TOKEN,
+        webhook_url: str = WEBHOOK_URL,
+        drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+    ):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET_TOKEN must be set in webhook mode")
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.updates_received = 0
+        self.updates_rejected = 0
+        self._runner = None
+        self._stop = asyncio.Event()
+        # Handler tasks of the updates in flight
+        self._tasks = set()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/readyz", self.readyz)
+        return app
+
+    @property
+    def ready(self) -> bool:
+        return self.application.running and not self.draining
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.updates_rejected += 1
+            logging.warning(f"Rejected webhook request from {request.remote}: bad secret token")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            # Retrying a body Telegram can't have sent won't help, unlike a 5xx
+            logging.warning(f"Rejected malformed webhook update from {request.remote}: {e!r}")
+            return web.Response(status=400)
+        if not self.ready:
+            # Telegram retries non-2xx deliveries, possibly on another replica
+            return web.Response(status=503)
+
+        # Dispatched here instead of through application.update_queue, so
+        # shutdown knows which handlers are still running and can cancel them
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.updates_received += 1
+        return web.Response()
+
+    async def _process(self, update: Update):
+        application = self.application
+        try:
+            # The update processor applies the concurrent_updates limit
+            await application.update_processor.process_update(
+                update, application.process_update(update)
+            )
+        except Exception as e:
+            logging.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def readyz(self, request: web.Request) -> web.Response:
+        status = "ready" if self.ready else "draining" if self.draining else "starting"
+        return web.json_response({"status": status}, status=200 if self.ready else 503)
+
+    @property
+    def addresses(self) -> list:
+        """Bound (host, port) pairs, useful when started with port 0"""
+        return self._runner.addresses if self._runner else []
+
+    async def start(self):
+        """Start the application and the HTTP server, registering the webhook if configured"""
+        await self.application.initialize()
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logging.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+        if self.webhook_url:
+            url = self.webhook_url.rstrip("/") + self.path
+            await self.application.bot.set_webhook(
+                url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logging.info(f"Webhook registered with Telegram: {url}")
+
+    async def shutdown(self):
+        """
+        Stop taking updates, wait for the ones in flight, then release resources.
+        The webhook stays registered so other replicas keep receiving updates.
+        """
+        self.draining = True
+        if self._tasks:
+            logging.info(
+                f"Draining {len(self._tasks)} in-flight updates "
+                f"(up to {self.drain_timeout:.0f}s) before shutdown..."
+            )
+            _, pending = await asyncio.wait(list(self._tasks), timeout=self.drain_timeout)
+            if pending:
+                logging.warning(
+                    f"Drain timeout reached, cancelling {len(pending)} remaining updates"
+                )
+                for task in pending:
+                    task.cancel()
+                # They must be gone before post_shutdown closes the database
+                # and HTTP pools their handlers use
+                await asyncio.gather(*pending, return_exceptions=True)
+            else:
+                logging.info("All in-flight updates finished")
+        # Waits for tasks handlers started with application.create_task
+        await self.application.stop()
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.application.shutdown()
+        if self.application.post_shutdown:
+            await self.application.post_shutdown(self.application)
+
+    def stop(self):
+        """Ask serve() to shut down"""
+        self._stop.set()
+
+    async def serve(self):
+        """Run until SIGINT/SIGTERM or stop(), then shut down gracefully"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not available on Windows or outside the main thread
+                pass
+
+        await self.start()
+        try:
+            await self._stop.wait()
+        finally:
+            await self.shutdown()
@@ -0,0 +1,305 @@
+import asyncio
+import datetime
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from telegram import Bot, Chat, Message
+from telegram.request import HTTPXRequest
+
+from .services.job_queue import (
+    GENERATE_IMAGE,
+    JOB_LEASE_SECONDS,
+    JOB_QUEUE_BACKEND,
+    Job,
+    JobQueue,
+    create_job_queue,
+    show_batch_progress,
+)
+from .services.replicate_service import ReplicateService
+from .utils.database import db
+from .utils.http import http_client
+from .utils.logging_config import setup_logging
+from .utils.loop_monitor import loop_monitor
+from .utils.metrics import Counter, Gauge, MetricsServer
+from .utils.tracing import span, tracer
+from .utils.message_utils import MediaGroupBatcher
+
+# Jobs a worker process runs at once
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "16"))
+# Seconds between claims while the queue is empty
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1"))
+# How long a stopping worker lets running jobs finish before handing them back
+WORKER_DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "120"))
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "")
+# Port for this worker's /metrics endpoint; 0 (default) disables it, give
+# each worker on a host its own port
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+JOBS_RUNNING = Gauge("worker_jobs_running", "Jobs this worker is running", ["kind"])
+JOBS_FINISHED = Counter(
+    "worker_jobs_finished_total", "Jobs this worker finished, by outcome", ["kind", "outcome"]
+)
+
+
+class _LocalBatch:
+    """Album batcher shared by the jobs of one batch running in this worker"""
+
+    def __init__(self, message: Message):
+        self.delivery = MediaGroupBatcher(message)
+        self.running = 0
+
+
+class _JobDelivery:
+    """
+    One job's view of its batch's album: keeps the future of the image the
+    job handed over, so the job is acknowledged only once it was sent.
+    """
+
+    def __init__(self, batcher: MediaGroupBatcher):
+        self.batcher = batcher
+        self.sent = None
+
+    async def add(self, image_url: str, prompt: str):
+        self.sent = await self.batcher.add(image_url, prompt)
+
+
+class JobWorker:
+    """
+    Claims generation jobs from the queue, runs them through ReplicateService
+    and delivers the images to the chat. Leases are renewed while jobs run,
+    so only a dead worker's jobs become visible to the others again.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        bot: Bot,
+        concurrency: int = WORKER_CONCURRENCY,
+        lease: float = JOB_LEASE_SECONDS,
+        poll_interval: float = WORKER_POLL_INTERVAL,
+        drain_timeout: float = WORKER_DRAIN_TIMEOUT,
+    ):
+        self.queue = queue
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.drain_timeout = drain_timeout
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.jobs_done = 0
+        self._running = {}
+        self._batches = {}
+        self._stop = asyncio.Event()
+        self._wake = asyncio.Event()
+
+    def message(self, chat_id: int, chat_type: str, message_id: int) -> Message:
+        """A Message bound to our bot, to reply to a chat the bot front-end saw"""
+        message = Message(
+            message_id=message_id,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            chat=Chat(id=chat_id, type=chat_type),
+        )
+        message.set_bot(self.bot)
+        return message
+
+    async def generate(self, job: Job) -> bool:
+        payload = job.payload
+        message = self.message(
+            payload["chat_id"], payload["chat_type"], payload["message_id"]
+        )
+        batch = self._batches.get(job.batch_id)
+        if batch is None:
+            batch = self._batches[job.batch_id] = _LocalBatch(message)
+        batch.running += 1
+        delivery = _JobDelivery(batch.delivery)
+        try:
+            image_url, _ = await ReplicateService.generate_image(
+                payload["prompt"],
+                user_id=payload["user_id"],
+                message=message,
+                operation_type="batch",
+                config=payload["config"],
+                style=payload.get("style"),
+                delivery=delivery,
+            )
+            if delivery.sent is not None:
+                # The album waits up to MEDIA_GROUP_FLUSH_DELAY for more images;
+                # completing the job before it is sent would lose the image if
+                # the worker died in that window
+                if not await delivery.sent:
+                    image_url = None
+        finally:
+            batch.running -= 1
+            if not batch.running:
+                del self._batches[job.batch_id]
+                await batch.delivery.close()
+        return image_url is not None
+
+    async def report(self, job: Job, counts):
+        """Show the batch counts returned when the job was counted, if any"""
+        if counts is None:
+            return
+        payload = job.payload
+        status = self.message(
+            payload["chat_id"], payload["chat_type"], payload["status_message_id"]
+        )
+        try:
+            await show_batch_progress(self.queue, status, job.batch_id, counts)
+        except Exception as e:
+            logging.error(f"Error reporting batch {job.batch_id}: {e}", exc_info=True)
+
+    async def run_job(self, job: Job):
+        # Part of the trace of the command that enqueued it
+        with span(
+            f"job.{job.kind}",
+            parent=job.payload.get("traceparent"),
+            job_id=job.id,
+            attempt=job.attempts,
+        ):
+            await self.process(job)
+
+    async def process(self, job: Job):
+        outcome = "error"
+        JOBS_RUNNING.inc(kind=job.kind)
+        try:
+            if job.exhausted:
+                # Its lease ran out on every attempt, the job keeps killing workers
+                logging.error(f"Job {job.id} gave up after {job.max_attempts} attempts")
+                counts = await self.queue.fail(
+                    job, self.worker_id, "lease expired", retry=False
+                )
+                outcome = "exhausted"
+                await self.report(job, counts)
+                return
+            if job.kind != GENERATE_IMAGE:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+
+            ok = await self.generate(job)
+            # Generation errors were already retried and recorded in the
+            # history, a failed image is a finished job too
+            counts = await self.queue.complete(job, self.worker_id, ok)
+            self.jobs_done += 1
+            outcome = "ok" if ok else "failed"
+            await self.report(job, counts)
+        except asyncio.CancelledError:
+            # Stopping before it finished: hand it to another worker
+            await self.queue.fail(job, self.worker_id, "worker stopped")
+            outcome = "handed_back"
+            raise
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}", exc_info=True)
+            await self.report(job, await self.queue.fail(job, self.worker_id, str(e)))
+        finally:
+            JOBS_RUNNING.dec(kind=job.kind)
+            JOBS_FINISHED.inc(kind=job.kind, outcome=outcome)
+            self._running.pop(job.id, None)
+            self._wake.set()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if self._running:
+                try:
+                    await self.queue.extend(self.worker_id, list(self._running), self.lease)
+                except Exception as e:
+                    logging.error(f"Error renewing job leases: {e}")
+
+    async def _wait(self):
+        """Sleep until a job finishes, stop() is called or the poll interval passes"""
+        try:
+            async with asyncio.timeout(self.poll_interval):
+                await self._wake.wait()
+        except TimeoutError:
+            pass
+        self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    async def run(self):
+        logging.info(
+            f"Worker {self.worker_id} started ({self.concurrency} concurrent jobs)"
+        )
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while not self._stop.is_set():
+                free = self.concurrency - len(self._running)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = await self.queue.claim(self.worker_id, free, self.lease)
+                    except Exception as e:
+                        logging.error(f"Error claiming jobs: {e}")
+                for job in jobs:
+                    self._running[job.id] = asyncio.create_task(self.run_job(job))
+                if not jobs or len(self._running) >= self.concurrency:
+                    await self._wait()
+
+            if self._running:
+                logging.info(f"Worker stopping, waiting for {len(self._running)} jobs...")
+                _, pending = await asyncio.wait(
+                    list(self._running.values()), timeout=self.drain_timeout
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+        logging.info(f"Worker {self.worker_id} stopped after {self.jobs_done} jobs")
+
+
+async def serve_worker():
+    queue = create_job_queue(JOB_QUEUE_BACKEND or "sqlite")
+    request = HTTPXRequest(
+        connection_pool_size=WORKER_CONCURRENCY + 8,
+        read_timeout=30,
+        write_timeout=30,
+        connect_timeout=30,
+    )
+    if TELEGRAM_BASE_URL:
+        bot = Bot(
+            os.getenv("BOT_TOKEN"),
+            base_url=f"{TELEGRAM_BASE_URL.rstrip('/')}/bot",
+            request=request,
+        )
+    else:
+        bot = Bot(os.getenv("BOT_TOKEN"), request=request)
+    worker = JobWorker(queue, bot)
+    metrics_server = MetricsServer(port=WORKER_METRICS_PORT)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        await metrics_server.start()
+        await loop_monitor.start()
+        async with bot:
+            await worker.run()
+    finally:
+        await loop_monitor.stop()
+        await metrics_server.stop()
+        tracer.shutdown()
+        await queue.close()
+        await db.close()
+        await http_client.close()
+
+
+def run_worker():
+    """
+    Run a generation worker process. Start as many as needed, on this host
+    with JOB_QUEUE_BACKEND=sqlite or anywhere with JOB_QUEUE_BACKEND=redis.
+    """
+    setup_logging()
+    asyncio.run(serve_worker())
+
+
+if __name__ == "__main__":
+    run_worker()
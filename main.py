@@ -1,5 +1,4 @@
 from dotenv import load_dotenv
-import asyncio
 
 # Load environment variables, overriding existing ones
 load_dotenv(override=True)
@@ -8,4 +7,5 @@ load_dotenv(override=True)
 from bot.bot import run_bot
 
 if __name__ == "__main__":
-    asyncio.run(run_bot())
+    # run_bot() manages its own event loop (run_polling or the webhook server)
+    run_bot()
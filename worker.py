@@ -0,0 +1,10 @@
+from dotenv import load_dotenv
+
+# Load environment variables, overriding existing ones
+load_dotenv(override=True)
+
+# Now import the worker after environment variables are loaded
+from bot.worker import run_worker
+
+if __name__ == "__main__":
+    run_worker()